@@ -0,0 +1,304 @@
+import argparse
+import math
+import time
+
+import numpy as np
+
+import compact
+from cabling_plan import build_cabling_plan
+from compact import DEVICE_PREFIXES
+from create_topology import load_config
+from fat_tree import level_name
+
+# capacity of every link, cat 7 cables carry 10 Gbit/s
+LINK_SPEED_GBPS = 10
+
+
+class NetworkGraph:
+    # The links of a wired tree as a compressed sparse row adjacency. Devices are numbered in creation order
+    # (core, aggregation top level first, edge, hosts) like in compact.CompactTopology and
+    # cabling_plan.CablingPlan, the neighbours of device d are neighbors[indptr[d]:indptr[d + 1]] and
+    # neighbor_links holds the number of the link every neighbour is reached through. device_rack is the rack
+    # number of every device when it is known.
+    def __init__(self, size, a_device, b_device, device_rack=None):
+        self.size = size
+        self.device_rack = None if device_rack is None else np.asarray(device_rack, dtype=np.int64)
+        self.a_device = np.asarray(a_device, dtype=np.int64)
+        self.b_device = np.asarray(b_device, dtype=np.int64)
+        self.device_level, self.level_index = device_levels(size)
+
+        ends = np.r_[self.a_device, self.b_device]
+        order = np.argsort(ends, kind="stable")
+        self.neighbors = np.r_[self.b_device, self.a_device][order]
+        self.neighbor_links = np.r_[np.arange(self.link_count), np.arange(self.link_count)][order]
+        self.indptr = np.r_[0, np.cumsum(np.bincount(ends, minlength=self.device_count))]
+
+    @property
+    def device_count(self):
+        return len(self.device_level)
+
+    @property
+    def link_count(self):
+        return len(self.a_device)
+
+    @property
+    def tree_level(self):
+        return self.size["tree_level"]
+
+    def level_devices(self, level):
+        return np.flatnonzero(self.device_level == level)
+
+    def degrees(self):
+        return np.diff(self.indptr)
+
+
+def device_levels(size):
+    # tree level of every device and its number within the level, in creation order
+    tree_level = size["tree_level"]
+    counts = size["level_counts"]
+    creation_order = list(range(tree_level, -1, -1))
+
+    device_level = np.repeat(creation_order, [counts[level] for level in creation_order])
+    level_index = np.concatenate([np.arange(counts[level]) for level in creation_order])
+    return device_level, level_index
+
+
+def layer_starts(size):
+    # first device number of the core, aggregation, edge and host layers
+    counts = [size["core_number"], size["aggregation_number"], size["edge_number"], size["host_number"]]
+    return np.cumsum([0] + counts)[:-1]
+
+
+def device_name(graph, device):
+    # the name create_topology gives the device
+    level = graph.device_level[device]
+    layer = 3 if level == 0 else 2 if level == 1 else 0 if level == graph.tree_level else 1
+    return DEVICE_PREFIXES[layer] + str(device - layer_starts(graph.size)[layer] + 1)
+
+
+def link_ends(graph):
+    # level of the lower end of every link and the numbers of both ends within their levels
+    a_level, b_level = graph.device_level[graph.a_device], graph.device_level[graph.b_device]
+    lower = np.where(a_level < b_level, graph.a_device, graph.b_device)
+    upper = np.where(a_level < b_level, graph.b_device, graph.a_device)
+    return graph.device_level[lower], graph.level_index[lower], graph.level_index[upper]
+
+
+def from_cabling_plan(plan):
+    return NetworkGraph(plan.size, plan.a_device, plan.b_device, plan.device_rack)
+
+
+def from_compact(topology):
+    return NetworkGraph(topology.size, topology.cable_a_device, topology.cable_b_device, topology.device_rack)
+
+
+def from_topology(topology):
+    # the object model of create_topology, e.g. the result of build_topology
+    return from_compact(compact.from_topology(topology))
+
+
+def expand(graph, devices):
+    # every (device, neighbour, link) of the given devices as three flat arrays
+    starts = graph.indptr[devices]
+    degrees = graph.indptr[devices + 1] - starts
+    offsets = np.repeat(starts - np.cumsum(np.r_[0, degrees[:-1]]), degrees) + np.arange(degrees.sum())
+    return np.repeat(devices, degrees), graph.neighbors[offsets], graph.neighbor_links[offsets]
+
+
+def shortest_paths(graph, sources):
+    # breadth-first search from a set of devices, one NumPy pass per hop: hop count (-1 when unreachable)
+    # and number of equal-cost shortest paths to every device
+    distance = np.full(graph.device_count, -1, dtype=np.int64)
+    paths = np.zeros(graph.device_count, dtype=np.float64)
+    frontier = np.unique(np.atleast_1d(sources))
+    distance[frontier] = 0
+    paths[frontier] = 1
+
+    hops = 0
+    while len(frontier):
+        hops += 1
+        device, neighbor, _ = expand(graph, frontier)
+        fresh = distance[neighbor] == -1
+        # a bincount over all devices is cheaper than sorting the reached ones
+        reached = np.bincount(neighbor[fresh], weights=paths[device[fresh]], minlength=graph.device_count)
+        frontier = np.flatnonzero(reached)
+        distance[frontier] = hops
+        paths[frontier] = reached[frontier]
+
+    return distance, paths
+
+
+def pod_of(graph, devices):
+    # the subtree below the core every device of a lower level belongs to, numbered like the core ports
+    size = graph.size
+    pods = size["down_links"][graph.tree_level]
+    levels = graph.device_level[devices]
+    per_pod = np.asarray(size["level_counts"])[levels] // pods
+    return graph.level_index[devices] // per_pod
+
+
+def level_oversubscription(graph):
+    # links of every switch level towards the level below and the level above and their ratio
+    lower = np.minimum(graph.device_level[graph.a_device], graph.device_level[graph.b_device])
+    links_above = np.bincount(lower, minlength=graph.tree_level + 1)
+
+    levels = []
+    for level in range(1, graph.tree_level + 1):
+        downlinks = int(links_above[level - 1])
+        uplinks = int(links_above[level]) if level < graph.tree_level else 0
+        levels.append({
+            "level": level_name(graph.tree_level, level),
+            "switches": int(graph.size["level_counts"][level]),
+            "downlinks": downlinks,
+            "uplinks": uplinks,
+            "oversubscription": downlinks / uplinks if uplinks else None,
+        })
+    return levels
+
+
+def bisection(graph, link_speed=LINK_SPEED_GBPS):
+    # the hosts of the first half of the pods against the rest; every level below the core is a cut through
+    # the uplinks of that half and the bisection is the smallest of them
+    pods = graph.size["down_links"][graph.tree_level]
+    lower = np.where(graph.device_level[graph.a_device] < graph.device_level[graph.b_device],
+                     graph.a_device, graph.b_device)
+    in_half = pod_of(graph, lower) < pods // 2
+
+    cuts = np.bincount(graph.device_level[lower][in_half], minlength=graph.tree_level)
+    hosts = graph.level_devices(0)
+    half_hosts = int(np.count_nonzero(pod_of(graph, hosts) < pods // 2))
+    links = int(cuts.min()) if half_hosts else 0
+
+    return {
+        "hosts_per_half": half_hosts,
+        "level_cuts": {level_name(graph.tree_level, level): int(cut) for level, cut in enumerate(cuts)},
+        "links": links,
+        "bandwidth_gbps": links * link_speed,
+        # 1 is full bisection bandwidth, every host of one half can send to the other half at line rate
+        "ratio": links / half_hosts if half_hosts else 0,
+    }
+
+
+def host_paths(graph, sources=None):
+    # hop count and number of equal-cost paths of every host pair, grouped by hop count. Hosts only hang off
+    # their edge switch, so the breadth-first searches run over the switch links from every edge switch (or
+    # the given ones) and every switch counts as often as it has hosts attached
+    is_host = graph.device_level == 0
+    host_link = is_host[graph.a_device] | is_host[graph.b_device]
+    switches = NetworkGraph(graph.size, graph.a_device[~host_link], graph.b_device[~host_link])
+    switch_end = np.where(is_host[graph.a_device[host_link]], graph.b_device[host_link], graph.a_device[host_link])
+    attached = np.bincount(switch_end, minlength=graph.device_count)
+
+    edges = graph.level_devices(1) if sources is None else np.asarray(sources)
+    targets = np.flatnonzero(attached)
+    groups = {}
+    unreachable = 0
+
+    for edge in edges[attached[edges] > 0]:
+        distance, paths = shortest_paths(switches, edge)
+        distance, paths, hosts = distance[targets], paths[targets], attached[targets]
+        unreachable += int(attached[edge] * hosts[distance < 0].sum())
+
+        # pairs of hosts on the same edge switch are 2 hops apart, all others 2 hops more than their switches
+        hosts = np.where(distance == 0, hosts - 1, hosts)
+        for hops in np.unique(distance[distance >= 0]):
+            at_hops = (distance == hops) & (hosts > 0)
+            if not at_hops.any():
+                continue
+            group = groups.setdefault(int(hops) + 2, {"pairs": 0, "min_paths": math.inf, "max_paths": 0,
+                                                      "paths": 0})
+            group["pairs"] += int(attached[edge] * hosts[at_hops].sum())
+            group["min_paths"] = min(group["min_paths"], int(paths[at_hops].min()))
+            group["max_paths"] = max(group["max_paths"], int(paths[at_hops].max()))
+            group["paths"] += float(attached[edge] * (hosts[at_hops] * paths[at_hops]).sum())
+
+    return summarize_paths(groups, unreachable)
+
+
+def tree_paths(size):
+    # closed form of host_paths for an intact tree: two hosts whose lowest common ancestors are at level l
+    # are 2 * l hops apart and have one path through every such ancestor
+    down, up = size["down_links"], size["up_links"]
+    hosts = size["host_number"]
+    groups = {}
+
+    for level in range(1, size["tree_level"] + 1):
+        partners = math.prod(down[1:level + 1]) - math.prod(down[1:level])
+        paths = math.prod(up[1:level])
+        if partners:
+            groups[2 * level] = {"pairs": hosts * partners, "min_paths": paths, "max_paths": paths,
+                                 "paths": hosts * partners * paths}
+
+    return summarize_paths(groups, 0)
+
+
+def summarize_paths(groups, unreachable):
+    pairs = sum([group["pairs"] for group in groups.values()])
+    return {
+        "pairs": pairs,
+        "unreachable_pairs": unreachable,
+        "max_hops": max(groups) if groups else 0,
+        "mean_hops": sum([hops * group["pairs"] for hops, group in groups.items()]) / pairs if pairs else 0,
+        "min_paths": min([group["min_paths"] for group in groups.values()], default=0),
+        "mean_paths": sum([group["paths"] for group in groups.values()]) / pairs if pairs else 0,
+        "by_hops": {hops: {"pairs": group["pairs"], "min_paths": group["min_paths"],
+                           "max_paths": group["max_paths"], "mean_paths": group["paths"] / group["pairs"]}
+                    for hops, group in sorted(groups.items())},
+    }
+
+
+def analyze(graph, link_speed=LINK_SPEED_GBPS, sources=None):
+    return {
+        "hosts": int(graph.size["host_number"]),
+        "switches": int(sum(graph.size["level_counts"][1:])),
+        "links": graph.link_count,
+        "levels": level_oversubscription(graph),
+        "bisection": bisection(graph, link_speed),
+        "paths": host_paths(graph, sources),
+    }
+
+
+def print_analysis(analysis):
+    print(f"{analysis['hosts']} hosts, {analysis['switches']} switches, {analysis['links']} links")
+    print("=" * 20)
+    for level in analysis["levels"]:
+        ratio = "-" if level["oversubscription"] is None else f"{level['oversubscription']:g}:1"
+        print(f"{level['level']}: {level['switches']} switches, {level['downlinks']} downlinks, "
+              f"{level['uplinks']} uplinks, oversubscription {ratio}")
+
+    bisection_result = analysis["bisection"]
+    print("=" * 20)
+    print(f"Bisection: {bisection_result['links']} links, {bisection_result['bandwidth_gbps']} Gbit/s for "
+          f"{bisection_result['hosts_per_half']} hosts per half ({bisection_result['ratio']:.3g} of full)")
+
+    paths = analysis["paths"]
+    print("=" * 20)
+    print(f"Host pairs: {paths['pairs']}, unreachable: {paths['unreachable_pairs']}, "
+          f"max hops: {paths['max_hops']}, mean hops: {paths['mean_hops']:.3f}")
+    for hops, group in paths["by_hops"].items():
+        print(f"{hops} hops: {group['pairs']} pairs, {group['min_paths']}-{group['max_paths']} "
+              f"equal-cost paths (mean {group['mean_paths']:g})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Analyse paths and bisection bandwidth of a fat tree")
+    parser.add_argument("--config", default="L2_config.json")
+    parser.add_argument("--link-speed", type=float, default=LINK_SPEED_GBPS, help="Gbit/s of every link")
+    parser.add_argument("--sample", type=int, default=None,
+                        help="count paths from this many random edge switches instead of all of them")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    graph = from_cabling_plan(build_cabling_plan(load_config(args.config)))
+    sources = None
+    if args.sample is not None:
+        sources = np.random.default_rng(0).permutation(graph.level_devices(1))[:args.sample]
+    analysis = analyze(graph, args.link_speed, sources)
+    duration = time.perf_counter() - start
+
+    print_analysis(analysis)
+    print(f"analysed in {duration:.3f} s")
+
+
+if __name__ == "__main__":
+    main()
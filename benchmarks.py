@@ -0,0 +1,309 @@
+import argparse
+import contextlib
+import gc
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import time
+import tracemalloc
+
+from compact import build_compact_topology
+from cost_calculator import calculate_cost
+from create_topology import (
+    PROVISIONING_WORKERS, build_topology, create_devices, load_config, print_cost_table, provision_topology,
+    setup_reference_data, size_topology, wire_topology,
+)
+from distances import loadDistances
+from fake_netbox import FakeNetbox
+from netbox_client import NetboxClient
+from prices import loadPrices
+from sweep import parse_values
+
+PROVISIONING_MODES = ["serial", "bulk", "concurrent"]
+HISTORY_PATH = "benchmark_history.json"
+# designs with more devices are built and costed but not provisioned into the fake NetBox
+MAX_PROVISIONED_DEVICES = 5000
+# a stage that got this much slower than the median of the last HISTORY_WINDOW runs is reported as a regression
+REGRESSION_THRESHOLD = 0.3
+HISTORY_WINDOW = 5
+# stages faster than this are dominated by timer noise and never reported
+MIN_COMPARED_TIME = 0.005
+
+
+def measure(function, *args):
+    # wall time and peak traced memory of a single call; garbage left by earlier calls is collected first
+    # and the collector is paused, so collections of unrelated objects do not end up in the timing
+    gc.collect()
+    gc.disable()
+    tracemalloc.start()
+    try:
+        start = time.perf_counter()
+        result = function(*args)
+        duration = time.perf_counter() - start
+        peak_memory = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+        gc.enable()
+    return result, duration, peak_memory
+
+
+def measured(function, *args):
+    result, duration, peak_memory = measure(function, *args)
+    return result, {"time": duration, "memory": peak_memory}
+
+
+def compare_representations(config):
+    topology, object_time, object_memory = measure(build_topology, config)
+    compact, compact_time, compact_memory = measure(build_compact_topology, config)
+
+    return {
+        "devices": compact.device_count,
+        "cables": compact.cable_count,
+        "object_time": object_time,
+        "object_memory": object_memory,
+        "compact_time": compact_time,
+        "compact_memory": compact_memory,
+    }
+
+
+def provision_serially(client, topology):
+    # one request per object, how topologies were provisioned before the bulk endpoints were used
+    references = setup_reference_data(client)
+    for rack in topology.racks:
+        rack.id = client.create_rack(rack.name, rack.height, references["site_id"])
+    for device in topology.devices():
+        device.id = client.create_device(device.name, references["device_types"][device.role],
+                                         references["device_roles"][device.role], references["site_id"],
+                                         device.get_rack_id(), device.position)
+        for interface in device.interfaces:
+            interface.id = client.create_interface(interface.name, device.id)
+    for cable in topology.cables:
+        cable.id = client.create_cable(cable.a_interface.id, cable.b_interface.id, cable.length, cable.price)
+
+
+def benchmark_provisioning(config, mode, latency=0.0, error_rate=0.0, workers=PROVISIONING_WORKERS):
+    # provisions a fresh fake NetBox: serial sends every object on its own, bulk sends list requests
+    # one after another and concurrent sends the list requests of a phase from several threads
+    topology = build_topology(config)
+    objects = len(topology.racks) + len(topology.devices()) + len(topology.cables) + \
+        sum([len(device.interfaces) for device in topology.devices()])
+
+    with FakeNetbox(latency=latency, error_rate=error_rate) as fake:
+        client = NetboxClient(workers=workers if mode == "concurrent" else 1, host=fake.url)
+        start = time.perf_counter()
+        # the per-object messages would dominate the serial timings
+        with contextlib.redirect_stdout(io.StringIO()):
+            client.auth()
+            if mode == "serial":
+                provision_serially(client, topology)
+            else:
+                provision_topology(client, topology)
+        duration = time.perf_counter() - start
+        client.close()
+
+        return {
+            "mode": mode,
+            "objects": objects,
+            "requests": fake.request_count,
+            "failed_requests": fake.failed_requests,
+            "time": duration,
+            "requests_per_second": fake.request_count / duration,
+            "objects_per_second": objects / duration,
+        }
+
+
+def print_cost_table_quietly(entries):
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        print_cost_table(entries)
+
+
+def benchmark_design(config, provision=True, repeat=1):
+    # every stage of sizing, building, costing and provisioning one design, measured on its own; the design
+    # is built repeat times from scratch and the fastest time and the highest peak memory are kept
+    runs = []
+    for _ in range(repeat):
+        stages = {}
+        size, stages["sizing"] = measured(size_topology, config)
+        topology, stages["devices"] = measured(create_devices, size)
+        topology.cables, stages["wiring"] = measured(wire_topology, topology)
+        _, stages["cost_table"] = measured(print_cost_table_quietly, topology.cost_table_entities())
+
+        if provision:
+            result, stages["provisioning"] = measured(benchmark_provisioning, config, "concurrent")
+            # starting and stopping the fake server is not part of provisioning
+            stages["provisioning"]["time"] = result["time"]
+            stages["provisioning"]["requests"] = result["requests"]
+        runs.append(stages)
+
+    return {
+        stage: dict(runs[0][stage], time=min([run[stage]["time"] for run in runs]),
+                    memory=max([run[stage]["memory"] for run in runs]))
+        for stage in runs[0]
+    }
+
+
+def design_config(tree_level, ports, pod_size, rack_height):
+    # pod_size only applies to 2-level trees
+    config = {"tree_level": tree_level, "ports_per_switch": ports, "rack_height": rack_height}
+    if tree_level == 2:
+        config["pod_size"] = pod_size
+    return config
+
+
+def design_name(config):
+    pod = f" pod={config['pod_size']}" if "pod_size" in config else ""
+    return f"L{config['tree_level']} k={config['ports_per_switch']}{pod} rack={config['rack_height']}"
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_history(path):
+    if not os.path.exists(path):
+        return []
+    with open(path) as history_file:
+        return json.load(history_file)
+
+
+def baseline_time(history, design, stage):
+    # median time of the same stage of the same design in the latest runs, a single run is too noisy
+    times = [run["designs"][design][stage]["time"] for run in history if stage in run["designs"].get(design, {})]
+    if not times:
+        return None
+    return statistics.median(times[-HISTORY_WINDOW:])
+
+
+def compare_with_history(history, designs, threshold=REGRESSION_THRESHOLD):
+    regressions = []
+    for design, stages in designs.items():
+        for stage, result in stages.items():
+            baseline = baseline_time(history, design, stage)
+            result["change"] = None
+            if baseline is None or baseline < MIN_COMPARED_TIME:
+                continue
+            result["change"] = result["time"] / baseline - 1
+            if result["change"] > threshold and result["time"] >= MIN_COMPARED_TIME:
+                regressions.append((design, stage, result["change"]))
+    return regressions
+
+
+def run_suite(args):
+    history = load_history(args.history)
+    designs = {}
+
+    print(f"{'design':>26} {'stage':>13} {'time s':>9} {'peak MiB':>9} {'requests':>9} {'change':>8}")
+    for tree_level in parse_values(args.tree_levels):
+        for ports in parse_values(args.ports):
+            config = design_config(tree_level, ports, args.pod_size, args.rack_height)
+            try:
+                # the closed-form check rejects designs that cannot be wired before anything is built
+                bom = calculate_cost(tree_level, ports, config.get("pod_size"), args.rack_height)
+            except (ValueError, ZeroDivisionError) as error:
+                print(f"{design_name(config):>26} skipped: {error}")
+                continue
+
+            size = bom["size"]
+            devices = size["core_number"] + size["aggregation_number"] + size["edge_number"] + size["host_number"]
+            designs[design_name(config)] = benchmark_design(config, devices <= args.max_provisioned_devices,
+                                                            args.repeat)
+
+    regressions = compare_with_history(history, designs, args.threshold)
+    for design, stages in designs.items():
+        for stage, result in stages.items():
+            change = f"{result['change']:+.0%}" if result["change"] is not None else "-"
+            print(f"{design:>26} {stage:>13} {result['time']:>9.4f} {result['memory'] / 2 ** 20:>9.2f} "
+                  f"{result.get('requests', '-'):>9} {change:>8}")
+
+    history.append({
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "designs": designs,
+    })
+    with open(args.history, "w") as history_file:
+        json.dump(history, history_file, indent=1)
+
+    for design, stage, change in regressions:
+        print(f"Regression: {stage} of {design} is {change:.0%} slower than in the previous runs")
+    print(f"Run {len(history)} recorded in {args.history}")
+
+
+def run_representations(args):
+    print(f"{'level':>5} {'ports':>5} {'devices':>9} {'cables':>9} {'objects s':>10} {'objects MiB':>12} "
+          f"{'compact s':>10} {'compact MiB':>12}")
+    for tree_level in parse_values(args.tree_levels):
+        for ports in parse_values(args.ports):
+            config = design_config(tree_level, ports, args.pod_size, args.rack_height)
+            try:
+                # the closed-form check rejects designs that cannot be wired before anything is built
+                calculate_cost(tree_level, ports, config.get("pod_size"), args.rack_height)
+                result = compare_representations(config)
+            except (ValueError, ZeroDivisionError) as error:
+                print(f"{tree_level:>5} {ports:>5} skipped: {error}")
+                continue
+
+            print(f"{tree_level:>5} {ports:>5} {result['devices']:>9} {result['cables']:>9} "
+                  f"{result['object_time']:>10.3f} {result['object_memory'] / 2 ** 20:>12.2f} "
+                  f"{result['compact_time']:>10.3f} {result['compact_memory'] / 2 ** 20:>12.2f}")
+
+
+def run_provisioning(args):
+    config = load_config(args.config)
+
+    print(f"{'mode':>10} {'objects':>8} {'requests':>9} {'failed':>7} {'time s':>8} {'requests/s':>11} "
+          f"{'objects/s':>10}")
+    for mode in args.modes.split(","):
+        result = benchmark_provisioning(config, mode, args.latency, args.error_rate, args.workers)
+        print(f"{mode:>10} {result['objects']:>8} {result['requests']:>9} {result['failed_requests']:>7} "
+              f"{result['time']:>8.3f} {result['requests_per_second']:>11.1f} {result['objects_per_second']:>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks of the topology builders and of NetBox provisioning")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    representations = commands.add_parser("representations",
+                                          help="compare the object and the compact topology representation")
+    representations.add_argument("--tree-levels", default="2,3")
+    representations.add_argument("--ports", default="4,8,16,32,64")
+    representations.add_argument("--pod-size", type=int, default=4, help="edge switches per pod of 2-level trees")
+    representations.add_argument("--rack-height", type=int, default=42)
+    representations.set_defaults(run=run_representations)
+
+    provisioning = commands.add_parser("provisioning",
+                                       help="provision a topology into a local fake NetBox in every mode")
+    provisioning.add_argument("--config", default="L2_config.json")
+    provisioning.add_argument("--modes", default=",".join(PROVISIONING_MODES))
+    provisioning.add_argument("--latency", type=float, default=0.0, help="seconds the fake adds to every request")
+    provisioning.add_argument("--error-rate", type=float, default=0.0, help="share of requests failing with 503")
+    provisioning.add_argument("--workers", type=int, default=PROVISIONING_WORKERS)
+    provisioning.set_defaults(run=run_provisioning)
+
+    suite = commands.add_parser("suite", help="time every stage across tree sizes and keep a JSON history")
+    suite.add_argument("--tree-levels", default="2,3")
+    suite.add_argument("--ports", default="4,8,16,32,64")
+    suite.add_argument("--pod-size", type=int, default=4, help="edge switches per pod of 2-level trees")
+    suite.add_argument("--rack-height", type=int, default=42)
+    suite.add_argument("--history", default=HISTORY_PATH)
+    suite.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD,
+                       help="relative slowdown reported as a regression")
+    suite.add_argument("--max-provisioned-devices", type=int, default=MAX_PROVISIONED_DEVICES)
+    suite.add_argument("--repeat", type=int, default=3, help="builds per design, the fastest one counts")
+    suite.set_defaults(run=run_suite)
+
+    args = parser.parse_args()
+    loadPrices()
+    loadDistances()
+    args.run(args)
+
+
+if __name__ == "__main__":
+    main()
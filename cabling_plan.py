@@ -0,0 +1,254 @@
+import argparse
+import time
+
+import numpy as np
+
+from create_topology import (
+    build_topology, cable_body, load_config, level_distance, print_cost_summary, provision_objects, size_topology,
+)
+from cost_report import summarize, unit_group
+from fat_tree import child_index, link_layer_name, split_levels
+from prices import Prices, loadPrices
+from distances import Distances, loadDistances
+from rack_allocator import RackAllocator
+
+CABLE_TYPE = "rj45_cat_7"
+
+
+class CablingPlan:
+    # Every link of the tree as parallel NumPy columns. Devices are numbered in creation order
+    # (core, aggregation, edge, hosts) like in compact.CompactTopology, ports are local to their device.
+    def __init__(self, size, rack_count, layer_ranges, port_count, a_device, a_port, b_device, b_port, length, price,
+                 layer_slices, device_rack=None, device_position=None):
+        self.size = size
+        self.rack_count = rack_count
+        self.device_rack = device_rack
+        self.device_position = device_position
+        self.layer_ranges = layer_ranges
+        self.port_count = port_count
+        self.a_device = a_device
+        self.a_port = a_port
+        self.b_device = b_device
+        self.b_port = b_port
+        self.length = length
+        self.price = price
+        self.layer_slices = layer_slices
+
+    @property
+    def cable_count(self):
+        return len(self.length)
+
+    def layer(self, name):
+        cables = self.layer_slices[name]
+        return (self.a_device[cables], self.a_port[cables], self.b_device[cables], self.b_port[cables],
+                self.length[cables], self.price[cables])
+
+
+def link_ranks(devices):
+    # position of every link among the earlier links of the same device, in link order
+    order = np.argsort(devices, kind="stable")
+    sorted_devices = devices[order]
+    group_starts = np.flatnonzero(np.r_[True, sorted_devices[1:] != sorted_devices[:-1]])
+    group_sizes = np.diff(np.r_[group_starts, len(devices)])
+
+    ranks = np.empty(len(devices), dtype=np.int64)
+    ranks[order] = np.arange(len(devices)) - np.repeat(group_starts, group_sizes)
+    return ranks
+
+
+def level_links(down, up, level, parents, lower):
+    # every link between the devices of a level and the level below in create_topology.join_levels order,
+    # parents and lower are the device numbers of both levels
+    links_per_parent = down[level]
+    parent = np.repeat(np.arange(len(parents)), links_per_parent)
+    child = np.tile(np.arange(links_per_parent), len(parents))
+    return parents[parent], lower[child_index(down, up, level, parent, child)]
+
+
+def build_cabling_plan(config, prices=Prices, distances=Distances, placement=None):
+    # without a placement devices are placed first-fit, a placement.Placement chooses the racks instead;
+    # inter-rack cables get the fixed per-layer distances unless the placement is measured on a rack layout,
+    # then their lengths come from the positions of the racks
+    size = size_topology(config)
+    ports_per_switch = size["ports_per_switch"]
+
+    counts = [size["core_number"], size["aggregation_number"], size["edge_number"], size["host_number"]]
+    starts = np.cumsum([0] + counts)
+    core, aggregation, edge, hosts = [np.arange(starts[i], starts[i + 1]) for i in range(4)]
+    layer_ranges = {"core": core, "aggregation": aggregation, "edge": edge, "hosts": hosts}
+
+    port_count = np.full(starts[-1], ports_per_switch, dtype=np.int64)
+    port_count[hosts] = 1
+    if placement is None and size["switch_height"] == size["host_height"] == 1:
+        # first-fit placement: the device with index i sits in rack i // rack_height
+        device_rack, device_position = np.divmod(np.arange(starts[-1]), size["rack_height"])
+        device_position += 1
+        rack_count = size["rack_number"]
+    elif placement is None:
+        # multi-U devices can leave gaps, so they are racked one by one like in create_topology
+        allocator = RackAllocator(size["rack_height"])
+        heights = np.full(starts[-1], size["switch_height"])
+        heights[hosts] = size["host_height"]
+        locations = np.array([allocator.allocate(height) for height in heights.tolist()], dtype=np.int64)
+        device_rack, device_position = locations[:, 0], locations[:, 1]
+        rack_count = allocator.rack_count
+    else:
+        device_rack = placement.device_rack
+        device_position = placement.device_position
+        rack_count = placement.rack_count
+
+    tree_level = size["tree_level"]
+    levels = split_levels(hosts, edge, aggregation, core, size["level_counts"])
+    layers = {
+        link_layer_name(tree_level, level): (
+            level_links(size["down_links"], size["up_links"], level, levels[level], levels[level - 1]),
+            level_distance(tree_level, level, distances),
+        )
+        for level in range(tree_level, 0, -1)
+    }
+
+    used_ports = np.zeros(starts[-1], dtype=np.int64)
+    columns = {"a_device": [], "a_port": [], "b_device": [], "b_port": [], "length": []}
+    layer_slices = {}
+    cable_start = 0
+    for name, ((a_device, b_device), distance) in layers.items():
+        # ports are taken in link order, after the ports used by the previous layers
+        a_port = used_ports[a_device] + link_ranks(a_device)
+        b_port = used_ports[b_device] + link_ranks(b_device)
+        used_ports += np.bincount(a_device, minlength=len(used_ports))
+        used_ports += np.bincount(b_device, minlength=len(used_ports))
+
+        columns["a_device"].append(a_device)
+        columns["a_port"].append(a_port)
+        columns["b_device"].append(b_device)
+        columns["b_port"].append(b_port)
+        if placement is None or not placement.measured:
+            columns["length"].append(np.where(device_rack[a_device] == device_rack[b_device], 1, distance))
+        else:
+            columns["length"].append(placement.rack_distance(device_rack[a_device], device_rack[b_device]))
+
+        layer_slices[name] = slice(cable_start, cable_start + len(a_device))
+        cable_start += len(a_device)
+
+    overloaded = np.flatnonzero(used_ports > port_count)
+    if len(overloaded):
+        device = overloaded[0]
+        raise ValueError(f"Device {device} needs {used_ports[device]} ports but only has {port_count[device]}")
+
+    columns = {key: np.concatenate(value) for key, value in columns.items()}
+    length = columns.pop("length").astype(np.float64)
+
+    return CablingPlan(size, rack_count, layer_ranges, port_count, length=length, price=length * prices.rj45_cat_7,
+                       layer_slices=layer_slices, device_rack=device_rack, device_position=device_position, **columns)
+
+
+def bill_of_materials(plan, prices=Prices):
+    # same structure as create_topology.bill_of_materials
+    size = plan.size
+
+    groups = {
+        "racks": unit_group(plan.rack_count, prices.getRackPriceBasedOnHeight(size["rack_height"])),
+        "core_switches": unit_group(size["core_number"], prices.switch_price),
+        "aggregation_switches": unit_group(size["aggregation_number"], prices.switch_price),
+        "edge_switches": unit_group(size["edge_number"], prices.switch_price),
+        "hosts": unit_group(size["host_number"], prices.dell_poweredge_r450_xs),
+        "cables": {"count": plan.cable_count, "price": float(plan.price.sum())},
+    }
+
+    if size["tree_level"] == 2:
+        groups.pop("aggregation_switches")
+
+    return summarize(groups, {CABLE_TYPE: {"length": float(plan.length.sum()), "pricePerMeter": prices.rj45_cat_7}})
+
+
+def cable_bodies(plan, interface_ids):
+    # interface_ids lists the NetBox interface ids device by device and port by port,
+    # which is the order create_topology.provision_interfaces creates them in
+    interface_ids = np.asarray(interface_ids)
+    port_offset = np.r_[0, np.cumsum(plan.port_count)[:-1]]
+
+    a_interfaces = interface_ids[port_offset[plan.a_device] + plan.a_port]
+    b_interfaces = interface_ids[port_offset[plan.b_device] + plan.b_port]
+
+    return [
+        {"int1_id": int(a), "int2_id": int(b), "length": float(length), "price": float(price)}
+        for a, b, length, price in zip(a_interfaces, b_interfaces, plan.length, plan.price)
+    ]
+
+
+def provision_cabling_plan(client, topology, plan, journal=None):
+    # the cabling phase of create_topology.provision_topology once the interfaces have their ids; the plan lists
+    # the cables of topology in the same order, which keep their names for the journal and get their ids
+    interface_ids = [interface.id for device in topology.devices() for interface in device.interfaces]
+    if plan.cable_count != len(topology.cables) or len(interface_ids) != int(plan.port_count.sum()):
+        raise ValueError("The cabling plan was built for another topology")
+
+    bodies = dict(zip(topology.cables, cable_bodies(plan, interface_ids)))
+    provision_objects("cable", topology.cables, client.create_cables, bodies.get, journal, client.find_cables)
+
+
+def plan_from_columns(columns):
+    # the cabling plan of topology_files columns of a plan, e.g. from the plan cache
+    size = columns["size"]
+    layer_ranges = {name: np.flatnonzero(columns["device_layer"] == layer)
+                    for layer, name in enumerate(["core", "aggregation", "edge", "hosts"])}
+
+    # cables are ordered by layer, top layer first, with down_links links below every device of a level
+    layer_slices = {}
+    cable_start = 0
+    for level in range(size["tree_level"], 0, -1):
+        links = size["level_counts"][level] * size["down_links"][level]
+        layer_slices[link_layer_name(size["tree_level"], level)] = slice(cable_start, cable_start + links)
+        cable_start += links
+
+    return CablingPlan(size, len(columns["rack_name"]), layer_ranges, columns["port_count"],
+                       columns["cable_a_device"], columns["cable_a_port"], columns["cable_b_device"],
+                       columns["cable_b_port"], columns["cable_length"], columns["cable_price"], layer_slices,
+                       device_rack=columns["device_rack"], device_position=columns["device_position"])
+
+
+def compare_with_object_model(config, placement=None):
+    # cable requests of the plan and of create_topology.provision_cables for the same interface ids, only meant
+    # for small configs
+    topology = build_topology(config, placement)
+    interfaces = [interface for device in topology.devices() for interface in device.interfaces]
+    for number, interface in enumerate(interfaces):
+        interface.id = number + 1
+
+    expected = [cable_body(cable) for cable in topology.cables]
+    plan = build_cabling_plan(config, placement=placement)
+    calculated = cable_bodies(plan, [interface.id for interface in interfaces])
+
+    differences = [f"cable {index}: {expected_body} != {calculated_body}"
+                   for index, (expected_body, calculated_body) in enumerate(zip(expected, calculated))
+                   if expected_body != calculated_body]
+    if len(expected) != len(calculated):
+        differences.append(f"cable count: {len(expected)} != {len(calculated)}")
+    return differences
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate the cabling plan of a fat tree and print its cost")
+    parser.add_argument("--config", default="L2_config.json")
+    parser.add_argument("--verify", action="store_true",
+                        help="also build the topology from objects and compare the cable requests of both")
+    args = parser.parse_args()
+    loadPrices()
+    loadDistances()
+
+    start = time.perf_counter()
+    plan = build_cabling_plan(load_config(args.config))
+    duration = time.perf_counter() - start
+
+    print_cost_summary(bill_of_materials(plan))
+    print(f"{plan.cable_count} cables planned in {duration:.3f} s")
+
+    if args.verify:
+        differences = compare_with_object_model(load_config(args.config))
+        for difference in differences[:20]:
+            print(difference)
+        print("Object model check:", "failed" if differences else "passed")
+
+
+if __name__ == "__main__":
+    main()
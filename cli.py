@@ -0,0 +1,247 @@
+import argparse
+import sys
+import time
+
+from cabling_plan import build_cabling_plan, plan_from_columns
+from compact import cost_table_entries, from_columns
+from cost_report import REPORT_FORMATS, write_cost_report
+from create_topology import (
+    JOURNAL_PATH, PROVISIONING_WORKERS, cleanup, load_config, print_cost_summary, provision_journaled, size_topology,
+)
+from distances import DISTANCES_PATH, loadDistancesFile
+from metrics import Metrics
+from netbox_client import NETBOX_HOST, NetboxClient, NetboxError
+from plan_cache import PLAN_CACHE_DIRECTORY, PLAN_CACHE_SIZE, PlanCache, input_hash, numeric_attributes
+from prices import PRICES_PATH, loadPricesFile
+from rack_allocator import FIRST_FIT, POLICIES
+from reference_cache import REFERENCE_CACHE_PATH
+from sweep import add_sweep_arguments, run_sweep
+from topology_files import FORMATS, bill_of_materials, columns_from_plan, export_topology, topology_from_columns
+
+
+def compute_plan(config, prices, distances, rack_policy=FIRST_FIT, optimize_placement=False):
+    # the columns of a topology (see topology_files.py), built from the NumPy cabling plan
+    placement = None
+    if optimize_placement:
+        # imported here because the placement module is only needed for placed plans
+        from placement import optimize_placement as find_placement
+
+        placement, _ = find_placement(config, prices=prices)
+    elif rack_policy != FIRST_FIT:
+        from placement import policy_placement
+
+        placement = policy_placement(size_topology(config), rack_policy)
+    return columns_from_plan(build_cabling_plan(config, prices, distances, placement), prices)
+
+
+def plan_key(config, prices, distances, rack_policy, optimize_placement):
+    # the plan only depends on the config, the price and distance values and the placement, not on file names
+    return input_hash(config=config, prices=numeric_attributes(prices), distances=numeric_attributes(distances),
+                      rack_policy=rack_policy, optimize_placement=optimize_placement)
+
+
+def cached_plan(args):
+    # the plan of the inputs given on the command line, from the cache when it was computed before;
+    # returns the columns, the config and whether they came from the cache
+    config = load_config(args.config)
+    prices = loadPricesFile(args.prices)
+    distances = loadDistancesFile(args.distances)
+    cache = PlanCache(None if args.no_cache else args.cache_dir, args.cache_size)
+
+    key = plan_key(config, prices, distances, args.rack_policy, args.optimize_placement)
+    columns = cache.get(key)
+    if columns is not None:
+        return columns, config, True
+
+    columns = compute_plan(config, prices, distances, args.rack_policy, args.optimize_placement)
+    cache.store(key, columns)
+    return columns, config, False
+
+
+def print_plan_source(columns, cached, duration):
+    source = "cache" if cached else "computed"
+    print(f"{len(columns['rack_name'])} racks, {len(columns['device_name'])} devices, "
+          f"{len(columns['cable_length'])} cables ({source} in {duration:.3f} s)")
+
+
+def run_plan(args):
+    start = time.perf_counter()
+    columns, _, cached = cached_plan(args)
+    print_plan_source(columns, cached, time.perf_counter() - start)
+    if args.output is not None:
+        export_topology(columns, args.output, args.format)
+        print(f"Written to {args.output}")
+
+
+def run_cost(args):
+    start = time.perf_counter()
+    columns, _, cached = cached_plan(args)
+    print_plan_source(columns, cached, time.perf_counter() - start)
+    if args.report is not None:
+        # the price list needs an entry for every object, they are generated one at a time from the compact
+        # arrays of the plan; the summary alone is summed over the columns
+        write_cost_report(cost_table_entries(from_columns(columns), loadPricesFile(args.prices)), args.report,
+                          args.report_format, detailed=not args.summary_only)
+    print_cost_summary(bill_of_materials(columns))
+
+
+def netbox_client(args, metrics):
+    client = NetboxClient(workers=args.workers, host=args.host, quiet=args.quiet, metrics=metrics,
+                          reference_cache_path=None if args.no_reference_cache else args.reference_cache)
+    client.auth()
+    return client
+
+
+def run_provision(args, metrics):
+    columns, config, _ = cached_plan(args)
+    topology = topology_from_columns(columns)
+    client = netbox_client(args, metrics)
+
+    if args.sync:
+        # imported here because the sync module builds on create_topology
+        from sync import sync_topology, print_sync_report
+
+        sync_start = time.perf_counter()
+        with metrics.phase("sync"):
+            report = sync_topology(client, topology)
+        print_sync_report(report, time.perf_counter() - sync_start)
+    else:
+        # prices and lengths are part of what is provisioned, a changed price list starts a new run
+        provision_journaled(client, topology, args.journal, args.resume, inputs={
+            "config": config, "optimize_placement": args.optimize_placement, "rack_policy": args.rack_policy,
+            "prices": numeric_attributes(loadPricesFile(args.prices)),
+            "distances": numeric_attributes(loadDistancesFile(args.distances)),
+        }, plan=plan_from_columns(columns))
+    print_cost_summary(bill_of_materials(columns))
+
+
+def run_cleanup(args, metrics):
+    cleanup(netbox_client(args, metrics), reference_data=not args.keep_reference_data)
+
+
+def run_clear_cache(args):
+    print(f"{PlanCache(args.cache_dir, args.cache_size).clear()} cached plans deleted")
+
+
+# The argument groups are shared with create_topology.main, so both command lines take the same options
+
+
+def input_arguments():
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument("--config", default="L2_config.json", help="topology config, e.g. L2_config.json")
+    parser.add_argument("--prices", default=PRICES_PATH, help="price file")
+    parser.add_argument("--distances", default=DISTANCES_PATH, help="cable lengths between layers")
+    parser.add_argument("--rack-policy", choices=POLICIES, default=FIRST_FIT,
+                        help="how devices are assigned to racks when the placement is not optimized")
+    parser.add_argument("--optimize-placement", action="store_true",
+                        help="place devices pod by pod on a rack layout and measure cables between racks")
+    return parser
+
+
+def plan_cache_arguments():
+    parser = argparse.ArgumentParser(add_help=False)
+    cache_arguments(parser)
+    parser.add_argument("--no-cache", action="store_true", help="always compute the plan")
+    return parser
+
+
+def report_arguments():
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument("--report", help="also write the cost report with a line for every object to this file")
+    parser.add_argument("--report-format", choices=REPORT_FORMATS,
+                        help="format of the cost report, by default csv/json for .csv/.json files and text otherwise")
+    parser.add_argument("--summary-only", action="store_true", help="leave the per-object lines out of --report")
+    return parser
+
+
+def provision_arguments():
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument("--sync", action="store_true",
+                        help="only create, update and delete what differs from NetBox instead of rebuilding")
+    parser.add_argument("--resume", action="store_true",
+                        help="continue a provisioning run that failed, without cleaning up what it created")
+    parser.add_argument("--journal", default=JOURNAL_PATH, help="where created objects are recorded for --resume")
+    return parser
+
+
+def cache_arguments(parser):
+    parser.add_argument("--cache-dir", default=PLAN_CACHE_DIRECTORY, help="directory of the plan cache")
+    parser.add_argument("--cache-size", type=int, default=PLAN_CACHE_SIZE,
+                        help="plans kept in the cache, the least recently used one is evicted first")
+
+
+def netbox_arguments():
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument("--host", default=NETBOX_HOST)
+    parser.add_argument("--workers", type=int, default=PROVISIONING_WORKERS,
+                        help="parallel requests, 1 provisions everything serially")
+    parser.add_argument("--reference-cache", default=REFERENCE_CACHE_PATH,
+                        help="file caching the ids of the site, manufacturers, device types and roles between runs")
+    parser.add_argument("--no-reference-cache", action="store_true",
+                        help="look reference objects up in NetBox on every run")
+    parser.add_argument("--quiet", action="store_true", help="no line for every created or deleted object")
+    parser.add_argument("--metrics", help="write request and phase metrics to this file, also when the run fails")
+    parser.add_argument("--metrics-format", choices=["json", "prometheus"],
+                        help="format of --metrics, by default Prometheus text for .prom files and JSON otherwise")
+    return parser
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Plan, price and provision fat tree topologies")
+    commands = parser.add_subparsers(dest="command", required=True)
+    inputs, caching, netbox = input_arguments(), plan_cache_arguments(), netbox_arguments()
+
+    plan = commands.add_parser("plan", parents=[inputs, caching],
+                               help="compute the topology, optionally write it to a file")
+    plan.add_argument("--output", help="file (.npz, .graphml, .edgelist) or directory to write the topology to")
+    plan.add_argument("--format", choices=FORMATS, help="format of --output, follows the extension by default")
+
+    commands.add_parser("cost", parents=[inputs, caching, report_arguments()],
+                        help="print the cost summary of a topology")
+    commands.add_parser("provision", parents=[inputs, caching, netbox, provision_arguments()],
+                        help="create the topology in NetBox")
+
+    cleanup_parser = commands.add_parser("cleanup", parents=[netbox], help="delete everything from NetBox")
+    cleanup_parser.add_argument("--keep-reference-data", action="store_true",
+                                help="keep the custom field, site, manufacturers, device types and roles")
+
+    sweep = commands.add_parser("sweep", help="evaluate the cost of many designs in parallel")
+    add_sweep_arguments(sweep)
+
+    clear_cache = commands.add_parser("clear-cache", help="delete every cached plan")
+    cache_arguments(clear_cache)
+    return parser
+
+
+def main():
+    args = build_parser().parse_args()
+    metrics = Metrics()
+    try:
+        if args.command == "plan":
+            run_plan(args)
+        elif args.command == "cost":
+            run_cost(args)
+        elif args.command == "provision":
+            run_provision(args, metrics)
+        elif args.command == "cleanup":
+            run_cleanup(args, metrics)
+        elif args.command == "sweep":
+            run_sweep(args)
+        else:
+            run_clear_cache(args)
+    except NetboxError as error:
+        print(error)
+        if args.command == "provision":
+            print("Provisioning stopped, run again with --resume to continue where it failed")
+        sys.exit(1)
+    except (ValueError, OSError) as error:
+        # e.g. an unsupported config, a missing price file or a journal written for another topology
+        print(error)
+        sys.exit(1)
+    finally:
+        if getattr(args, "metrics", None):
+            metrics.write(args.metrics, args.metrics_format)
+
+
+if __name__ == "__main__":
+    main()
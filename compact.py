@@ -0,0 +1,245 @@
+from array import array
+
+import numpy as np
+
+from cost_report import plain_number, summarize, unit_group
+from create_topology import size_topology, level_distance, Cable, EntryWithPrice
+from fat_tree import children, split_levels
+from prices import Prices
+from rack_allocator import RackAllocator
+
+CORE, AGGREGATION, EDGE, HOST = range(4)
+LAYER_NAMES = ["core_switches", "aggregation_switches", "edge_switches", "hosts"]
+# device names of create_topology, followed by the number of the device in its layer
+DEVICE_PREFIXES = ["core_switch_", "aggregation_switch_", "edge_switch_", "host_"]
+CABLE_TYPE = "rj45_cat_7"
+# arrays of a CompactTopology that have a column of the same name in topology_files
+ARRAY_COLUMNS = ["device_layer", "device_rack", "device_position", "port_count", "cable_a_device", "cable_a_port",
+                 "cable_b_device", "cable_b_port", "cable_length"]
+
+
+class CompactTopology:
+    # Devices and cables are rows in flat typed arrays instead of Python objects. Devices are numbered
+    # in creation order (core, aggregation, edge, hosts), ports are local to their device. The builder appends
+    # one row per device and cable, which array.array does in amortized constant time while a NumPy array would
+    # have to be sized up front; finished arrays are exchanged with NumPy through their buffers (see
+    # analysis.from_compact and from_columns).
+    __slots__ = (
+        "size", "rack_height", "rack_count", "rack_allocator", "layer_ranges",
+        "device_layer", "device_rack", "device_position", "port_count", "next_port",
+        "cable_a_device", "cable_a_port", "cable_b_device", "cable_b_port", "cable_length",
+    )
+
+    def __init__(self, size):
+        self.size = size
+        self.rack_height = size["rack_height"]
+        self.rack_count = 0
+        self.rack_allocator = RackAllocator(self.rack_height)
+        self.layer_ranges = {}
+
+        self.device_layer = array("b")
+        self.device_rack = array("i")
+        self.device_position = array("i")
+        self.port_count = array("i")
+        self.next_port = array("i")
+
+        self.cable_a_device = array("i")
+        self.cable_a_port = array("i")
+        self.cable_b_device = array("i")
+        self.cable_b_port = array("i")
+        self.cable_length = array("d")
+
+    @property
+    def device_count(self):
+        return len(self.device_layer)
+
+    @property
+    def cable_count(self):
+        return len(self.cable_length)
+
+    def add_devices(self, layer, count, ports, height=1):
+        # first-fit placement, racks are filled one after another in creation order
+        start = self.device_count
+        for _ in range(count):
+            rack, position = self.rack_allocator.allocate(height)
+
+            self.device_layer.append(layer)
+            self.device_rack.append(rack)
+            self.device_position.append(position)
+            self.port_count.append(ports)
+            self.next_port.append(0)
+
+        self.rack_count = self.rack_allocator.rack_count
+        self.layer_ranges[layer] = range(start, self.device_count)
+        return self.layer_ranges[layer]
+
+    def join(self, left, right, distance_between_racks):
+        left_port = self.take_port(left)
+        right_port = self.take_port(right)
+
+        if self.device_rack[left] == self.device_rack[right]:
+            cable_length = 1
+        else:
+            cable_length = distance_between_racks
+
+        self.cable_a_device.append(left)
+        self.cable_a_port.append(left_port)
+        self.cable_b_device.append(right)
+        self.cable_b_port.append(right_port)
+        self.cable_length.append(cable_length)
+
+    def take_port(self, device):
+        port = self.next_port[device]
+        if port >= self.port_count[device]:
+            raise ValueError(f"Device {device} has no open ports left")
+        self.next_port[device] = port + 1
+        return port
+
+    def nbytes(self):
+        columns = [getattr(self, name) for name in self.__slots__ if isinstance(getattr(self, name), array)]
+        return sum([column.itemsize * len(column) for column in columns])
+
+
+def join_levels(topology, levels, down, up):
+    # same link order as create_topology.join_levels, levels are device ranges, hosts first
+    tree_level = len(levels) - 1
+    for level in range(tree_level, 0, -1):
+        distance = level_distance(tree_level, level)
+        lower_devices = levels[level - 1]
+        for parent, device in enumerate(levels[level]):
+            for child in children(down, up, level, parent):
+                topology.join(device, lower_devices[child], distance)
+
+
+def build_compact_topology(config):
+    # same sizing, placement and wiring order as create_topology.build_topology
+    size = size_topology(config)
+    ports_per_switch = size["ports_per_switch"]
+    topology = CompactTopology(size)
+
+    switch_height = size["switch_height"]
+    core_switches = topology.add_devices(CORE, size["core_number"], ports_per_switch, switch_height)
+    aggregation_switches = topology.add_devices(AGGREGATION, size["aggregation_number"], ports_per_switch,
+                                                switch_height)
+    edge_switches = topology.add_devices(EDGE, size["edge_number"], ports_per_switch, switch_height)
+    hosts = topology.add_devices(HOST, size["host_number"], 1, size["host_height"])
+
+    levels = split_levels(hosts, edge_switches, aggregation_switches, core_switches, size["level_counts"])
+    join_levels(topology, levels, size["down_links"], size["up_links"])
+    return topology
+
+
+def from_topology(topology):
+    # converts the object model of create_topology, e.g. after it has been provisioned
+    compact = CompactTopology(topology.size)
+    layers = [topology.core_switches, topology.aggregation_switches, topology.edge_switches, topology.hosts]
+
+    rack_index = {id(rack): index for index, rack in enumerate(topology.racks)}
+    compact.rack_count = len(topology.racks)
+
+    interface_index = {}
+    for layer, devices in enumerate(layers):
+        start = compact.device_count
+        for device in devices:
+            for port, interface in enumerate(device.interfaces):
+                interface_index[id(interface)] = (compact.device_count, port)
+
+            compact.device_layer.append(layer)
+            compact.device_rack.append(rack_index[id(device.rack)])
+            compact.device_position.append(device.position)
+            compact.port_count.append(len(device.interfaces))
+            # ports are taken in order, so the next free port is the first open interface
+            compact.next_port.append(next((port for port, interface in enumerate(device.interfaces)
+                                           if interface.is_open), len(device.interfaces)))
+        compact.layer_ranges[layer] = range(start, compact.device_count)
+
+    for cable in topology.cables:
+        a_device, a_port = interface_index[id(cable.a_interface)]
+        b_device, b_port = interface_index[id(cable.b_interface)]
+        compact.cable_a_device.append(a_device)
+        compact.cable_a_port.append(a_port)
+        compact.cable_b_device.append(b_device)
+        compact.cable_b_port.append(b_port)
+        compact.cable_length.append(cable.length)
+
+    return compact
+
+
+def from_columns(columns):
+    # the compact topology of topology_files columns, e.g. a cached cabling plan, so its price list can be
+    # streamed by cost_table_entries; devices are ordered by layer in both
+    compact = CompactTopology(columns["size"])
+    compact.rack_count = len(columns["rack_name"])
+
+    layer_sizes = np.bincount(columns["device_layer"], minlength=len(LAYER_NAMES)).tolist()
+    starts = np.cumsum([0] + layer_sizes).tolist()
+    for layer in range(len(LAYER_NAMES)):
+        compact.layer_ranges[layer] = range(starts[layer], starts[layer + 1])
+
+    for name in ARRAY_COLUMNS:
+        typecode = getattr(compact, name).typecode
+        setattr(compact, name, array(typecode, columns[name].astype(typecode).tobytes()))
+    # ports are taken in order, so the next free port of a device is the number of cables ending on it
+    used_ports = np.bincount(np.concatenate([columns["cable_a_device"], columns["cable_b_device"]]),
+                             minlength=len(columns["device_layer"]))
+    compact.next_port = array("i", used_ports.astype("i").tobytes())
+    return compact
+
+
+def bill_of_materials(topology, prices=Prices):
+    # same structure as create_topology.bill_of_materials, without any per-entry objects
+    size = topology.size
+    switch_groups = {CORE: prices.switch_price, AGGREGATION: prices.switch_price, EDGE: prices.switch_price,
+                     HOST: prices.dell_poweredge_r450_xs}
+
+    groups = {"racks": unit_group(topology.rack_count, prices.getRackPriceBasedOnHeight(size["rack_height"]))}
+    for layer, price in switch_groups.items():
+        groups[LAYER_NAMES[layer]] = unit_group(len(topology.layer_ranges.get(layer, ())), price)
+
+    cable_length = sum(topology.cable_length)
+    groups["cables"] = {"count": topology.cable_count, "price": cable_length * prices.rj45_cat_7}
+
+    if size["tree_level"] == 2:
+        groups.pop("aggregation_switches")
+
+    return summarize(groups, {CABLE_TYPE: {"length": cable_length, "pricePerMeter": prices.rj45_cat_7}})
+
+
+def device_name(topology, device):
+    layer = topology.device_layer[device]
+    return DEVICE_PREFIXES[layer] + str(device - topology.layer_ranges[layer].start + 1)
+
+
+def cost_table_entries(topology, prices=Prices):
+    # the categories of Topology.cost_table_entities, every one a generator that creates its entries one at a
+    # time from the arrays, so cost_report streams the price list of any tree size in constant memory
+    rack_price = prices.getRackPriceBasedOnHeight(topology.rack_height)
+    layer_prices = [prices.switch_price, prices.switch_price, prices.switch_price, prices.dell_poweredge_r450_xs]
+
+    def racks():
+        for rack in range(topology.rack_count):
+            yield EntryWithPrice(rack_price, f"rack_{rack}", f"Rack with {topology.rack_height} U")
+
+    def devices(layer):
+        for device in topology.layer_ranges.get(layer, ()):
+            yield EntryWithPrice(layer_prices[layer], device_name(topology, device),
+                                 f"Device with {topology.port_count[device]} interfaces")
+
+    def cables():
+        for cable in range(topology.cable_count):
+            length = plain_number(topology.cable_length[cable])
+            entry = Cable(None, CABLE_TYPE, length, prices.rj45_cat_7, length * prices.rj45_cat_7)
+            a_name = device_name(topology, topology.cable_a_device[cable])
+            b_name = device_name(topology, topology.cable_b_device[cable])
+            entry.name = f"Cable {a_name}int{topology.cable_a_port[cable] + 1} - " \
+                         f"{b_name}int{topology.cable_b_port[cable] + 1}"
+            yield entry
+
+    entries = {"racks": racks()}
+    for layer, name in enumerate(LAYER_NAMES):
+        entries[name] = devices(layer)
+    entries["cables"] = cables()
+
+    if topology.size["tree_level"] == 2:
+        entries.pop("aggregation_switches")
+    return entries
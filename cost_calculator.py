@@ -0,0 +1,186 @@
+import argparse
+
+from create_topology import (
+    size_topology, load_config, build_topology, bill_of_materials, print_cost_summary, level_distance,
+)
+from cost_report import summarize, unit_group
+from fat_tree import children, link_layer_name
+from prices import Prices, loadPrices
+from distances import Distances, loadDistances
+from rack_allocator import DEVICE_HEIGHTS, device_heights
+
+
+# Devices are placed first-fit in the order core, aggregation (top level first), edge, hosts. Racks are described
+# by runs of consecutive devices (see first_fit_segments), so every count below is derived from index ranges
+# instead of instantiating devices and cables.
+
+def level_offsets(size):
+    # global index of the first device of every level, hosts first
+    counts = size["level_counts"]
+    offsets = [0] * len(counts)
+    for level in range(len(counts) - 2, -1, -1):
+        offsets[level] = offsets[level + 1] + counts[level + 1]
+    return offsets
+
+
+def first_fit_segments(size):
+    # (rack, first device, device count) of every run of devices first fit puts into one rack, in device order.
+    # The switches fill rack after rack; the hosts first go into the units the switches leave free, lowest rack
+    # first, and then into racks of their own. With 1U devices every rack is one run of rack_height devices
+    rack_height = size["rack_height"]
+    heights = {"switch": size["switch_height"], "host": size["host_height"]}
+    for role, height in heights.items():
+        if height > rack_height:
+            raise ValueError(f"A {role} of {height} U does not fit into a rack of {rack_height} U")
+
+    switch_count = sum(size["level_counts"][1:])
+    host_count = size["host_number"]
+    switches_per_rack = rack_height // heights["switch"]
+    hosts_per_rack = rack_height // heights["host"]
+
+    segments = []
+    free_units = []
+    for rack, start in enumerate(range(0, switch_count, switches_per_rack)):
+        count = min(switches_per_rack, switch_count - start)
+        segments.append((rack, start, count))
+        free_units.append(rack_height - count * heights["switch"])
+
+    host = 0
+    for rack, units in enumerate(free_units):
+        count = min(units // heights["host"], host_count - host)
+        if count > 0:
+            segments.append((rack, switch_count + host, count))
+            host += count
+
+    rack = len(free_units)
+    while host < host_count:
+        count = min(hosts_per_rack, host_count - host)
+        segments.append((rack, switch_count + host, count))
+        host += count
+        rack += 1
+    return segments
+
+
+def rack_ranges(segments, start, stop):
+    # the devices between start and stop in every rack that holds some of them, as ranges of global indices
+    ranges = {}
+    for rack, first, count in segments:
+        low, high = max(first, start), min(first + count, stop)
+        if low < high:
+            ranges[rack] = range(low, high)
+    return ranges
+
+
+def level_links(size, offsets, level, segments):
+    # number of links between a level and the level below and how many of them stay inside one rack;
+    # only the parents in a rack that also holds devices of the lower level can have a link inside a rack
+    down, up = size["down_links"], size["up_links"]
+    counts = size["level_counts"]
+    parent_start, child_start = offsets[level], offsets[level - 1]
+    parent_racks = rack_ranges(segments, parent_start, parent_start + counts[level])
+    child_racks = rack_ranges(segments, child_start, child_start + counts[level - 1])
+
+    same_rack = 0
+    for rack, parents in parent_racks.items():
+        lower = child_racks.get(rack)
+        if lower is None:
+            continue
+        for parent in parents:
+            for child in children(down, up, level, parent - parent_start):
+                same_rack += child_start + child in lower
+
+    return counts[level] * down[level], same_rack
+
+
+def calculate_cost(tree_level, ports_per_switch, pod_size, rack_height, prices=Prices, distances=Distances,
+                   oversubscription=None, heights=None):
+    # heights are the rack units of a switch and a host like rack_allocator.device_heights returns them
+    heights = heights or DEVICE_HEIGHTS
+    size = size_topology({
+        "tree_level": tree_level,
+        "ports_per_switch": ports_per_switch,
+        "pod_size": pod_size,
+        "rack_height": rack_height,
+        "oversubscription": oversubscription,
+        "switch_height": heights["switch"],
+        "host_height": heights["host"],
+    })
+
+    offsets = level_offsets(size)
+    segments = first_fit_segments(size)
+    cable_layers = {}
+    for level in range(tree_level, 0, -1):
+        links, same_rack = level_links(size, offsets, level, segments)
+        cable_layers[link_layer_name(tree_level, level)] = {
+            "count": links,
+            "length": same_rack * 1 + (links - same_rack) * level_distance(tree_level, level, distances),
+        }
+
+    cable_count = sum([layer["count"] for layer in cable_layers.values()])
+    cable_length = sum([layer["length"] for layer in cable_layers.values()])
+    rack_price = prices.getRackPriceBasedOnHeight(rack_height)
+
+    groups = {
+        "racks": unit_group(max([rack + 1 for rack, _, _ in segments], default=0), rack_price),
+        "core_switches": unit_group(size["core_number"], prices.switch_price),
+        "aggregation_switches": unit_group(size["aggregation_number"], prices.switch_price),
+        "edge_switches": unit_group(size["edge_number"], prices.switch_price),
+        "hosts": unit_group(size["host_number"], prices.dell_poweredge_r450_xs),
+        "cables": {"count": cable_count, "price": cable_length * prices.rj45_cat_7},
+    }
+
+    if tree_level == 2:
+        groups.pop("aggregation_switches")
+
+    bom = summarize(groups, {"rj45_cat_7": {"length": cable_length, "pricePerMeter": prices.rj45_cat_7}})
+    return {"size": size, **bom, "cable_layers": cable_layers}
+
+
+def compare_with_object_model(config):
+    # builds the same tree with Device/Cable objects, only meant for small configs
+    expected = bill_of_materials(build_topology(config).cost_table_entities())
+    calculated = calculate_cost(config["tree_level"], config["ports_per_switch"], config.get("pod_size"),
+                                config["rack_height"], oversubscription=config.get("oversubscription"),
+                                heights=device_heights(config))
+
+    differences = []
+    for key, group in expected["groups"].items():
+        if group["count"] != calculated["groups"][key]["count"]:
+            differences.append(f"{key} count: {group['count']} != {calculated['groups'][key]['count']}")
+        if round(group["price"], 2) != round(calculated["groups"][key]["price"], 2):
+            differences.append(f"{key} price: {group['price']} != {calculated['groups'][key]['price']}")
+
+    for cable_type, cable_data in expected["cable_types"].items():
+        if cable_data["length"] != calculated["cable_types"][cable_type]["length"]:
+            differences.append(
+                f"{cable_type} length: {cable_data['length']} != {calculated['cable_types'][cable_type]['length']}")
+
+    if expected["total"] != calculated["total"]:
+        differences.append(f"total: {expected['total']} != {calculated['total']}")
+
+    return differences
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Calculate fat tree cost without building the topology")
+    parser.add_argument("--config", default="L2_config.json")
+    parser.add_argument("--verify", action="store_true",
+                        help="also build the topology from objects and compare both results")
+    args = parser.parse_args()
+    loadPrices()
+    loadDistances()
+
+    config = load_config(args.config)
+    print_cost_summary(calculate_cost(config["tree_level"], config["ports_per_switch"], config.get("pod_size"),
+                                      config["rack_height"], oversubscription=config.get("oversubscription"),
+                                      heights=device_heights(config)))
+
+    if args.verify:
+        differences = compare_with_object_model(config)
+        for difference in differences:
+            print(difference)
+        print("Object model check:", "failed" if differences else "passed")
+
+
+if __name__ == "__main__":
+    main()
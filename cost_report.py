@@ -0,0 +1,181 @@
+import csv
+import json
+import sys
+
+REPORT_FORMATS = ["text", "csv", "json"]
+# bytes collected before a report file is written to, the detailed report of a large tree has millions of lines
+WRITE_BUFFER_SIZE = 1 << 20
+CSV_COLUMNS = ["record", "category", "name", "description", "count", "price", "length", "price_per_unit"]
+
+
+def plain_number(value):
+    # whole numbers are printed without a fraction whichever representation summed them, 19399 and not 19399.0
+    value = value.item() if hasattr(value, "item") else value
+    return int(value) if isinstance(value, float) and value.is_integer() else value
+
+
+def unit_group(count, price_per_unit):
+    return {"count": count, "pricePerUnit": price_per_unit, "price": count * price_per_unit}
+
+
+def summarize(groups, cable_types):
+    # The one bill of materials every representation feeds: groups maps a category to its count, price and
+    # pricePerUnit, cable_types a cable type to its length and pricePerMeter
+    groups = {key: {name: plain_number(value) for name, value in group.items()} for key, group in groups.items()}
+    cable_types = {key: {name: plain_number(value) for name, value in cable_type.items()}
+                   for key, cable_type in cable_types.items()}
+    return {
+        "groups": groups,
+        "cable_types": cable_types,
+        "total": plain_number(round(sum([value["price"] for value in groups.values()]), 2)),
+    }
+
+
+class CostAggregator:
+    # Running totals per category and per cable type, filled one entry at a time, so entries can come from
+    # generators and nothing but the totals is kept
+    def __init__(self):
+        self.groups = {}
+        self.cable_types = {}
+
+    def start_category(self, category):
+        self.groups.setdefault(category, {'price': 0, 'count': 0})
+
+    def add(self, category, entry):
+        group = self.groups[category]
+        group['pricePerUnit'] = entry.price
+        group['price'] = group['price'] + entry.price
+        group['count'] = group['count'] + 1
+
+        if category == 'cables':
+            cable_type = self.cable_types.setdefault(entry.cableType, {'length': 0})
+            cable_type['pricePerMeter'] = entry.pricePerMeter
+            cable_type['length'] = cable_type['length'] + entry.length
+
+    def bill_of_materials(self):
+        return summarize(self.groups, self.cable_types)
+
+
+class TextReportWriter:
+    # the price list print_cost_table has always printed, followed by the summary
+    def __init__(self, stream):
+        self.stream = stream
+
+    def start_category(self, category):
+        self.stream.write(f"{'=' * 20}\n{category}\n{'-' * 20}\n")
+
+    def write_entry(self, category, entry):
+        self.stream.write(entry.price_list_entry() + "\n")
+
+    def end_category(self, category):
+        self.stream.write("\n\n")
+
+    def write_summary(self, bom):
+        lines = ["=" * 20, "Summary:"]
+        for key, value in bom['groups'].items():
+            if key != 'cables':
+                lines.append(f"{key}: {value['count']}x {value['pricePerUnit']} = {value['price']}")
+            else:
+                for cable_type, cable_data in bom['cable_types'].items():
+                    lines.append(f"{cable_type}: {cable_data['length']}m x {cable_data['pricePerMeter']}")
+        lines += ["=" * 20, f"Total cost:  {bom['total']}"]
+        self.stream.write("\n".join(lines) + "\n")
+
+
+class CsvReportWriter:
+    # one "entry" row per rack, device and cable, then "group", "cable_type" and "total" rows
+    def __init__(self, stream):
+        self.writer = csv.writer(stream)
+        self.writer.writerow(CSV_COLUMNS)
+
+    def start_category(self, category):
+        pass
+
+    def write_entry(self, category, entry):
+        self.writer.writerow(["entry", category, entry.name, entry.description, 1, entry.price,
+                              getattr(entry, "length", ""), ""])
+
+    def end_category(self, category):
+        pass
+
+    def write_summary(self, bom):
+        for category, group in bom['groups'].items():
+            self.writer.writerow(["group", category, "", "", group['count'], group['price'], "",
+                                  group.get('pricePerUnit', "")])
+        for cable_type, cable_data in bom['cable_types'].items():
+            self.writer.writerow(["cable_type", "cables", cable_type, "", "", "", cable_data['length'],
+                                  cable_data['pricePerMeter']])
+        self.writer.writerow(["total", "", "", "", "", bom['total'], "", ""])
+
+
+class JsonReportWriter:
+    # {"entries": [...], "summary": {...}}, the entries are written one by one instead of dumped as a list;
+    # a summary-only report has no "entries"
+    def __init__(self, stream):
+        self.stream = stream
+        self.entry_count = 0
+        self.detailed = False
+
+    def start_category(self, category):
+        if not self.detailed:
+            self.detailed = True
+            self.stream.write('{"entries": [')
+
+    def write_entry(self, category, entry):
+        record = {"category": category, "name": entry.name, "description": entry.description, "price": entry.price}
+        if category == 'cables':
+            record["length"] = entry.length
+        self.stream.write((",\n" if self.entry_count else "\n") + json.dumps(record))
+        self.entry_count += 1
+
+    def end_category(self, category):
+        pass
+
+    def write_summary(self, bom):
+        self.stream.write(('\n], "summary": ' if self.detailed else '{"summary": ') + json.dumps(bom) + "}\n")
+
+
+REPORT_WRITERS = {"text": TextReportWriter, "csv": CsvReportWriter, "json": JsonReportWriter}
+
+
+def stream_cost_report(entries, writer=None, detailed=True):
+    # entries maps a category to an iterable of priced entries, e.g. a generator; every entry is consumed once,
+    # added to the running totals and, when detailed, written right away. Returns the bill of materials
+    aggregator = CostAggregator()
+
+    for category, category_entries in entries.items():
+        aggregator.start_category(category)
+        if writer is not None and detailed:
+            writer.start_category(category)
+
+        for entry in category_entries:
+            aggregator.add(category, entry)
+            if writer is not None and detailed:
+                writer.write_entry(category, entry)
+
+        if writer is not None and detailed:
+            writer.end_category(category)
+
+    bom = aggregator.bill_of_materials()
+    if writer is not None:
+        writer.write_summary(bom)
+    return bom
+
+
+def report_format_of(path):
+    if path is not None and path.endswith(".csv"):
+        return "csv"
+    if path is not None and path.endswith(".json"):
+        return "json"
+    return "text"
+
+
+def write_cost_report(entries, path=None, report_format=None, detailed=True):
+    # writes to the file at path through a large buffer, or to stdout; the format follows the extension
+    # (.csv, .json, text otherwise) unless it is given
+    report_format = report_format or report_format_of(path)
+    if path is None:
+        return stream_cost_report(entries, REPORT_WRITERS[report_format](sys.stdout), detailed)
+
+    with open(path, "w", buffering=WRITE_BUFFER_SIZE, newline="") as stream:
+        return stream_cost_report(entries, REPORT_WRITERS[report_format](stream), detailed)
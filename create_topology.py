@@ -1,12 +1,28 @@
+import argparse
+import cProfile
 import math
 import json
+import pstats
+import sys
+import time
 
-from netbox_client import NetboxClient
-from prices import Prices
-from distances import Distances
+from fat_tree import tree_shape, level_counts, children, link_ports, split_levels
+from cost_report import TextReportWriter, stream_cost_report, write_cost_report
+from journal import ProvisioningJournal, JOURNAL_PATH
+from metrics import Metrics
+from netbox_client import NETBOX_HOST, NetboxClient, NetboxError
+from prices import Prices, loadPrices
+from distances import Distances, loadDistances
+from rack_allocator import RackAllocator, device_heights, DEVICE_HEIGHTS, FIRST_FIT
+from reference_cache import REFERENCE_CACHE_PATH
+
+# number of parallel requests sent to NetBox, 1 provisions everything serially
+PROVISIONING_WORKERS = 4
 
 
 class EntryWithPrice:
+    __slots__ = ("price", "name", "description")
+
     def __init__(self, price=0, name=None, description=None):
         self.price = price
         self.name = name
@@ -19,26 +35,38 @@ class EntryWithPrice:
 
 
 class Interface:
-    def __init__(self, id, is_open=True):
+    __slots__ = ("id", "is_open", "name", "device")
+
+    def __init__(self, id, is_open=True, name=None, device=None):
         self.id = id
         self.is_open = is_open
+        self.name = name
+        self.device = device
 
 
 class Device(EntryWithPrice):
-    def __init__(self, id, interfaces, rack=None, price=0):
+    __slots__ = ("id", "interfaces", "rack", "position", "role", "height")
+
+    def __init__(self, id, interfaces, rack=None, price=0, name=None, position=None, role=None, height=1):
         self.id = id
         self.interfaces = interfaces
         self.rack = rack
+        self.position = position
+        self.role = role
+        self.height = height
+
+        for interface in interfaces:
+            interface.device = self
 
-        super().__init__(price, f"Device {id}", f"Device with {len(interfaces)} interfaces")
+        if name is None:
+            name = f"Device {id}"
+
+        super().__init__(price, name, f"Device with {len(interfaces)} interfaces")
 
     def add_interface(self, interface):
+        interface.device = self
         self.interfaces.append(interface)
-
-    def find_first_open_interface(self):
-        for interface in self.interfaces:
-            if interface.is_open:
-                return interface
+        self.description = f"Device with {len(self.interfaces)} interfaces"
 
     def get_rack(self):
         return self.rack
@@ -51,90 +79,187 @@ class Device(EntryWithPrice):
 
 
 class Cable(EntryWithPrice):
-    def __init__(self, id, cable_type, length, price_per_meter, price):
+    __slots__ = ("id", "cableType", "length", "pricePerMeter", "a_interface", "b_interface")
+
+    def __init__(self, id, cable_type, length, price_per_meter, price, a_interface=None, b_interface=None):
         self.id = id
         self.cableType = cable_type
         self.length = length
         self.pricePerMeter = price_per_meter
+        self.a_interface = a_interface
+        self.b_interface = b_interface
+
+        if a_interface is not None and b_interface is not None:
+            name = f"Cable {a_interface.name} - {b_interface.name}"
+        else:
+            name = f"Cable {id}"
+
+        super().__init__(price, name, f"{length} m")
 
-        super().__init__(price, f"Cable {id}", f"{length} m")
+    def set_length(self, length):
+        self.length = length
+        self.price = length * self.pricePerMeter
+        self.description = f"{length} m"
 
 
 class Rack(EntryWithPrice):
-    def __init__(self, id, height, price=None):
+    __slots__ = ("id", "height", "devices", "used_units", "coordinates")
+
+    def __init__(self, id, height, price=None, name=None, coordinates=None):
         self.id = id
         self.height = height
         self.devices = []
+        self.used_units = 0
+        self.coordinates = coordinates
 
         if price is None:
             price = Prices.getRackPriceBasedOnHeight(height)
 
-        super().__init__(price, f"Rack with {height} U", f"Rack {id}")
+        if name is None:
+            name = f"Rack {id}"
 
-    def has_place(self):
-        return len(self.devices) < self.height
+        super().__init__(price, name, f"Rack with {height} U")
+
+    def has_place(self, height=1):
+        return self.used_units + height <= self.height
 
     def empty_position(self):
-        return len(self.devices) + 1
+        return self.used_units + 1
 
     def add_device(self, device):
         self.devices.append(device)
+        self.used_units += device.height
+
 
+def assign_ids(objects, ids):
+    # bulk endpoints return created objects in request order
+    for obj, new_id in zip(objects, ids):
+        obj.id = new_id
 
-def create_racks(rack_num, rack_height_u):
+
+def create_racks(rack_num, rack_height_u, coordinates=None):
     rack_list = []
     for id in range(rack_num):
-        rack_name = "rack_" + str(id)
-        new_rack_id = client.create_rack(rack_name, device_number=rack_height_u, site_id=site_id)
-        rack_list.append(Rack(new_rack_id, rack_height_u))
+        rack_coordinates = tuple(coordinates[id]) if coordinates is not None else None
+        rack_list.append(create_rack(id, rack_height_u, rack_coordinates))
     return rack_list
 
 
-def find_free_rack(racks):
-    for rack in racks:
-        if rack.has_place():
-            return rack
+def create_rack(index, rack_height_u, coordinates=None):
+    return Rack(None, rack_height_u, name="rack_" + str(index), coordinates=coordinates)
+
+
+def place_device(device, racks, allocator=None, location=None):
+    # location is a (rack index, position) pair chosen by a placement.Placement, otherwise the allocator
+    # picks one and racks it opens are added to the list
+    if location is None:
+        location = allocator.allocate(device.height)
+
+    rack_index, position = location
+    while rack_index >= len(racks):
+        racks.append(create_rack(len(racks), racks[0].height if racks else allocator.rack_height))
 
+    rack = racks[rack_index]
+    device.rack = rack
+    device.position = position
+    rack.add_device(device)
 
-def create_device_with_ports(switch_num, port_num, type_name, racks, device_type_id, device_role_id, device_price):
+
+def create_device_with_ports(switch_num, port_num, type_name, racks, device_price, role="switch", locations=None,
+                             allocator=None, height=1):
     device_list = []
     for id in range(switch_num):
         device_name = type_name + str(id + 1)
-        rack = find_free_rack(racks)
-        new_device_id = client.create_device(name=device_name, type_id=device_type_id, role_id=device_role_id,
-                                             site_id=site_id, rack_id=rack.id, rack_position=rack.empty_position())
         interfaces = []
         for int_id in range(port_num):
             int_name = device_name + "int" + str(int_id + 1)
-            interface_id = client.create_interface(name=int_name, device_id=new_device_id)
-            interfaces.append(Interface(interface_id))
-        device = Device(new_device_id, interfaces, rack=rack, price=device_price)
-        rack.add_device(device)
+            interfaces.append(Interface(None, name=int_name))
+        device = Device(None, interfaces, price=device_price, name=device_name, role=role, height=height)
+        place_device(device, racks, allocator, locations[id] if locations is not None else None)
         device_list.append(device)
     return device_list
 
 
-def create_hosts(host_num, racks):
+def create_hosts(host_num, racks, locations=None, allocator=None, height=1):
     host_list = []
     for id in range(host_num):
         host_name = "host_" + str(id + 1)
-        rack = find_free_rack(racks)
-        new_host_id = client.create_device(name=host_name, type_id=host_device_type, role_id=host_role_id,
-                                           site_id=site_id, rack_id=rack.id, rack_position=rack.empty_position())
         int_name = host_name + "int" + str(1)
-        interface_id = client.create_interface(name=int_name, device_id=new_host_id)
-        device = Device(new_host_id, [Interface(interface_id)], rack=rack, price=Prices.dell_poweredge_r450_xs)
-        rack.add_device(device)
+        device = Device(None, [Interface(None, name=int_name)], price=Prices.dell_poweredge_r450_xs, name=host_name,
+                        role="host", height=height)
+        place_device(device, racks, allocator, locations[id] if locations is not None else None)
         host_list.append(device)
     return host_list
 
 
-def join_devices(left_device, right_device, distance_between_racks=10):
-    left_interface = left_device.find_first_open_interface()
-    right_interface = right_device.find_first_open_interface()
+def provision_objects(kind, objects, create_objects, body, journal=None, find_objects=None):
+    # objects the journal already knows keep their id and are not sent again; every batch NetBox stores
+    # gets its ids right away and is journaled, so a failed run can be resumed from the failed batch.
+    # find_objects(bodies) returns the ids of the objects NetBox already has: a resumed run looks up the objects
+    # the journal misses, as the failed run may have lost the response of a batch NetBox stored
+    if journal is not None:
+        for obj in objects:
+            obj.id = journal.get(kind, obj.name)
+        objects = [obj for obj in objects if obj.id is None]
+
+        if journal.resumed and objects and find_objects is not None:
+            stored = [(obj, obj_id) for obj, obj_id in zip(objects, find_objects([body(obj) for obj in objects]))
+                      if obj_id is not None]
+            if stored:
+                assign_ids([obj for obj, _ in stored], [obj_id for _, obj_id in stored])
+                journal.record(kind, [obj.name for obj, _ in stored], [obj_id for _, obj_id in stored])
+                objects = [obj for obj in objects if obj.id is None]
+
+    def on_batch(start, ids):
+        batch = objects[start:start + len(ids)]
+        assign_ids(batch, ids)
+        if journal is not None:
+            journal.record(kind, [obj.name for obj in batch], ids)
+
+    if objects:
+        create_objects([body(obj) for obj in objects], on_batch=on_batch)
+
+
+def provision_racks(client, references, racks, journal=None):
+    provision_objects("rack", racks, client.create_racks, lambda rack: {
+        "name": rack.name, "device_number": rack.height, "site_id": references["site_id"],
+    }, journal, client.find_racks)
+
+
+def provision_devices(client, references, devices, journal=None):
+    provision_objects("device", devices, client.create_devices, lambda device: {
+        "name": device.name,
+        "type_id": references["device_types"][device.role],
+        "role_id": references["device_roles"][device.role],
+        "site_id": references["site_id"],
+        "rack_id": device.get_rack_id(),
+        "rack_position": device.position,
+    }, journal, client.find_devices)
+
+
+def provision_interfaces(client, devices, journal=None):
+    interfaces = [interface for device in devices for interface in device.interfaces]
+    provision_objects("interface", interfaces, client.create_interfaces, lambda interface: {
+        "name": interface.name, "device_id": interface.device.id,
+    }, journal, client.find_interfaces)
+
+
+def provision_cables(client, cables, journal=None):
+    provision_objects("cable", cables, client.create_cables, cable_body, journal, client.find_cables)
+
+
+def cable_body(cable):
+    return {
+        "int1_id": cable.a_interface.id,
+        "int2_id": cable.b_interface.id,
+        "length": cable.length,
+        "price": cable.price,
+    }
+
 
-    # check if both devices are in the same rack id
-    if left_device.get_rack_id() == right_device.get_rack_id():
+def join_devices(left_interface, right_interface, distance_between_racks=10):
+    # check if both devices are in the same rack, ids are not known before the topology is provisioned
+    if left_interface.device.get_rack() is right_interface.device.get_rack():
         cable_length = 1
     else:
         cable_length = distance_between_racks
@@ -142,229 +267,417 @@ def join_devices(left_device, right_device, distance_between_racks=10):
     cable_price_per_meter = Prices.rj45_cat_7
     cable_price = cable_length * cable_price_per_meter
 
-    cable_id = client.create_cable(left_interface.id, right_interface.id, cable_length, cable_price)
     left_interface.is_open = False
     right_interface.is_open = False
 
-    cable = Cable(cable_id, "rj45_cat_7", cable_length, cable_price_per_meter, cable_price)
+    cable = Cable(None, "rj45_cat_7", cable_length, cable_price_per_meter, cable_price,
+                  a_interface=left_interface, b_interface=right_interface)
     return cable
 
 
-def join_core_with_aggregation(core_switches, aggregation_switches):
-    cable_list = []
-
-    for id, agg_r in enumerate(aggregation_switches):
-        if id % 2 == 0:
-            core_switches_to_join = core_switches[:len(core_switches) // 2]
-            for core_switch in core_switches_to_join:
-                cable_list.append(
-                    join_devices(agg_r, core_switch, distance_between_racks=Distances.core_to_aggregation)
-                )
-        else:
-            core_switches_to_join = core_switches[len(core_switches) // 2:]
-            for core_switch in core_switches_to_join:
-                cable_list.append(
-                    join_devices(agg_r, core_switch, distance_between_racks=Distances.core_to_aggregation)
-                )
+def level_distance(tree_level, level, distances=Distances):
+    # fixed length of inter-rack cables between a level and the level below, links between two aggregation
+    # levels are as long as those between aggregation and edge
+    if level == 1:
+        return distances.edge_to_host
+    if level == tree_level:
+        return distances.core_to_edge if tree_level == 2 else distances.core_to_aggregation
+    return distances.aggregation_to_edge
 
-    return cable_list
 
-def join_core_with_edge(core_switches, edge_switches):
+def join_levels(levels, down, up):
+    # levels holds the devices of every level, hosts first; links are created top-down and parent by parent,
+    # the ports of every link follow from that order (see fat_tree.link_ports)
     cable_list = []
+    tree_level = len(levels) - 1
+
+    for level in range(tree_level, 0, -1):
+        distance = level_distance(tree_level, level)
+        lower_devices = levels[level - 1]
+        for parent, device in enumerate(levels[level]):
+            for number, child in enumerate(children(down, up, level, parent)):
+                parent_port, child_port = link_ports(up, level, parent, number)
+                cable_list.append(join_devices(device.interfaces[parent_port],
+                                               lower_devices[child].interfaces[child_port],
+                                               distance_between_racks=distance))
 
-    for core_switch in core_switches:
-        for edge_switch in edge_switches:
-            cable_list.append(
-                join_devices(core_switch, edge_switch, distance_between_racks=Distances.core_to_edge)
-            )
     return cable_list
 
 
-def join_aggregation_with_edge(aggregation_switches, edge_switches, pod_number):
-    cable_list = []
-
-    aggregation_per_pod = len(aggregation_switches) // pod_number
-    edge_per_pod = len(edge_switches) // pod_number
-
-    for pod_id in range(pod_number):
-        aggregation_start = pod_id * aggregation_per_pod
-        aggregation_end = (pod_id + 1) * aggregation_per_pod
-
-        edge_start = pod_id * edge_per_pod
-        edge_end = (pod_id + 1) * edge_per_pod
-
-        aggregation_pod_switches = aggregation_switches[aggregation_start:aggregation_end]
-        edge_pod_switches = edge_switches[edge_start:edge_end]
+class Topology:
+    def __init__(self, size, racks, core_switches, aggregation_switches, edge_switches, hosts, cables):
+        self.size = size
+        self.racks = racks
+        self.core_switches = core_switches
+        self.aggregation_switches = aggregation_switches
+        self.edge_switches = edge_switches
+        self.hosts = hosts
+        self.cables = cables
+
+    def devices(self):
+        return self.core_switches + self.aggregation_switches + self.edge_switches + self.hosts
+
+    def levels(self):
+        # devices of every level of the tree, hosts first
+        return split_levels(self.hosts, self.edge_switches, self.aggregation_switches, self.core_switches,
+                            self.size["level_counts"])
+
+    def cost_table_entities(self):
+        cost_table_entities = {
+            "racks": self.racks,
+            "core_switches": self.core_switches,
+            "aggregation_switches": self.aggregation_switches,
+            "edge_switches": self.edge_switches,
+            "hosts": self.hosts,
+            "cables": self.cables,
+        }
 
-        for agg_r in aggregation_pod_switches:
-            for edge_r in edge_pod_switches:
-                cable_list.append(
-                    join_devices(agg_r, edge_r, distance_between_racks=Distances.aggregation_to_edge)
-                )
+        if self.size["tree_level"] == 2:
+            cost_table_entities.pop("aggregation_switches")
 
-    return cable_list
+        return cost_table_entities
 
 
-def join_edge_with_hosts(edge_switches, host_list):
-    cable_list = []
+def load_config(config_path):
+    with open(config_path) as config_file:
+        return json.load(config_file)
 
-    hosts_per_switch = len(host_list) // len(edge_switches)
-    for id, edge_r in enumerate(edge_switches):
-        for host in host_list[id * hosts_per_switch: (id * hosts_per_switch) + hosts_per_switch]:
-            cable_list.append(
-                join_devices(edge_r, host, distance_between_racks=Distances.edge_to_host)
-            )
 
-    return cable_list
+def size_topology(config):
+    # any number of levels, "oversubscription" optionally sets the downlink to uplink ratio of the switch
+    # levels below the core, edge first (see fat_tree.py)
+    tree_level = config["tree_level"]
+    ports_per_switch = config["ports_per_switch"]
+    rack_height = config["rack_height"]
+    # edge switches per pod, only 2-level trees are split into pods by it (for the per-pod placement) and
+    # are one pod without it; from three levels on a pod is everything below one core port
+    pod_size = config.get("pod_size")
 
+    down, up = tree_shape(tree_level, ports_per_switch, config.get("oversubscription"))
+    counts = level_counts(down, up)
+    core_number = counts[tree_level]
+    host_number = counts[0]
+    edge_number = counts[1]
+    aggregation_number = sum(counts[2:tree_level])
+    total_switches = sum(counts[1:])
 
-def create_topology():
-    config_file = open("L2_config.json")
-    # config_file = open("L3_config.json")
-    config = json.load(config_file)
+    if tree_level == 2:
+        pod_number = int(edge_number // pod_size) if pod_size else 1
+    elif pod_size is not None:
+        raise ValueError(f"pod_size only applies to 2-level trees, the pods of a {tree_level}-level tree follow "
+                         f"its shape; remove it from the config")
+    else:
+        # a pod is everything below one core port
+        pod_number = down[tree_level]
+
+    heights = device_heights(config)
+    devices_units = total_switches * heights["switch"] + host_number * heights["host"]
+    # lower bound, first fit opens more racks when multi-U devices leave gaps
+    rack_number = int(math.ceil(devices_units / rack_height))
+
+    return {
+        "tree_level": tree_level,
+        "ports_per_switch": ports_per_switch,
+        "rack_height": rack_height,
+        "pod_size": pod_size,
+        "core_number": core_number,
+        "aggregation_number": aggregation_number,
+        "edge_number": edge_number,
+        "host_number": host_number,
+        "pod_number": pod_number,
+        "rack_number": rack_number,
+        "switch_height": heights["switch"],
+        "host_height": heights["host"],
+        "down_links": down,
+        "up_links": up,
+        "level_counts": counts,
+    }
 
-    TREE_LEVEL = config["tree_level"]
-    PORTS_PER_SWITCH = config["ports_per_switch"]
 
-    RACK_HEIGHT = config["rack_height"]
+def build_topology(config, placement=None):
+    # pure in-memory build, ids stay None until the topology is provisioned;
+    # placement is an optional placement.Placement that replaces first-fit racking, cables are measured on its
+    # rack layout when it is a measured one
+    topology = create_devices(size_topology(config), placement)
+    topology.cables = wire_topology(topology)
 
+    if placement is not None and placement.measured:
+        measure_cables(topology.cables, placement.layout)
 
-    CORE_NUMBER = pow(PORTS_PER_SWITCH // 2, TREE_LEVEL - 1)
-    HOST_NUMBER = 2 * pow(PORTS_PER_SWITCH // 2, TREE_LEVEL)
-    EDGE_NUMBER = 2 * CORE_NUMBER
-    TOTAL_SWITCHES = (2 * TREE_LEVEL - 1) * CORE_NUMBER
-    AGGREGATION_NUMBER = EDGE_NUMBER if TREE_LEVEL == 3 else 0
-    POD_SIZE = config["pod_size"]
+    return topology
 
-    SWITCH_PRICE = Prices.switch_price
 
-    if TREE_LEVEL == 2:
-        POD_NUMBER = int(EDGE_NUMBER // POD_SIZE)
-    elif TREE_LEVEL == 3:
-        POD_NUMBER = int(EDGE_NUMBER // (POD_SIZE / 2))
+def create_devices(size, placement=None):
+    # racks and devices of a sized topology, not wired yet
+    ports_per_switch = size["ports_per_switch"]
+    switch_price = Prices.switch_price
+    switch_height = size["switch_height"]
 
-    DEVICES_NUMBER = TOTAL_SWITCHES + HOST_NUMBER
-    RACK_NUMBER = int(math.ceil(DEVICES_NUMBER / RACK_HEIGHT))
+    def locations(layer):
+        return placement.layer_locations(layer) if placement is not None else None
 
-    racks = create_racks(rack_num=RACK_NUMBER, rack_height_u=RACK_HEIGHT)
+    if placement is None:
+        racks = create_racks(rack_num=size["rack_number"], rack_height_u=size["rack_height"])
+        allocator = RackAllocator(size["rack_height"], FIRST_FIT)
+    else:
+        racks = create_racks(placement.rack_count, size["rack_height"], coordinates=placement.rack_coordinates)
+        allocator = None
 
     # CORE switches
-    core_switches = create_device_with_ports(CORE_NUMBER, PORTS_PER_SWITCH, "core_switch_", racks, switch_device_type,
-                                             switch_role_id, SWITCH_PRICE)
+    core_switches = create_device_with_ports(size["core_number"], ports_per_switch, "core_switch_", racks,
+                                             switch_price, locations=locations("core"), allocator=allocator,
+                                             height=switch_height)
 
-    # AGGREGATION switches
-    aggregation_switches = create_device_with_ports(AGGREGATION_NUMBER, PORTS_PER_SWITCH, "aggregation_switch_", racks,
-                                                    switch_device_type, switch_role_id, SWITCH_PRICE)
+    # AGGREGATION switches of every level between edge and core, top level first
+    aggregation_switches = create_device_with_ports(size["aggregation_number"], ports_per_switch,
+                                                    "aggregation_switch_", racks, switch_price,
+                                                    locations=locations("aggregation"), allocator=allocator,
+                                                    height=switch_height)
 
     # EDGE switches
-    edge_switches = create_device_with_ports(EDGE_NUMBER, PORTS_PER_SWITCH, "edge_switch_", racks, switch_device_type,
-                                             switch_role_id, SWITCH_PRICE)
+    edge_switches = create_device_with_ports(size["edge_number"], ports_per_switch, "edge_switch_", racks,
+                                             switch_price, locations=locations("edge"), allocator=allocator,
+                                             height=switch_height)
 
     # HOSTS
-    host_list = create_hosts(HOST_NUMBER, racks)
-
-    # JOINING PARTY
-    cable_list = []
-    
-    if TREE_LEVEL == 2:
-        cable_list += join_core_with_edge(core_switches, edge_switches)
-    else:
-        cable_list += join_core_with_aggregation(core_switches, aggregation_switches)
-        cable_list += join_aggregation_with_edge(aggregation_switches, edge_switches, POD_NUMBER)
-    
-    cable_list += join_edge_with_hosts(edge_switches, host_list)
-
-    # PRINT
-    cost_table_entities = {
-        "racks": racks,
-        "core_switches": core_switches,
-        "aggregation_switches": aggregation_switches,
-        "edge_switches": edge_switches,
-        "hosts": host_list,
-        "cables": cable_list,
-    }
-
-    if TREE_LEVEL == 2:
-        cost_table_entities.pop("aggregation_switches")
-
-    print_cost_table(cost_table_entities)
-
-
-def cleanup():
-    client.delete_custom_types()
-    client.delete_devices()
-    client.delete_racks()
-    client.delete_device_types()
-    client.delete_device_roles()
-    client.delete_manufacturers()
-    client.delete_sites()
+    host_list = create_hosts(size["host_number"], racks, locations=locations("hosts"), allocator=allocator,
+                             height=size["host_height"])
 
+    return Topology(size, racks, core_switches, aggregation_switches, edge_switches, host_list, [])
 
-def print_cost_table(entries):
-    grouped_data = {}
-
-    for key, value in entries.items():
-        print("=" * 20)
-        print(key)
-        print("-" * 20)
-
-        grouped_data[key] = {
-            'price': 0,
-            'count': 0,
-        }
 
-        for entry in value:
-            print(entry.price_list_entry())
-
-            grouped_data[key]['pricePerUnit'] = entry.price
-            grouped_data[key]['price'] = grouped_data[key].get('price', 0) + entry.price
-            grouped_data[key]['count'] = grouped_data[key].get('count', 0) + 1
-
-        print("\n")
+def wire_topology(topology):
+    # JOINING PARTY
+    return join_levels(topology.levels(), topology.size["down_links"], topology.size["up_links"])
+
+
+def measure_cables(cables, layout):
+    # replaces the fixed per-layer distances with the distance between the racks of both ends
+    for cable in cables:
+        left_rack = cable.a_interface.device.get_rack()
+        right_rack = cable.b_interface.device.get_rack()
+        if left_rack is not right_rack:
+            cable.set_length(float(layout.cable_length(left_rack.coordinates, right_rack.coordinates)))
+
+
+def setup_reference_data(client, heights=None):
+    # reference objects outlive the topology: they are looked up and only created when missing, and a
+    # repeated run finds all of their ids in the client's reference cache without sending a request
+    heights = heights or DEVICE_HEIGHTS
+    client.get_or_create_custom_field('price', 'decimal', ["dcim.cable", "dcim.devicetype"])
+
+    site_id = client.get_or_create_site(name="site")
+    manufacturer_id_cisco = client.get_or_create_manufacturer(name="cisco")
+    manufacturer_id_dell = client.get_or_create_manufacturer(name="Dell")
+    switch_device_type = client.get_or_create_device_type(name="switch", manufacturer_id=manufacturer_id_cisco,
+                                                          model_name="Cisco ASR 9000 Series",
+                                                          price=Prices.switch_price, u_height=heights["switch"])
+    host_device_type = client.get_or_create_device_type(name="host", manufacturer_id=manufacturer_id_dell,
+                                                        model_name="PowerEdge R450 XS",
+                                                        price=Prices.dell_poweredge_r450_xs, u_height=heights["host"])
+    switch_role_id = client.get_or_create_device_role(name="switch_role")
+    host_role_id = client.get_or_create_device_role(name="host_role")
+
+    return {
+        "site_id": site_id,
+        "device_types": {"switch": switch_device_type, "host": host_device_type},
+        "device_roles": {"switch": switch_role_id, "host": host_role_id},
+    }
 
-    print("=" * 20)
-    print("Summary:")
 
-    for key, value in grouped_data.items():
-        if key != 'cables':
-            print(f"{key}: {value['count']}x {value['pricePerUnit']} = {value['price']}")
+def provision_topology(client, topology, journal=None, plan=None):
+    # plan is the cabling_plan.CablingPlan of topology, the cable requests are then built from its columns
+    heights = {"switch": topology.size["switch_height"], "host": topology.size["host_height"]}
+    # a failed run may have stopped anywhere in the reference data, get-or-create picks it up from there
+    with client.metrics.phase("reference data"):
+        references = setup_reference_data(client, heights)
+
+    # every phase only depends on ids from the previous one, so objects inside a phase are sent
+    # in parallel batches regardless of the layer they belong to
+    devices = topology.devices()
+
+    with client.metrics.phase("racks"):
+        provision_racks(client, references, topology.racks, journal)
+    with client.metrics.phase("devices"):
+        provision_devices(client, references, devices, journal)
+    with client.metrics.phase("interfaces"):
+        provision_interfaces(client, devices, journal)
+    with client.metrics.phase("cabling"):
+        if plan is None:
+            provision_cables(client, topology.cables, journal)
         else:
-            total_cable_length = {}
-            prices_of_cables = {}
-
-            for cable in entries['cables']:
-                cable_type = cable.cableType
-                prices_of_cables[cable_type] = cable.pricePerMeter
+            # imported here because the cabling plan module builds on this one
+            from cabling_plan import provision_cabling_plan
+
+            provision_cabling_plan(client, topology, plan, journal)
+
+
+def create_topology(config_path="L2_config.json", dry_run=False, optimize_placement=False, rack_policy=FIRST_FIT,
+                    sync=False, resume=False, journal_path=JOURNAL_PATH, quiet=False, metrics=None,
+                    reference_cache_path=REFERENCE_CACHE_PATH, report_path=None, report_format=None,
+                    summary_only=False, workers=PROVISIONING_WORKERS, host=NETBOX_HOST):
+    # quiet prints the cost summary instead of every object; metrics collects request statistics and
+    # the time spent in every phase, pass a Metrics instance to read them afterwards;
+    # reference_cache_path=None keeps the ids of reference objects in memory only; report_path writes the cost
+    # report to a file instead of stdout, which then only gets the summary; workers is the number of parallel
+    # requests; host is the NetBox server
+    metrics = metrics if metrics is not None else Metrics()
+    config = load_config(config_path)
+    placement = None
+
+    with metrics.phase("placement"):
+        if optimize_placement:
+            # imported here because the placement module builds on this one
+            from placement import optimize_placement as find_placement
+
+            placement, report = find_placement(config)
+            print(f"Placement: {report['best']}, saves {report['saved_meters']:.0f}m of cable and "
+                  f"{report['saved_money']} compared to first fit")
+        elif rack_policy != FIRST_FIT:
+            from placement import policy_placement
+
+            placement = policy_placement(size_topology(config), rack_policy)
+
+    with metrics.phase("build"):
+        topology = build_topology(config, placement)
+
+    if not dry_run:
+        client = NetboxClient(workers=workers, host=host, quiet=quiet, metrics=metrics,
+                              reference_cache_path=reference_cache_path)
+        client.auth()
+
+        if sync:
+            # imported here because the sync module builds on this one
+            from sync import sync_topology, print_sync_report
+
+            sync_start = time.perf_counter()
+            with metrics.phase("sync"):
+                report = sync_topology(client, topology)
+            print_sync_report(report, time.perf_counter() - sync_start)
+        else:
+            from cabling_plan import build_cabling_plan
+            from plan_cache import numeric_attributes
+
+            # prices and lengths are part of what is provisioned, a changed price list starts a new run
+            provision_journaled(client, topology, journal_path, resume, inputs={
+                "config": config, "optimize_placement": optimize_placement, "rack_policy": rack_policy,
+                "prices": numeric_attributes(Prices), "distances": numeric_attributes(Distances),
+            }, plan=build_cabling_plan(config, placement=placement))
+
+    with metrics.phase("costing"):
+        detailed = not (quiet or summary_only)
+        if report_path is not None:
+            bom = write_cost_report(topology.cost_table_entities(), report_path, report_format,
+                                    detailed=not summary_only)
+            print_cost_summary(bom)
+        else:
+            write_cost_report(topology.cost_table_entities(), report_format=report_format, detailed=detailed)
+    return topology
 
-                if cable_type not in total_cable_length:
-                    total_cable_length[cable_type] = 0
 
-                total_cable_length[cable_type] = total_cable_length.get(cable_type, 0) + cable.length
+def provision_journaled(client, topology, journal_path, resume, inputs, plan=None):
+    # a resumed run keeps everything the journal lists, a new run starts without racks and devices
+    journal = ProvisioningJournal(journal_path)
+    try:
+        if resume:
+            print(f"Resuming with {journal.resume(inputs)} objects from {journal_path}")
+        else:
+            with client.metrics.phase("cleanup"):
+                cleanup(client, reference_data=False)
+            journal.start(inputs)
+        provision_topology(client, topology, journal, plan)
+    finally:
+        journal.close()
+
+
+def cleanup(client, reference_data=True):
+    # NetBox refuses to delete objects that are still referenced, so every stage waits for the previous one;
+    # resource types inside a stage do not reference each other and are deleted concurrently.
+    # Without reference_data the custom field, site, manufacturers, device types and roles are kept
+    if reference_data:
+        cleanup_stages = [
+            {"custom fields": client.delete_custom_types, "devices": client.delete_devices},
+            {"racks": client.delete_racks, "device types": client.delete_device_types,
+             "device roles": client.delete_device_roles},
+            {"manufacturers": client.delete_manufacturers, "sites": client.delete_sites},
+        ]
+    else:
+        cleanup_stages = [{"devices": client.delete_devices}, {"racks": client.delete_racks}]
 
-            for cable_type, length in total_cable_length.items():
-                print(f"{cable_type}: {length}m x {prices_of_cables[cable_type]}")
+    cleanup_start = time.perf_counter()
+    report = {}
+    for stage in cleanup_stages:
+        results = client.map_concurrently(timed_call, list(stage.values()))
+        report.update(zip(stage.keys(), results))
 
     print("=" * 20)
-    print("Total cost: ", round(sum([value['price'] for value in grouped_data.values()]), 2))
+    print("Cleanup:")
+    for resource, (count, duration) in report.items():
+        print(f"{resource}: {count} deleted in {duration:.2f} s")
+    print(f"Cleanup took {time.perf_counter() - cleanup_start:.2f} s")
+    print("=" * 20)
 
 
-# create netbox client
-client = NetboxClient()
-client.auth()
+def timed_call(function):
+    start = time.perf_counter()
+    result = function()
+    return result, time.perf_counter() - start
 
-cleanup()
 
-# setup project
-client.create_custom_field('price', 'decimal', ["dcim.cable", "dcim.devicetype"])
+def bill_of_materials(entries):
+    # entries maps a category to its priced objects, any iterable works and is consumed once
+    return stream_cost_report(entries)
 
-site_id = client.create_site(name="site")
-manufacturer_id_cisco = client.create_manufacturer(name="cisco")
-manufacturer_id_dell = client.create_manufacturer(name="Dell")
-switch_device_type = client.create_device_type(name="switch", manufacturer_id=manufacturer_id_cisco,
-                                               model_name="Cisco ASR 9000 Series")
-host_device_type = client.create_device_type(name="host", manufacturer_id=manufacturer_id_dell,
-                                             model_name="PowerEdge R450 XS", price=Prices.dell_poweredge_r450_xs)
-switch_role_id = client.create_device_role(name="switch_role")
-host_role_id = client.create_device_role(name="host_role")
 
-create_topology()
+def print_cost_table(entries):
+    write_cost_report(entries)
+
+
+def print_cost_summary(bom):
+    TextReportWriter(sys.stdout).write_summary(bom)
+
+
+def main():
+    # the options are the argument groups of cli.py provision and cost (imported here because cli builds on this
+    # module), only --dry-run and --profile are added
+    from cli import input_arguments, netbox_arguments, provision_arguments, report_arguments
+
+    parser = argparse.ArgumentParser(description="Create a fat tree topology in NetBox and print its cost", parents=[
+        input_arguments(), netbox_arguments(), provision_arguments(), report_arguments()])
+    parser.add_argument("--dry-run", action="store_true",
+                        help="build the topology in memory and print its cost without contacting NetBox")
+    parser.add_argument("--profile", help="run under cProfile and write the stats to this file")
+    args = parser.parse_args()
+    metrics = Metrics()
+    profiler = cProfile.Profile() if args.profile else None
+    try:
+        # the price and distance files replace the defaults of Prices and Distances
+        loadPrices(args.prices)
+        loadDistances(args.distances)
+        if profiler is not None:
+            profiler.enable()
+        create_topology(args.config, dry_run=args.dry_run, optimize_placement=args.optimize_placement,
+                        rack_policy=args.rack_policy, sync=args.sync, resume=args.resume, journal_path=args.journal,
+                        quiet=args.quiet, metrics=metrics,
+                        reference_cache_path=None if args.no_reference_cache else args.reference_cache,
+                        report_path=args.report, report_format=args.report_format, summary_only=args.summary_only,
+                        workers=args.workers, host=args.host)
+    except NetboxError as error:
+        print(error)
+        print("Provisioning stopped, run again with --resume to continue where it failed")
+        sys.exit(1)
+    except (ValueError, OSError) as error:
+        # e.g. an unsupported config, a missing price file or a journal written for another topology
+        print(error)
+        sys.exit(1)
+    finally:
+        if args.metrics:
+            metrics.write(args.metrics, args.metrics_format)
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(args.profile)
+            pstats.Stats(profiler).sort_stats("cumulative").print_stats(20)
+
+
+if __name__ == "__main__":
+    main()
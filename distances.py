@@ -1,15 +1,21 @@
 import json, sys
 
+DISTANCES_PATH = "distances.json"
+
 class Distances:
     core_to_aggregation = 100
     core_to_edge = 150
     aggregation_to_edge = 20
     edge_to_host = 10
 
-def loadDistances():
-    with open('distances.json') as json_file:
+def loadDistances(path=DISTANCES_PATH):
+    # replaces the defaults of the class, for every user of the module
+    with open(path) as json_file:
         data = json.load(json_file)
         for key in data:
             setattr(Distances, key, data[key])
 
-loadDistances()
\ No newline at end of file
+def loadDistancesFile(path):
+    # alternate distances as a Distances subclass, the global Distances stay untouched
+    with open(path) as json_file:
+        return type("Distances", (Distances,), json.load(json_file))
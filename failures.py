@@ -0,0 +1,359 @@
+import argparse
+import csv
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from analysis import from_cabling_plan, expand, link_ends, layer_starts, pod_of
+from cabling_plan import build_cabling_plan
+from compact import DEVICE_PREFIXES
+from create_topology import load_config
+from metrics import percentile, PERCENTILES
+
+TRIAL_COLUMNS = [
+    "trial", "failed_links", "failed_hosts", "lost_pairs", "lost_share", "mean_paths", "min_paths",
+    "path_diversity", "mean_hops", "max_hops", "bisection_links", "capacity",
+]
+SUMMARY_METRICS = ["lost_share", "path_diversity", "capacity", "mean_hops"]
+
+# the intact tree of every worker process, built once when the process starts
+worker_state = None
+
+
+class FailureState:
+    # Routing state of a tree with failed links, following up/down (valley-free) paths like ECMP does in a fat
+    # tree. up[l][e, x] is the number of alive upward paths from edge switch e to switch x of level l,
+    # pair_paths[l] = up[l] @ up[l].T the number of paths between two edge switches that turn at level l and
+    # links[l][x, y] the number of alive links between switch x of level l and switch y of level l + 1.
+    # A failed link only takes paths away from the edge switches below it towards the switches above it, so it
+    # is applied as a rank-one update of those rows and columns, the host pairs of the touched edge switches
+    # are the only ones evaluated again and restore() undoes the changes for the next trial.
+    def __init__(self, graph):
+        self.graph = graph
+        tree_level = graph.tree_level
+        counts = graph.size["level_counts"]
+
+        self.link_level, self.link_lower, self.link_upper = link_ends(graph)
+        self.link_alive = np.ones(graph.link_count, dtype=bool)
+
+        host_links = self.link_level == 0
+        self.host_edge = np.zeros(counts[0], dtype=np.int64)
+        self.host_edge[self.link_lower[host_links]] = self.link_upper[host_links]
+        self.host_alive = np.zeros(counts[0], dtype=bool)
+        self.host_alive[self.link_lower[host_links]] = True
+
+        self.links = [None] * tree_level
+        for level in range(1, tree_level):
+            at_level = self.link_level == level
+            self.links[level] = np.zeros((counts[level], counts[level + 1]))
+            np.add.at(self.links[level], (self.link_lower[at_level], self.link_upper[at_level]), 1)
+
+        self.up = [None, np.eye(counts[1])]
+        self.pair_paths = [None, None]
+        for level in range(2, tree_level + 1):
+            self.up.append(self.up[level - 1] @ self.links[level - 1])
+            self.pair_paths.append(self.up[level] @ self.up[level].T)
+
+        # both pod halves of every level below the core for the bisection cut, see analysis.bisection
+        pods = graph.size["down_links"][tree_level]
+        first_half = [pod_of(graph, graph.level_devices(level)) < pods // 2 for level in range(tree_level)]
+        self.halves = [first_half, [~half for half in first_half]]
+
+        # (array, index, values) of every change since the intact state and the edge switches they touched
+        self.changes = []
+        self.dirty = np.zeros(counts[1], dtype=bool)
+        self.intact_pair_paths = [None if matrix is None else matrix.copy() for matrix in self.pair_paths]
+        self.intact_attached = self.attached()
+        every_edge = np.arange(counts[1])
+        self.intact_groups = self.route(self.intact_pair_paths, self.intact_attached, every_edge, every_edge)
+        self.intact_result = self.evaluate()
+
+    def change(self, array, index, values):
+        self.changes.append((array, index, np.copy(array[index])))
+        array[index] = values
+
+    def restore(self):
+        # back to the intact tree, in reverse order of the changes
+        for array, index, values in reversed(self.changes):
+            array[index] = values
+        self.changes = []
+        self.dirty[:] = False
+
+    def fail_link(self, link):
+        if not self.link_alive[link]:
+            return
+        self.change(self.link_alive, link, False)
+
+        level, lower, upper = self.link_level[link], self.link_lower[link], self.link_upper[link]
+        if level == 0:
+            self.change(self.host_alive, lower, False)
+            self.dirty[self.host_edge[lower]] = True
+            return
+        self.change(self.links[level], (lower, upper), self.links[level][lower, upper] - 1)
+
+        # the paths through the link: every edge switch below it times every upward path above it
+        rows = np.flatnonzero(self.up[level][:, lower])
+        below = self.up[level][rows, lower]
+        columns, above = np.array([upper]), np.ones(1)
+        self.dirty[rows] = True
+        for top in range(level + 1, self.graph.tree_level + 1):
+            if top > level + 1:
+                reach = above @ self.links[top - 1][columns]
+                columns = np.flatnonzero(reach)
+                above = reach[columns]
+            if not len(rows) or not len(columns):
+                break
+
+            shared = self.up[top][:, columns] @ above
+            block = np.ix_(rows, columns)
+            self.change(self.up[top], block, self.up[top][block] - np.outer(below, above))
+            pair_paths = self.pair_paths[top]
+            self.change(pair_paths, (rows, slice(None)), pair_paths[rows] - np.outer(below, shared))
+            self.change(pair_paths, (slice(None), rows), pair_paths[:, rows] - np.outer(shared, below))
+            block = np.ix_(rows, rows)
+            self.change(pair_paths, block, pair_paths[block] + (above @ above) * np.outer(below, below))
+
+    def fail_device(self, device):
+        _, _, links = expand(self.graph, np.array([device]))
+        for link in links:
+            self.fail_link(link)
+        if self.graph.device_level[device] == 0 and self.host_alive[self.graph.level_index[device]]:
+            host = self.graph.level_index[device]
+            self.change(self.host_alive, host, False)
+            self.dirty[self.host_edge[host]] = True
+
+    def fail_rack(self, rack):
+        if self.graph.device_rack is None:
+            raise ValueError("The topology has no rack placement")
+        for device in np.flatnonzero(self.graph.device_rack == rack):
+            self.fail_device(device)
+
+    def attached(self):
+        # alive hosts of every edge switch
+        return np.bincount(self.host_edge[self.host_alive], minlength=len(self.dirty)).astype(np.float64)
+
+    def route(self, pair_paths, attached, rows, columns):
+        # host pairs, their summed paths and the fewest paths by hop count for the edge switches rows x columns;
+        # hosts on the same edge switch have one 2-hop path, other pairs turn at the lowest level with a path
+        same_edge = rows[:, None] == columns
+        weights = np.outer(attached[rows], attached[columns]) - same_edge * attached[rows][:, None]
+        groups = {2: [weights[same_edge].sum(), weights[same_edge].sum(), 1]}
+
+        routed = same_edge | (weights == 0)
+        for level in range(2, self.graph.tree_level + 1):
+            block = pair_paths[level][np.ix_(rows, columns)]
+            turns = (block > 0) & ~routed
+            routed |= turns
+            paths = block[turns]
+            groups[2 * level] = [weights[turns].sum(), (weights[turns] * paths).sum(),
+                                 paths.min() if len(paths) else np.inf]
+        return groups
+
+    def evaluate(self):
+        # the pairs of untouched edge switches keep their intact numbers, those with a touched one are
+        # subtracted as they were and added as they are now (both rows and columns, so twice the rows minus
+        # the block of touched pairs)
+        dirty = np.flatnonzero(self.dirty)
+        every_edge = np.arange(len(self.dirty))
+        attached = self.attached()
+
+        before = self.route(self.intact_pair_paths, self.intact_attached, dirty, every_edge)
+        before_block = self.route(self.intact_pair_paths, self.intact_attached, dirty, dirty)
+        after = self.route(self.pair_paths, attached, dirty, every_edge)
+        after_block = self.route(self.pair_paths, attached, dirty, dirty)
+
+        pairs = path_sum = hop_sum = 0
+        min_paths, max_hops = np.inf, 0
+        for hops, (intact_pairs, intact_paths, intact_min) in self.intact_groups.items():
+            untouched = intact_pairs - 2 * before[hops][0] + before_block[hops][0]
+            touched = 2 * after[hops][0] - after_block[hops][0]
+            hop_pairs = untouched + touched
+            pairs += hop_pairs
+            path_sum += intact_paths - 2 * before[hops][1] + before_block[hops][1]
+            path_sum += 2 * after[hops][1] - after_block[hops][1]
+            hop_sum += hops * hop_pairs
+            # all pairs turning at a level of the intact tree have the same number of paths
+            if untouched > 0:
+                min_paths = min(min_paths, intact_min)
+            if touched > 0:
+                min_paths = min(min_paths, after[hops][2])
+            if hop_pairs > 0:
+                max_hops = max(max_hops, hops)
+
+        hosts = len(self.host_alive)
+        all_pairs = hosts * (hosts - 1)
+        return {
+            "failed_links": int(np.count_nonzero(~self.link_alive)),
+            "failed_hosts": int(np.count_nonzero(~self.host_alive)),
+            "lost_pairs": int(round(all_pairs - pairs)),
+            "lost_share": 1 - pairs / all_pairs if all_pairs else 0,
+            "mean_paths": path_sum / pairs if pairs else 0,
+            "min_paths": int(min_paths) if pairs else 0,
+            "mean_hops": hop_sum / pairs if pairs else 0,
+            "max_hops": max_hops,
+            "bisection_links": self.bisection_links(),
+        }
+
+    def bisection_links(self):
+        # alive uplinks of either half of the pods, cut at the weakest level
+        cuts = []
+        for half in self.halves:
+            cuts.append(np.count_nonzero(self.host_alive & half[0]))
+            for level in range(1, self.graph.tree_level):
+                cuts.append(self.links[level][half[level]].sum())
+        return int(min(cuts))
+
+
+def evaluate_failures(state, links=(), devices=(), racks=()):
+    # applies the failures to the intact state, evaluates them against it and restores it
+    try:
+        for link in links:
+            state.fail_link(link)
+        for device in devices:
+            state.fail_device(device)
+        for rack in racks:
+            state.fail_rack(rack)
+        return compare(state.evaluate(), state.intact_result)
+    finally:
+        state.restore()
+
+
+def compare(result, intact):
+    result["path_diversity"] = result["mean_paths"] / intact["mean_paths"] if intact["mean_paths"] else 0
+    result["capacity"] = result["bisection_links"] / intact["bisection_links"] if intact["bisection_links"] else 0
+    return result
+
+
+def random_failures(graph, rng, links=0, switches=0, racks=0):
+    # distinct links, switches and racks, drawn uniformly
+    switch_devices = np.flatnonzero(graph.device_level > 0)
+    rack_numbers = np.unique(graph.device_rack) if racks else ()
+    return {
+        "links": rng.choice(graph.link_count, links, replace=False) if links else (),
+        "devices": rng.choice(switch_devices, switches, replace=False) if switches else (),
+        "racks": rng.choice(rack_numbers, racks, replace=False) if racks else (),
+    }
+
+
+def start_worker(config):
+    global worker_state
+    worker_state = FailureState(from_cabling_plan(build_cabling_plan(config)))
+
+
+def run_trials(task):
+    # every trial draws from its own seed, so the results do not depend on the number of workers
+    failure_counts, trials = task
+    results = []
+    for trial in trials:
+        failures = random_failures(worker_state.graph, np.random.default_rng(trial), **failure_counts)
+        results.append(dict(evaluate_failures(worker_state, **failures), trial=trial))
+    return results
+
+
+def monte_carlo(config, trials, links=0, switches=0, racks=0, workers=None, seed=0, chunk_size=16):
+    failure_counts = {"links": links, "switches": switches, "racks": racks}
+    tasks = [(failure_counts, range(seed + start, seed + min(start + chunk_size, trials)))
+             for start in range(0, trials, chunk_size)]
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=start_worker, initargs=(config,)) as executor:
+        for results in executor.map(run_trials, tasks):
+            yield from results
+
+
+def summarize(results):
+    summary = {"trials": len(results)}
+    for metric in SUMMARY_METRICS:
+        values = sorted([result[metric] for result in results])
+        summary[metric] = {"mean": sum(values) / len(values) if values else None, "min": values[0] if values else None,
+                           "max": values[-1] if values else None}
+        summary[metric].update({f"p{percent}": percentile(values, percent) for percent in PERCENTILES})
+    summary["worst"] = max(results, key=lambda result: result["lost_share"]) if results else None
+    return summary
+
+
+def parse_elements(graph, names):
+    # NetBox names of devices ("core_switch_1"), racks ("rack_0") and cables in creation order ("link_0")
+    size = graph.size
+    layer_counts = [size["core_number"], size["aggregation_number"], size["edge_number"], size["host_number"]]
+    starts = layer_starts(size)
+
+    elements = {"links": [], "devices": [], "racks": []}
+    for name in names:
+        prefix, _, number = name.rpartition("_")
+        if not number.isdigit():
+            raise ValueError(f"Unknown element: {name}")
+        number = int(number)
+
+        if prefix == "link" and number < graph.link_count:
+            elements["links"].append(number)
+        elif prefix == "rack" and graph.device_rack is not None and number in graph.device_rack:
+            elements["racks"].append(number)
+        elif prefix + "_" in DEVICE_PREFIXES and 0 < number <= layer_counts[DEVICE_PREFIXES.index(prefix + "_")]:
+            elements["devices"].append(starts[DEVICE_PREFIXES.index(prefix + "_")] + number - 1)
+        else:
+            raise ValueError(f"Unknown element: {name}")
+    return elements
+
+
+def print_result(name, result):
+    print(f"{name}: {result['lost_pairs']} host pairs lost ({result['lost_share']:.4%}), "
+          f"paths {result['mean_paths']:.3f} ({result['path_diversity']:.2%} of intact, min {result['min_paths']}), "
+          f"hops {result['mean_hops']:.3f} (max {result['max_hops']}), "
+          f"bisection {result['bisection_links']} links ({result['capacity']:.2%})")
+
+
+def print_summary(summary):
+    print(f"{summary['trials']} trials")
+    print("=" * 20)
+    for metric in SUMMARY_METRICS:
+        values = summary[metric]
+        print(f"{metric}: mean {values['mean']:.4g}, min {values['min']:.4g}, "
+              + ", ".join([f"p{percent} {values[f'p{percent}']:.4g}" for percent in PERCENTILES])
+              + f", max {values['max']:.4g}")
+    if summary["worst"] is not None:
+        print("=" * 20)
+        print_result(f"worst trial {summary['worst']['trial']}", summary["worst"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate link, switch and rack failures of a fat tree")
+    parser.add_argument("--config", default="L2_config.json")
+    parser.add_argument("--fail", nargs="+", metavar="NAME",
+                        help="fail these devices, racks (rack_0) and cables (link_0) instead of random trials")
+    parser.add_argument("--links", type=int, default=0, help="random links failed in every trial")
+    parser.add_argument("--switches", type=int, default=0, help="random switches failed in every trial")
+    parser.add_argument("--racks", type=int, default=0, help="random racks failed in every trial")
+    parser.add_argument("--trials", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, help="number of processes, all cores by default")
+    parser.add_argument("--output", help="CSV file with one row per trial")
+    args = parser.parse_args()
+
+    config = load_config(args.config)
+    start = time.perf_counter()
+
+    if args.fail:
+        intact = FailureState(from_cabling_plan(build_cabling_plan(config)))
+        for name in args.fail:
+            print_result(name, evaluate_failures(intact, **parse_elements(intact.graph, [name])))
+        if len(args.fail) > 1:
+            print_result("all", evaluate_failures(intact, **parse_elements(intact.graph, args.fail)))
+    else:
+        if not (args.links or args.switches or args.racks):
+            parser.error("give --fail or the number of --links, --switches or --racks to fail per trial")
+
+        results = list(monte_carlo(config, args.trials, args.links, args.switches, args.racks, args.workers,
+                                   args.seed))
+        if args.output:
+            with open(args.output, "w", newline="") as output:
+                writer = csv.DictWriter(output, fieldnames=TRIAL_COLUMNS, extrasaction="ignore")
+                writer.writeheader()
+                writer.writerows(results)
+        print_summary(summarize(results))
+
+    print(f"simulated in {time.perf_counter() - start:.3f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,307 @@
+import argparse
+import itertools
+import json
+import random
+import re
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs, urlencode
+
+# the endpoints NetboxClient talks to
+ENDPOINTS = {
+    "users/tokens", "extras/custom-fields", "dcim/sites", "dcim/manufacturers", "dcim/device-types",
+    "dcim/device-roles", "dcim/racks", "dcim/devices", "dcim/interfaces", "dcim/cables",
+}
+# fields that reference another object and the endpoint it lives in, NetBox nests them in responses
+RELATIONS = {
+    "dcim/device-types": {"manufacturer": "dcim/manufacturers"},
+    "dcim/racks": {"site": "dcim/sites"},
+    "dcim/devices": {"device_type": "dcim/device-types", "device_role": "dcim/device-roles", "site": "dcim/sites",
+                     "rack": "dcim/racks"},
+    "dcim/interfaces": {"device": "dcim/devices"},
+}
+DEFAULT_PAGE_SIZE = 50
+URL_PATTERN = re.compile(r"^/api/(?P<endpoint>[a-z]+/[a-z-]+)/(?:(?P<id>\d+)/?)?(?P<action>provision/)?$")
+
+
+class FakeNetbox:
+    # In-process stand-in for the NetBox REST API: objects live in dictionaries, list endpoints accept
+    # single objects and lists, GETs are paginated and filtered like in NetBox. latency is added to every
+    # request and error_rate of the requests fail with 503 (the seed makes the failures repeatable).
+    # lost_response_rate of the creates are stored but answered with 502, like by a proxy that timed out.
+    def __init__(self, port=0, latency=0.0, error_rate=0.0, seed=0, lost_response_rate=0.0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.lost_response_rate = lost_response_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.objects = {endpoint: {} for endpoint in ENDPOINTS}
+        # (endpoint, field, value) of every unique value that is taken
+        self.unique = {}
+        self.ids = itertools.count(1)
+        self.request_counts = {}
+        self.failed_requests = 0
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), self.handler_class())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    @property
+    def request_count(self):
+        return sum(self.request_counts.values())
+
+    def start(self):
+        # a short poll interval keeps stop() quick
+        self.thread = threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def reset_counts(self):
+        with self.lock:
+            self.request_counts = {}
+            self.failed_requests = 0
+
+    def handler_class(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # headers and body are separate writes, without this every response waits for a delayed ACK
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                self.dispatch("GET")
+
+            def do_POST(self):
+                self.dispatch("POST")
+
+            def do_PATCH(self):
+                self.dispatch("PATCH")
+
+            def do_DELETE(self):
+                self.dispatch("DELETE")
+
+            def dispatch(self, method):
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length)) if length else None
+                status, data = fake.handle(method, self.path, body)
+
+                payload = b"" if data is None else json.dumps(data).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+        return Handler
+
+    def handle(self, method, path, body):
+        if self.latency:
+            time.sleep(self.latency)
+
+        url = urlparse(path)
+        match = URL_PATTERN.match(url.path)
+        with self.lock:
+            self.request_counts[method] = self.request_counts.get(method, 0) + 1
+            if self.error_rate and self.random.random() < self.error_rate:
+                self.failed_requests += 1
+                return 503, {"detail": "Service unavailable"}
+            if match is None or match["endpoint"] not in ENDPOINTS:
+                return 404, {"detail": "Not found."}
+
+            endpoint = match["endpoint"]
+            if endpoint == "users/tokens":
+                return 201, {"id": next(self.ids), "display": "0123456789abcdef", "key": "0123456789abcdef"}
+            if method == "GET":
+                return 200, self.list_objects(endpoint, url)
+            if method == "POST":
+                response = self.create_objects(endpoint, body)
+            elif method == "PATCH":
+                response = self.update_objects(endpoint, body)
+            else:
+                object_ids = [int(match["id"])] if match["id"] else [item["id"] for item in body]
+                response = self.delete_objects(endpoint, object_ids)
+            if method == "POST" and self.lost_response_rate and self.random.random() < self.lost_response_rate:
+                self.failed_requests += 1
+                return 502, {"detail": "Bad gateway"}
+            return response
+
+    def list_objects(self, endpoint, url):
+        # a filter given several times matches any of its values
+        query = parse_qs(url.query)
+        limit = int(query.pop("limit", [DEFAULT_PAGE_SIZE])[0])
+        offset = int(query.pop("offset", [0])[0])
+        brief = query.pop("brief", ["false"])[0] == "true"
+
+        matches = [item for item in self.objects[endpoint].values() if self.matches(endpoint, item, query)]
+        page = [self.represent(endpoint, item, brief) for item in matches[offset:offset + limit]]
+
+        next_url = None
+        if offset + limit < len(matches):
+            next_url = f"{self.url}{url.path}?" + urlencode(dict(query, limit=limit, offset=offset + limit),
+                                                               doseq=True)
+        return {"count": len(matches), "next": next_url, "previous": None, "results": page}
+
+    def matches(self, endpoint, item, query):
+        for key, values in query.items():
+            if key == "site_id":
+                actual = [self.site_of(endpoint, item)]
+            elif endpoint == "dcim/cables" and key == "interface_id":
+                actual = [item["a_terminations"][0]["object_id"], item["b_terminations"][0]["object_id"]]
+            elif key.endswith("_id"):
+                actual = [item.get(key[:-3])]
+            else:
+                actual = [item.get(key)]
+            if not any(str(value) in values for value in actual):
+                return False
+        return True
+
+    def site_of(self, endpoint, item):
+        if endpoint == "dcim/interfaces":
+            return self.objects["dcim/devices"][item["device"]]["site"]
+        if endpoint == "dcim/cables":
+            interface = self.objects["dcim/interfaces"].get(item["a_terminations"][0]["object_id"])
+            return None if interface is None else self.site_of("dcim/interfaces", interface)
+        return item.get("site")
+
+    def represent(self, endpoint, item, brief=False):
+        if brief:
+            return {"id": item["id"], "display": item.get("name", str(item["id"]))}
+
+        representation = dict(item)
+        for field, related_endpoint in RELATIONS.get(endpoint, {}).items():
+            related = self.objects[related_endpoint].get(item.get(field))
+            if related is not None:
+                representation[field] = {"id": related["id"], "name": related.get("name")}
+        if endpoint == "dcim/devices":
+            representation["role"] = representation["device_role"]
+        if endpoint == "dcim/interfaces":
+            representation["type"] = {"value": item["type"]}
+        return representation
+
+    def create_objects(self, endpoint, body):
+        items = body if isinstance(body, list) else [body]
+        created = [dict(item, id=next(self.ids)) for item in items]
+
+        # a bulk request is one transaction in NetBox, either all objects are stored or none
+        for index, item in enumerate(created):
+            error = self.conflict(endpoint, item)
+            if error is not None:
+                for stored in created[:index]:
+                    self.remove(endpoint, stored)
+                return 400, error
+            self.store(endpoint, item)
+
+        created = [self.represent(endpoint, item) for item in created]
+        return 201, created if isinstance(body, list) else created[0]
+
+    def update_objects(self, endpoint, body):
+        # changes are applied one after another and all of them are rolled back when one fails
+        originals = []
+        for change in body:
+            current = self.objects[endpoint].get(change["id"])
+            if current is None:
+                return self.rollback(endpoint, originals, (404, {"detail": "Not found."}))
+
+            self.remove(endpoint, current)
+            updated = dict(current, **change)
+            error = self.conflict(endpoint, updated)
+            if error is not None:
+                self.store(endpoint, current)
+                return self.rollback(endpoint, originals, (400, error))
+            self.store(endpoint, updated)
+            originals.append(current)
+
+        return 200, [self.represent(endpoint, self.objects[endpoint][change["id"]]) for change in body]
+
+    def rollback(self, endpoint, originals, response):
+        for original in reversed(originals):
+            self.remove(endpoint, self.objects[endpoint][original["id"]])
+            self.store(endpoint, original)
+        return response
+
+    def unique_keys(self, endpoint, item):
+        # what NetBox keeps unique: slugs and names of reference objects, rack names and occupied rack units
+        if endpoint == "dcim/devices":
+            if item.get("rack") is None or item.get("position") is None:
+                return []
+            return [("position", (item["rack"], item["position"]))]
+        if endpoint in ("dcim/interfaces", "dcim/cables"):
+            return []
+        return [(field, item[field]) for field in ("slug", "name") if field in item]
+
+    def conflict(self, endpoint, item):
+        for field, value in self.unique_keys(endpoint, item):
+            if (endpoint, field, value) in self.unique:
+                return {field: [f"{endpoint} with this {field} already exists."]}
+        return None
+
+    def store(self, endpoint, item):
+        self.objects[endpoint][item["id"]] = item
+        for field, value in self.unique_keys(endpoint, item):
+            self.unique[(endpoint, field, value)] = item["id"]
+
+    def remove(self, endpoint, item):
+        self.objects[endpoint].pop(item["id"])
+        for field, value in self.unique_keys(endpoint, item):
+            self.unique.pop((endpoint, field, value), None)
+
+    def delete_objects(self, endpoint, object_ids):
+        if any(object_id not in self.objects[endpoint] for object_id in object_ids):
+            return 404, {"detail": "Not found."}
+
+        for object_id in object_ids:
+            self.remove(endpoint, self.objects[endpoint][object_id])
+        # like NetBox, deleting a device deletes its interfaces and their cables
+        if endpoint == "dcim/devices":
+            removed = set(object_ids)
+            interfaces = [interface["id"] for interface in self.objects["dcim/interfaces"].values()
+                          if interface["device"] in removed]
+            self.delete_objects("dcim/interfaces", interfaces)
+        if endpoint == "dcim/interfaces":
+            removed = set(object_ids)
+            cables = [cable["id"] for cable in self.objects["dcim/cables"].values()
+                      if cable["a_terminations"][0]["object_id"] in removed
+                      or cable["b_terminations"][0]["object_id"] in removed]
+            for cable_id in cables:
+                self.remove("dcim/cables", self.objects["dcim/cables"][cable_id])
+        return 204, None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a fake NetBox API for local runs and benchmarks")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every request")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with 503")
+    parser.add_argument("--lost-response-rate", type=float, default=0.0,
+                        help="share of creates that are stored but answered with 502")
+    args = parser.parse_args()
+
+    fake = FakeNetbox(args.port, args.latency, args.error_rate, lost_response_rate=args.lost_response_rate)
+    print(f"Fake NetBox listening on {fake.url}")
+    try:
+        fake.server.serve_forever()
+    except KeyboardInterrupt:
+        fake.server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+import math
+
+# Shape of a k-ary n-tree with tree_level switch levels. Level 0 are the hosts, level 1 the edge switches,
+# levels 2 .. tree_level - 1 aggregation switches and level tree_level the core. down[level] is the number of
+# links of every node of a level to the level below and up[level] to the level above. Without oversubscription
+# every switch below the core has ports_per_switch / 2 links in both directions and the core uses all of its
+# ports downwards, so tree_level 2 and 3 give the classic two-tier leaf-spine and three-tier k-ary fat tree.
+#
+# Nodes of a level are numbered pod by pod. A node at level l has the digits
+# (a[n], ..., a[l + 1], b[1], ..., b[l]) with a[i] < down[i] and b[i] < up[i - 1], most significant first;
+# its parents at level l + 1 replace a[l + 1] by every value of b[l + 1].
+
+
+def oversubscription_ratios(oversubscription, tree_level):
+    # one ratio of downlinks to uplinks per switch level below the core, edge first; a single number
+    # only oversubscribes the edge, missing levels are not oversubscribed
+    if oversubscription is None:
+        ratios = []
+    elif isinstance(oversubscription, (int, float)):
+        ratios = [oversubscription]
+    else:
+        ratios = list(oversubscription)
+
+    if len(ratios) > tree_level - 1:
+        raise ValueError(f"{len(ratios)} oversubscription ratios for {tree_level - 1} levels below the core")
+    return ratios + [1] * (tree_level - 1 - len(ratios))
+
+
+def tree_shape(tree_level, ports_per_switch, oversubscription=None):
+    if tree_level < 2:
+        raise ValueError(f"Unsupported tree level: {tree_level}")
+
+    down, up = [0], [1]
+    for ratio in oversubscription_ratios(oversubscription, tree_level):
+        if ratio < 1:
+            raise ValueError(f"Oversubscription ratio {ratio} is below 1")
+
+        uplinks = int(ports_per_switch // (1 + ratio))
+        downlinks = uplinks * ratio
+        if uplinks < 1 or downlinks != int(downlinks):
+            raise ValueError(f"{ports_per_switch} ports cannot be split {ratio}:1 into downlinks and uplinks")
+        down.append(int(downlinks))
+        up.append(uplinks)
+
+    down.append(2 * (ports_per_switch // 2))
+    up.append(0)
+    return down, up
+
+
+def level_counts(down, up):
+    # number of nodes of every level, hosts first
+    return [math.prod(down[level + 1:]) * math.prod(up[:level]) for level in range(len(down))]
+
+
+def child_index(down, up, level, parent, child):
+    # index of the child-th child of a level node; works on NumPy arrays of parents and children as well
+    below = math.prod(up[:level - 1])
+    group, offset = divmod(parent // up[level - 1], below)
+    return (group * down[level] + child) * below + offset
+
+
+def children(down, up, level, parent):
+    return [child_index(down, up, level, parent, child) for child in range(down[level])]
+
+
+def parent_index(down, up, level, node, parent):
+    # index of the parent-th parent of a level node
+    below = math.prod(up[:level])
+    group, offset = divmod(node, below)
+    return ((group // down[level + 1]) * below + offset) * up[level] + parent
+
+
+def parents(down, up, level, node):
+    return [parent_index(down, up, level, node, parent) for parent in range(up[level])]
+
+
+def link_ports(up, level, parent, child):
+    # ports of the link between the parent-th node of a level and its child-th child when links are created
+    # top-down and parent by parent: every node takes its uplink ports, in the order of its parents' numbers
+    # (whose last digit is the parent choice, see parent_index), before its downlink ports
+    return up[level] + child, parent % up[level - 1]
+
+
+def split_levels(hosts, edge_switches, aggregation_switches, core_switches, counts):
+    # the devices of every level, hosts first; aggregation switches are created top level first, so the
+    # last ones belong to the level right above the edge
+    levels = [hosts, edge_switches]
+    end = len(aggregation_switches)
+    for count in counts[2:-1]:
+        levels.append(aggregation_switches[end - count:end])
+        end -= count
+    return levels + [core_switches]
+
+
+def level_name(tree_level, level):
+    if level == 0:
+        return "host"
+    if level == 1:
+        return "edge"
+    if level == tree_level:
+        return "core"
+    # levels are only numbered when there is more than one aggregation level
+    return "aggregation" if tree_level == 3 else f"aggregation_{level - 1}"
+
+
+def link_layer_name(tree_level, level):
+    # name of the links between a level and the level below, e.g. "core_to_edge"
+    return f"{level_name(tree_level, level)}_to_{level_name(tree_level, level - 1)}"
@@ -0,0 +1,281 @@
+import argparse
+import re
+import time
+
+from cost_report import write_cost_report
+from create_topology import PROVISIONING_WORKERS, Cable, Device, Interface, Rack, Topology, print_cost_summary
+from distances import loadDistances
+from fat_tree import level_counts
+from netbox_client import NetboxClient, NETBOX_HOST
+from prices import Prices, loadPrices
+from sync import reference_id
+
+# devices whose role name (or name, when the role has none) contains one of these are hosts, all other devices
+# are switches
+HOST_ROLES = ("host", "server")
+# cable lengths are converted to meters
+LENGTH_UNITS = {"km": 1000, "m": 1, "cm": 0.01, "mi": 1609.344, "ft": 0.3048, "in": 0.0254}
+DEFAULT_CABLE_TYPE = "rj45_cat_7"
+NAME_NUMBER = re.compile(r"^(.*?)(\d+)$")
+
+
+class InventoryImport:
+    # Builds the object model of create_topology from NetBox pages as they arrive: every page is turned into
+    # racks, devices, interfaces or cables right away and dropped, only the objects and their NetBox ids are kept
+    def __init__(self):
+        self.device_types = {}
+        self.racks = {}
+        self.devices = {}
+        self.hosts = set()
+        self.interfaces = {}
+        self.cables = []
+
+    def add_device_types(self, device_types):
+        for device_type in device_types:
+            price = device_type.get("custom_fields", {}).get("price")
+            height = device_type.get("u_height")
+            self.device_types[device_type["id"]] = (
+                None if price is None else float(price), 1 if height is None else int(float(height)),
+            )
+
+    def add_racks(self, racks):
+        for rack in racks:
+            self.racks[rack["id"]] = Rack(rack["id"], int(rack["u_height"]), name=rack["name"])
+
+    def add_devices(self, devices):
+        for device in devices:
+            role = device["role"] if device.get("role") is not None else device.get("device_role")
+            # brief nested objects may come without a name, the device name is matched then
+            role_name = role.get("name") if isinstance(role, dict) else role
+            role_name = str(role_name or device["name"]).lower()
+            is_host = any(host_role in role_name for host_role in HOST_ROLES)
+            price, height = self.device_types.get(reference_id(device["device_type"]), (None, 1))
+            if price is None:
+                price = Prices.dell_poweredge_r450_xs if is_host else Prices.switch_price
+
+            rack = self.racks.get(reference_id(device["rack"])) if device.get("rack") is not None else None
+            position = device.get("position")
+            new_device = Device(device["id"], [], rack, price, device["name"],
+                                None if position is None else int(float(position)),
+                                "host" if is_host else "switch", height)
+            if rack is not None:
+                rack.add_device(new_device)
+            if is_host:
+                self.hosts.add(device["id"])
+            self.devices[device["id"]] = new_device
+
+    def add_interfaces(self, interfaces):
+        for interface in interfaces:
+            device = self.devices.get(reference_id(interface["device"]))
+            if device is None:
+                continue
+            new_interface = Interface(interface["id"], name=interface["name"])
+            device.add_interface(new_interface)
+            self.interfaces[interface["id"]] = new_interface
+
+    def add_cables(self, cables):
+        # cables that do not join two imported interfaces (console ports, other sites) are left out
+        for cable in cables:
+            a_interface = self.termination(cable.get("a_terminations"))
+            b_interface = self.termination(cable.get("b_terminations"))
+            if a_interface is None or b_interface is None:
+                continue
+
+            length = cable_length(cable)
+            price_per_meter = Prices.rj45_cat_7
+            price = cable.get("custom_fields", {}).get("price")
+            price = length * price_per_meter if price is None else float(price)
+            a_interface.is_open = False
+            b_interface.is_open = False
+            self.cables.append(Cable(cable["id"], cable.get("type") or DEFAULT_CABLE_TYPE, length, price_per_meter,
+                                     price, a_interface=a_interface, b_interface=b_interface))
+
+    def termination(self, terminations):
+        if not terminations or terminations[0].get("object_type") != "dcim.interface":
+            return None
+        return self.interfaces.get(terminations[0]["object_id"])
+
+    def topology(self):
+        levels = self.device_levels()
+        tree_level = len(levels) - 1
+        edge_switches = levels[1] if tree_level >= 1 else []
+        core_switches = levels[tree_level] if tree_level >= 2 else []
+        aggregation_switches = [device for level in range(tree_level - 1, 1, -1) for device in levels[level]]
+
+        size = inventory_size(levels, self.cables, list(self.racks.values()))
+        return Topology(size, list(self.racks.values()), core_switches, aggregation_switches, edge_switches,
+                        levels[0], self.cables)
+
+    def device_levels(self):
+        # hosts are level 0 and every switch is one level above its nearest host, found by a breadth-first search
+        # over the cables; within a level devices are ordered by name, which restores the creation order of
+        # create_topology ("edge_switch_2" before "edge_switch_10")
+        neighbors = {device: [] for device in self.devices.values()}
+        for cable in self.cables:
+            neighbors[cable.a_interface.device].append(cable.b_interface.device)
+            neighbors[cable.b_interface.device].append(cable.a_interface.device)
+
+        levels = [[self.devices[device_id] for device_id in self.hosts]]
+        seen = set(levels[0])
+        while True:
+            frontier = {neighbor for device in levels[-1] for neighbor in neighbors[device]
+                        if neighbor not in seen and neighbor.role != "host"}
+            if not frontier:
+                break
+            seen |= frontier
+            levels.append(list(frontier))
+
+        unreachable = [device.name for device in self.devices.values() if device not in seen]
+        if unreachable:
+            raise ValueError(f"{len(unreachable)} switches are not cabled to any host, e.g. {unreachable[:5]}")
+        return [sorted(level, key=name_order) for level in levels]
+
+
+def name_order(device):
+    match = NAME_NUMBER.match(device.name)
+    if match is None:
+        return device.name, -1, device.id
+    return match.group(1), int(match.group(2)), device.id
+
+
+def cable_length(cable):
+    length = cable.get("length")
+    if length is None:
+        return 0
+    unit = cable.get("length_unit") or "m"
+    if isinstance(unit, dict):
+        unit = unit["value"]
+    if unit not in LENGTH_UNITS:
+        raise ValueError(f"Unsupported cable length unit: {unit}")
+    return float(length) * LENGTH_UNITS[unit]
+
+
+def inventory_size(levels, cables, racks):
+    # the size dictionary of create_topology.size_topology for an imported tree; links per level are derived
+    # from the cables and are only set (like pod_number) when every level is regular, i.e. the inventory is a
+    # k-ary n-tree that analysis.py, failures.py and traffic.py can work on
+    tree_level = len(levels) - 1
+    counts = [len(level) for level in levels]
+    level_of = {device: level for level, devices in enumerate(levels) for device in devices}
+    links = [0] * (tree_level + 1)
+    for cable in cables:
+        a_level, b_level = level_of[cable.a_interface.device], level_of[cable.b_interface.device]
+        links[max(a_level, b_level)] += 1
+
+    down, up = [0], []
+    for level in range(1, tree_level + 1):
+        down.append(links[level] // counts[level])
+        up.append(links[level] // counts[level - 1])
+    up.append(0)
+    regular = tree_level >= 2 and all(
+        links[level] == down[level] * counts[level] == up[level - 1] * counts[level - 1]
+        for level in range(1, tree_level + 1)
+    ) and level_counts(down, up) == counts
+
+    switches = [device for level in levels[1:] for device in level]
+    return {
+        "tree_level": tree_level,
+        "ports_per_switch": max((len(device.interfaces) for device in switches), default=0),
+        "rack_height": max((rack.height for rack in racks), default=0),
+        "pod_size": None,
+        "core_number": counts[tree_level] if tree_level >= 2 else 0,
+        "aggregation_number": sum(counts[2:tree_level]),
+        "edge_number": counts[1] if tree_level >= 1 else 0,
+        "host_number": counts[0],
+        "pod_number": down[tree_level] if regular and tree_level >= 3 else None,
+        "rack_number": len(racks),
+        "switch_height": switches[0].height if switches else 1,
+        "host_height": levels[0][0].height if levels[0] else 1,
+        "down_links": down if regular else None,
+        "up_links": up if regular else None,
+        "level_counts": counts,
+    }
+
+
+def import_inventory(client, site_id=None):
+    # racks, devices, interfaces and cables of a site (all of NetBox without one) as a create_topology.Topology;
+    # every object type is streamed page by page with the pages fetched by the client's workers
+    filters = {} if site_id is None else {"site_id": site_id}
+    inventory = InventoryImport()
+
+    with client.metrics.phase("device types"):
+        for page in client.iter_pages(f"{client.host}/api/dcim/device-types/"):
+            inventory.add_device_types(page)
+    with client.metrics.phase("racks"):
+        for page in client.iter_pages(f"{client.host}/api/dcim/racks/", filters=filters):
+            inventory.add_racks(page)
+    with client.metrics.phase("devices"):
+        for page in client.iter_pages(f"{client.host}/api/dcim/devices/", filters=filters):
+            inventory.add_devices(page)
+    with client.metrics.phase("interfaces"):
+        for page in client.iter_pages(f"{client.host}/api/dcim/interfaces/", filters=filters):
+            inventory.add_interfaces(page)
+    with client.metrics.phase("cabling"):
+        for page in client.iter_pages(f"{client.host}/api/dcim/cables/", filters=filters):
+            inventory.add_cables(page)
+
+    return inventory.topology()
+
+
+def inventory_graph(topology):
+    # analysis.NetworkGraph of an imported tree, devices are numbered like Topology.devices() lists them;
+    # unracked devices get rack -1
+    from analysis import NetworkGraph
+
+    if topology.size["down_links"] is None:
+        raise ValueError("The inventory is not a k-ary n-tree, its paths cannot be analysed")
+
+    devices = topology.devices()
+    device_index = {device: index for index, device in enumerate(devices)}
+    rack_index = {rack: index for index, rack in enumerate(topology.racks)}
+    a_device = [device_index[cable.a_interface.device] for cable in topology.cables]
+    b_device = [device_index[cable.b_interface.device] for cable in topology.cables]
+    device_rack = [rack_index.get(device.rack, -1) for device in devices]
+    return NetworkGraph(topology.size, a_device, b_device, device_rack)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import racks, devices, interfaces and cables from NetBox and "
+                                                 "price them")
+    parser.add_argument("--host", default=NETBOX_HOST)
+    parser.add_argument("--site", default=None, help="name of the site to import, all sites by default")
+    parser.add_argument("--workers", type=int, default=PROVISIONING_WORKERS, help="pages fetched in parallel")
+    parser.add_argument("--report", default=None, help="write the cost report to this file (.csv, .json or text)")
+    parser.add_argument("--analyze", action="store_true", help="also report paths and bisection of the tree")
+    args = parser.parse_args()
+    loadPrices()
+    loadDistances()
+
+    client = NetboxClient(workers=args.workers, host=args.host, quiet=True)
+    client.auth()
+
+    site_id = None
+    if args.site is not None:
+        sites = client.get_sites(name=args.site)
+        if not sites:
+            parser.error(f"Unknown site: {args.site}")
+        site_id = sites[0]["id"]
+
+    start = time.perf_counter()
+    topology = import_inventory(client, site_id)
+    size = topology.size
+    print(f"Imported {len(topology.racks)} racks, {len(topology.devices())} devices and {len(topology.cables)} "
+          f"cables of a {size['tree_level']}-level tree in {time.perf_counter() - start:.2f} s")
+
+    if args.report is not None:
+        print_cost_summary(write_cost_report(topology.cost_table_entities(), args.report))
+    else:
+        write_cost_report(topology.cost_table_entities())
+
+    if args.analyze:
+        from analysis import analyze, print_analysis
+
+        try:
+            graph = inventory_graph(topology)
+        except ValueError as error:
+            parser.error(str(error))
+        print_analysis(analyze(graph))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+import hashlib
+import json
+import os
+import threading
+
+JOURNAL_PATH = "provisioning_journal.jsonl"
+
+
+class ProvisioningJournal:
+    # Append-only JSON lines file mapping the names of created objects to their NetBox ids. The first line
+    # holds a fingerprint of the inputs, so a journal is never resumed with a different topology.
+    def __init__(self, path=JOURNAL_PATH):
+        self.path = path
+        self.ids = {}
+        self.file = None
+        # objects missing from a resumed journal may still have been stored by the failed run
+        self.resumed = False
+        # batches of one phase are journaled from several threads
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def fingerprint(inputs):
+        return hashlib.sha256(json.dumps(inputs, sort_keys=True).encode()).hexdigest()
+
+    def start(self, inputs):
+        # a new run forgets everything the previous run created
+        self.ids = {}
+        self.resumed = False
+        self.file = open(self.path, "w")
+        self.write({"fingerprint": self.fingerprint(inputs)})
+
+    def resume(self, inputs):
+        if not os.path.exists(self.path):
+            raise ValueError(f"There is no journal to resume at {self.path}")
+
+        with open(self.path) as journal_file:
+            lines = journal_file.read().splitlines()
+
+        header = json.loads(lines[0]) if lines else {}
+        if header.get("fingerprint") != self.fingerprint(inputs):
+            raise ValueError(f"{self.path} was written for a different topology, it cannot be resumed")
+
+        for line in lines[1:]:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # the last line may be cut off when the previous run was killed while writing it
+                continue
+            self.ids.update({(entry["kind"], name): id for name, id in zip(entry["names"], entry["ids"])})
+
+        self.file = open(self.path, "a")
+        self.resumed = True
+        return len(self.ids)
+
+    def get(self, kind, name):
+        return self.ids.get((kind, name))
+
+    def record(self, kind, names, ids):
+        with self.lock:
+            self.ids.update({(kind, name): id for name, id in zip(names, ids)})
+            self.write({"kind": kind, "names": names, "ids": ids})
+
+    def write(self, entry):
+        # synced right away, so the entry survives the process being killed after the batch was stored
+        self.file.write(json.dumps(entry) + "\n")
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
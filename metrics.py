@@ -0,0 +1,127 @@
+import json
+import math
+import re
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+# upper bounds in seconds of the latency histogram buckets in the Prometheus export
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+PERCENTILES = (50, 95, 99)
+
+
+def endpoint_of(url):
+    # /api/dcim/devices/12/?limit=10 and /api/dcim/devices/ are the same endpoint
+    return re.sub(r"/\d+/?$", "/", urlparse(url).path)
+
+
+def percentile(sorted_values, percent):
+    # nearest-rank percentile
+    if not sorted_values:
+        return None
+    rank = max(math.ceil(percent / 100 * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+
+class RequestStats:
+    __slots__ = ("count", "errors", "retries", "bytes_sent", "bytes_received", "latencies", "statuses")
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.retries = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.latencies = []
+        self.statuses = {}
+
+
+class Metrics:
+    # Request statistics per method and endpoint and wall time per phase, shared by the client threads
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = {}
+        self.phases = {}
+
+    def record_request(self, method, url, status, duration, bytes_sent=0, bytes_received=0, retries=0):
+        key = (method, endpoint_of(url))
+        with self.lock:
+            stats = self.requests.get(key)
+            if stats is None:
+                stats = self.requests[key] = RequestStats()
+            stats.count += 1
+            stats.errors += status is None or status >= 400
+            stats.retries += retries
+            stats.bytes_sent += bytes_sent
+            stats.bytes_received += bytes_received
+            stats.latencies.append(duration)
+            stats.statuses[status] = stats.statuses.get(status, 0) + 1
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - start
+            with self.lock:
+                self.phases[name] = self.phases.get(name, 0) + duration
+
+    def to_dict(self):
+        with self.lock:
+            requests = {}
+            for (method, endpoint), stats in sorted(self.requests.items()):
+                latencies = sorted(stats.latencies)
+                requests[f"{method} {endpoint}"] = {
+                    "count": stats.count,
+                    "errors": stats.errors,
+                    "retries": stats.retries,
+                    "bytes_sent": stats.bytes_sent,
+                    "bytes_received": stats.bytes_received,
+                    "latency": {f"p{percent}": percentile(latencies, percent) for percent in PERCENTILES},
+                    "statuses": {str(status): count for status, count in stats.statuses.items()},
+                }
+            return {"requests": requests, "phases": dict(self.phases)}
+
+    def to_prometheus(self):
+        lines = [
+            "# TYPE netbox_requests_total counter",
+            "# TYPE netbox_request_errors_total counter",
+            "# TYPE netbox_request_retries_total counter",
+            "# TYPE netbox_request_sent_bytes_total counter",
+            "# TYPE netbox_request_received_bytes_total counter",
+            "# TYPE netbox_request_duration_seconds histogram",
+        ]
+        with self.lock:
+            for (method, endpoint), stats in sorted(self.requests.items()):
+                labels = f'method="{method}",endpoint="{endpoint}"'
+                lines += [
+                    f"netbox_requests_total{{{labels}}} {stats.count}",
+                    f"netbox_request_errors_total{{{labels}}} {stats.errors}",
+                    f"netbox_request_retries_total{{{labels}}} {stats.retries}",
+                    f"netbox_request_sent_bytes_total{{{labels}}} {stats.bytes_sent}",
+                    f"netbox_request_received_bytes_total{{{labels}}} {stats.bytes_received}",
+                ]
+                for bucket in LATENCY_BUCKETS:
+                    below = sum([1 for latency in stats.latencies if latency <= bucket])
+                    lines.append(f'netbox_request_duration_seconds_bucket{{{labels},le="{bucket}"}} {below}')
+                lines += [
+                    f'netbox_request_duration_seconds_bucket{{{labels},le="+Inf"}} {stats.count}',
+                    f"netbox_request_duration_seconds_sum{{{labels}}} {sum(stats.latencies)}",
+                    f"netbox_request_duration_seconds_count{{{labels}}} {stats.count}",
+                ]
+
+            lines.append("# TYPE topology_phase_duration_seconds gauge")
+            for name, duration in self.phases.items():
+                lines.append(f'topology_phase_duration_seconds{{phase="{name}"}} {duration}')
+        return "\n".join(lines) + "\n"
+
+    def write(self, path, metrics_format=None):
+        # the format follows the file extension unless it is given: .prom for Prometheus, JSON otherwise
+        metrics_format = metrics_format or ("prometheus" if path.endswith(".prom") else "json")
+        with open(path, "w") as metrics_file:
+            if metrics_format == "prometheus":
+                metrics_file.write(self.to_prometheus())
+            else:
+                json.dump(self.to_dict(), metrics_file, indent=2)
@@ -1,15 +1,106 @@
 import requests
 import json
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from metrics import Metrics
+from reference_cache import ReferenceCache
 
 NETBOX_HOST = "http://localhost:8000"
+BULK_BATCH_SIZE = 500
+POOL_SIZE = 10
+MAX_RETRIES = 3
+BACKOFF_FACTOR = 0.5
+REQUEST_TIMEOUT = 30
+WORKERS = 1
+PAGE_SIZE = 1000
+# values of a filter sent in one listing, so lookups by many names keep their URLs short
+LOOKUP_BATCH_SIZE = 100
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+# NetBox (or the proxy in front of it) turns the request away before handling it
+REJECTED_STATUSES = (429, 503)
+# the request may have been applied before the error, like after a read timeout
+UNCERTAIN_STATUSES = (500, 502, 504)
+
+
+class NetboxError(Exception):
+    # a request that still failed after all retries
+    def __init__(self, method, url, status_code=None, text=None):
+        self.method = method
+        self.url = url
+        self.status_code = status_code
+        self.text = text
+        super().__init__(f"Error {status_code} while sending {method} request to {url}: {text}")
+
+    def may_be_applied(self):
+        # no response at all (read timeout, reset connection) or a gateway error that can come after NetBox
+        # committed the request
+        return self.status_code is None or self.status_code in UNCERTAIN_STATUSES
+
+
+class NetboxRetry(Retry):
+    # urllib3 retries connection errors for every method, as nothing was sent yet, while read errors and the
+    # statuses of status_forcelist are only retried for allowed_methods. Responses that reject the request before
+    # NetBox handles it are retried for every method as well
+    def is_retry(self, method, status_code, has_retry_after=False):
+        if status_code in REJECTED_STATUSES:
+            return True
+        return super().is_retry(method, status_code, has_retry_after)
 
 
 class NetboxClient:
-    def __init__(self):
-        self.headers = {
+    def __init__(self, batch_size=BULK_BATCH_SIZE, pool_size=POOL_SIZE, max_retries=MAX_RETRIES,
+                 backoff_factor=BACKOFF_FACTOR, timeout=REQUEST_TIMEOUT, workers=WORKERS, host=NETBOX_HOST,
+                 quiet=False, metrics=None, reference_cache_path=None):
+        self.host = host
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.workers = workers
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        # quiet drops the message printed for every created or deleted object, metrics still counts them
+        self.quiet = quiet
+        self.metrics = metrics if metrics is not None else Metrics()
+        # ids of reference objects, kept in memory only unless a file is given
+        self.reference_cache = ReferenceCache(host, reference_cache_path)
+        # every worker needs its own connection, otherwise threads queue up on the pool
+        self.session = self.create_session(max(pool_size, workers), max_retries, backoff_factor)
+
+        # headers live on the session so they are not rebuilt for every request
+        self.headers = self.session.headers
+        self.headers.update({
             "Content-Type": "application/json",
             "Accept": "application/json; indent=4"
-        }
+        })
+
+    @staticmethod
+    def create_session(pool_size, max_retries, backoff_factor):
+        # only idempotent methods are sent again after the request may have reached NetBox; POSTs are retried by
+        # create_idempotently, which first looks up what the lost request created
+        retry = NetboxRetry(
+            total=max_retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=frozenset(["GET", "DELETE"]),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+
+        session = requests.Session()
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def close(self):
+        self.session.close()
+
+    def log(self, message):
+        if not self.quiet:
+            print(message)
 
     def auth(self):
         with open('credentials.json') as file:
@@ -20,7 +111,7 @@ class NetboxClient:
             "password": credentials["password"]
         }
 
-        response = self.send_request("POST", f"{NETBOX_HOST}/api/users/tokens/provision/", body)
+        response = self.send_request("POST", f"{self.host}/api/users/tokens/provision/", body)
         api_token = response.json()['display']
         self.headers["Authorization"] = f"Token {api_token}"
 
@@ -31,8 +122,14 @@ class NetboxClient:
             "content_types": content_types
         }
 
-        self.send_request("POST", f"{NETBOX_HOST}/api/extras/custom-fields/", body=custom_field)
+        response = self.send_request("POST", f"{self.host}/api/extras/custom-fields/", body=custom_field)
+        return response.json()["id"]
 
+    def get_or_create_custom_field(self, name, field_type, content_types):
+        return self.get_or_create(
+            "extras/custom-fields", name, {"type": field_type, "content_types": content_types},
+            lambda: self.create_custom_field(name, field_type, content_types), key="name",
+        )
 
     def create_site(self, name):
         site = {
@@ -40,37 +137,44 @@ class NetboxClient:
             "slug": name
         }
 
-        response = self.send_request("POST", f"{NETBOX_HOST}/api/dcim/sites/", body=site)
+        response = self.send_request("POST", f"{self.host}/api/dcim/sites/", body=site)
 
         device_id = response.json()["id"]
-        print(f"Site {name} with id {device_id} created")
+        self.log(f"Site {name} with id {device_id} created")
         return device_id
 
-    def get_custom_types_ids(self):
-        response = self.send_request("GET", f"{NETBOX_HOST}/api/extras/custom-fields/", body=None)
+    def get_or_create_site(self, name):
+        return self.get_or_create("dcim/sites", name, {"name": name}, lambda: self.create_site(name))
 
-        custom_types = response.json()["results"]
+    def get_custom_types_ids(self):
+        custom_types = self.get_all(f"{self.host}/api/extras/custom-fields/", brief=True)
         return self.get_ids_from_get_response(custom_types)
     
     def get_sites_ids(self):
-        response = self.send_request("GET", f"{NETBOX_HOST}/api/dcim/sites/", body=None)
-
-        sites = response.json()["results"]
+        sites = self.get_all(f"{self.host}/api/dcim/sites/", brief=True)
         return self.get_ids_from_get_response(sites)
 
+    def get_custom_fields(self, **filters):
+        return self.get_all(f"{self.host}/api/extras/custom-fields/", filters=filters)
+
+    def get_sites(self, **filters):
+        return self.get_all(f"{self.host}/api/dcim/sites/", filters=filters)
+
     def delete_custom_types(self):
         custom_types = self.get_custom_types_ids()
 
-        for custom_type_id in custom_types:
-            self.send_request("DELETE", f"{NETBOX_HOST}/api/extras/custom-fields/{custom_type_id}", body=None)
-            print(f"Custom type with id {custom_type_id} deleted")
+        self.bulk_delete(f"{self.host}/api/extras/custom-fields/", custom_types)
+        self.reference_cache.invalidate("extras/custom-fields")
+        self.log(f"{len(custom_types)} custom types deleted")
+        return len(custom_types)
     
     def delete_sites(self):
         sites = self.get_sites_ids()
 
-        for site_id in sites:
-            self.send_request("DELETE", f"{NETBOX_HOST}/api/dcim/sites/{site_id}", body=None)
-            print(f"Site with id {site_id} deleted")
+        self.bulk_delete(f"{self.host}/api/dcim/sites/", sites)
+        self.reference_cache.invalidate("dcim/sites")
+        self.log(f"{len(sites)} sites deleted")
+        return len(sites)
 
     def create_manufacturer(self, name):
         manufacturer = {
@@ -78,79 +182,129 @@ class NetboxClient:
             "slug": name
         }
 
-        response = self.send_request("POST", f"{NETBOX_HOST}/api/dcim/manufacturers/", body=manufacturer)
+        response = self.send_request("POST", f"{self.host}/api/dcim/manufacturers/", body=manufacturer)
 
         manufacturer_id = response.json()["id"]
-        print(f"Manufacturer {name} with id {manufacturer_id} created")
+        self.log(f"Manufacturer {name} with id {manufacturer_id} created")
         return manufacturer_id
 
-    def get_manufacturers_ids(self):
-        response = self.send_request("GET", f"{NETBOX_HOST}/api/dcim/manufacturers/", body=None)
+    def get_or_create_manufacturer(self, name):
+        return self.get_or_create("dcim/manufacturers", name, {"name": name},
+                                  lambda: self.create_manufacturer(name))
 
-        manufacturers = response.json()["results"]
+    def get_manufacturers(self, **filters):
+        return self.get_all(f"{self.host}/api/dcim/manufacturers/", filters=filters)
+
+    def get_manufacturers_ids(self):
+        manufacturers = self.get_all(f"{self.host}/api/dcim/manufacturers/", brief=True)
         return self.get_ids_from_get_response(manufacturers)
 
     def delete_manufacturers(self):
         manufacturers = self.get_manufacturers_ids()
 
-        for manufacturer_id in manufacturers:
-            self.send_request("DELETE", f"{NETBOX_HOST}/api/dcim/manufacturers/{manufacturer_id}", body=None)
-            print(f"Manufacturer with id {manufacturer_id} deleted")
+        self.bulk_delete(f"{self.host}/api/dcim/manufacturers/", manufacturers)
+        self.reference_cache.invalidate("dcim/manufacturers")
+        self.log(f"{len(manufacturers)} manufacturers deleted")
+        return len(manufacturers)
 
-    def create_device_type(self, name, manufacturer_id, model_name, price = 0):
+    def create_device_type(self, name, manufacturer_id, model_name, price = 0, u_height=1):
         device_type = {
             "name": name,
             "manufacturer": manufacturer_id,
             "model": model_name,
             "slug": name,
+            "u_height": u_height,
             "custom_fields": {
                 "price": price,
             },
         }
 
-        response = self.send_request("POST", f"{NETBOX_HOST}/api/dcim/device-types/", body=device_type)
+        response = self.send_request("POST", f"{self.host}/api/dcim/device-types/", body=device_type)
 
         device_type_id = response.json()["id"]
-        print(f"Device type {name} with id {device_type_id} created")
+        self.log(f"Device type {name} with id {device_type_id} created")
         return device_type_id
 
-    def get_device_types_ids(self):
-        response = self.send_request("GET", f"{NETBOX_HOST}/api/dcim/device-types/", body=None)
+    def get_or_create_device_type(self, name, manufacturer_id, model_name, price=0, u_height=1):
+        # an existing device type is patched when its height or price changed since it was created
+        def changes(device_type):
+            stored_price = device_type["custom_fields"].get("price")
+            if float(device_type["u_height"]) == u_height and stored_price is not None and \
+                    round(float(stored_price), 2) == round(price, 2):
+                return {}
+            return {"u_height": u_height, "custom_fields": {"price": price}}
+
+        return self.get_or_create(
+            "dcim/device-types", name,
+            {"manufacturer": manufacturer_id, "model": model_name, "price": price, "u_height": u_height},
+            lambda: self.create_device_type(name, manufacturer_id, model_name, price, u_height), changes,
+        )
+
+    def get_device_types(self, **filters):
+        return self.get_all(f"{self.host}/api/dcim/device-types/", filters=filters)
 
-        device_types = response.json()["results"]
+    def update_device_types(self, device_types):
+        self.bulk_update(f"{self.host}/api/dcim/device-types/", device_types)
+        self.log(f"{len(device_types)} device types updated")
+
+    def get_device_types_ids(self):
+        device_types = self.get_all(f"{self.host}/api/dcim/device-types/", brief=True)
         return self.get_ids_from_get_response(device_types)
 
     def delete_device_types(self):
         device_types = self.get_device_types_ids()
 
-        for device_type_id in device_types:
-            self.send_request("DELETE", f"{NETBOX_HOST}/api/dcim/device-types/{device_type_id}", body=None)
-            print(f"Device type with id {device_type_id} deleted")
+        self.bulk_delete(f"{self.host}/api/dcim/device-types/", device_types)
+        self.reference_cache.invalidate("dcim/device-types")
+        self.log(f"{len(device_types)} device types deleted")
+        return len(device_types)
 
     def create_rack(self, name, device_number, site_id):
-        rack = {
+        rack = self.rack_body(name, device_number, site_id)
+
+        response = self.send_request("POST", f"{self.host}/api/dcim/racks/", body=rack)
+        rack_id = response.json()["id"]
+        self.log(f"Rack {name} with id {rack_id} created")
+        return rack_id
+
+    def create_racks(self, racks, on_batch=None):
+        bodies = [self.rack_body(**rack) for rack in racks]
+
+        rack_ids = self.bulk_create(f"{self.host}/api/dcim/racks/", bodies, on_batch)
+        self.log(f"{len(rack_ids)} racks created")
+        return rack_ids
+
+    def find_racks(self, racks):
+        # NetBox ids of the racks that are already stored, None for the others
+        return self.find_created(f"{self.host}/api/dcim/racks/", [self.rack_body(**rack) for rack in racks])
+
+    @staticmethod
+    def rack_body(name, device_number, site_id):
+        return {
             "site": site_id,
             "name": name,
             "u_height": device_number
         }
 
-        response = self.send_request("POST", f"{NETBOX_HOST}/api/dcim/racks/", body=rack)
-        rack_id = response.json()["id"]
-        print(f"Rack {name} with id {rack_id} created")
-        return rack_id
+    def get_racks(self, **filters):
+        return self.get_all(f"{self.host}/api/dcim/racks/", filters=filters)
 
-    def get_racks_ids(self):
-        response = self.send_request("GET", f"{NETBOX_HOST}/api/dcim/racks/", body=None)
+    def update_racks(self, racks):
+        self.bulk_update(f"{self.host}/api/dcim/racks/", racks)
+        self.log(f"{len(racks)} racks updated")
 
-        racks = response.json()["results"]
+    def get_racks_ids(self):
+        racks = self.get_all(f"{self.host}/api/dcim/racks/", brief=True)
         return self.get_ids_from_get_response(racks)
 
-    def delete_racks(self):
-        racks = self.get_racks_ids()
+    def delete_racks(self, racks=None):
+        # every rack unless a list of ids is given
+        if racks is None:
+            racks = self.get_racks_ids()
 
-        for rack_id in racks:
-            self.send_request("DELETE", f"{NETBOX_HOST}/api/dcim/racks/{rack_id}", body=None)
-            print(f"Rack with id {rack_id} deleted")
+        self.bulk_delete(f"{self.host}/api/dcim/racks/", racks)
+        self.log(f"{len(racks)} racks deleted")
+        return len(racks)
 
     def create_device_role(self, name):
         device_role = {
@@ -158,27 +312,53 @@ class NetboxClient:
             "slug": name
         }
 
-        response = self.send_request("POST", f"{NETBOX_HOST}/api/dcim/device-roles/", body=device_role)
+        response = self.send_request("POST", f"{self.host}/api/dcim/device-roles/", body=device_role)
 
         device_role_id = response.json()["id"]
-        print(f"Device role {name} with id {device_role_id} created")
+        self.log(f"Device role {name} with id {device_role_id} created")
         return device_role_id
 
-    def get_device_roles_ids(self):
-        response = self.send_request("GET", f"{NETBOX_HOST}/api/dcim/device-roles/", body=None)
+    def get_or_create_device_role(self, name):
+        return self.get_or_create("dcim/device-roles", name, {"name": name}, lambda: self.create_device_role(name))
+
+    def get_device_roles(self, **filters):
+        return self.get_all(f"{self.host}/api/dcim/device-roles/", filters=filters)
 
-        device_roles = response.json()["results"]
+    def get_device_roles_ids(self):
+        device_roles = self.get_all(f"{self.host}/api/dcim/device-roles/", brief=True)
         return self.get_ids_from_get_response(device_roles)
 
     def delete_device_roles(self):
         device_roles = self.get_device_roles_ids()
 
-        for device_role_id in device_roles:
-            self.send_request("DELETE", f"{NETBOX_HOST}/api/dcim/device-roles/{device_role_id}", body=None)
-            print(f"Device role with id {device_role_id} deleted")
+        self.bulk_delete(f"{self.host}/api/dcim/device-roles/", device_roles)
+        self.reference_cache.invalidate("dcim/device-roles")
+        self.log(f"{len(device_roles)} device roles deleted")
+        return len(device_roles)
 
     def create_device(self, name, type_id, role_id, site_id, rack_id, rack_position):
-        device = {
+        device = self.device_body(name, type_id, role_id, site_id, rack_id, rack_position)
+
+        response = self.send_request("POST", f"{self.host}/api/dcim/devices/", body=device)
+
+        device_id = response.json()["id"]
+        self.log(f"Device {name} with id {device_id} created")
+        return device_id
+
+    def create_devices(self, devices, on_batch=None):
+        bodies = [self.device_body(**device) for device in devices]
+
+        device_ids = self.bulk_create(f"{self.host}/api/dcim/devices/", bodies, on_batch)
+        self.log(f"{len(device_ids)} devices created")
+        return device_ids
+
+    def find_devices(self, devices):
+        # NetBox ids of the devices that are already stored, None for the others
+        return self.find_created(f"{self.host}/api/dcim/devices/", [self.device_body(**device) for device in devices])
+
+    @staticmethod
+    def device_body(name, type_id, role_id, site_id, rack_id, rack_position):
+        return {
             "name": name,
             "device_type": type_id,
             "device_role": role_id,
@@ -188,44 +368,90 @@ class NetboxClient:
             "face": "front"
         }
 
-        response = self.send_request("POST", f"{NETBOX_HOST}/api/dcim/devices/", body=device)
+    def get_devices(self, **filters):
+        return self.get_all(f"{self.host}/api/dcim/devices/", filters=filters)
 
-        device_id = response.json()["id"]
-        print(f"Device {name} with id {device_id} created")
-        return device_id
+    def update_devices(self, devices):
+        self.bulk_update(f"{self.host}/api/dcim/devices/", devices)
+        self.log(f"{len(devices)} devices updated")
 
     def get_devices_ids(self):
-        response = self.send_request("GET", f"{NETBOX_HOST}/api/dcim/devices/", body=None)
-
-        devices = response.json()["results"]
+        devices = self.get_all(f"{self.host}/api/dcim/devices/", brief=True)
         return self.get_ids_from_get_response(devices)
 
-    def delete_devices(self):
-        devices_ids = self.get_devices_ids()
+    def delete_devices(self, devices_ids=None):
+        # every device unless a list of ids is given
+        if devices_ids is None:
+            devices_ids = self.get_devices_ids()
 
-        for id in devices_ids:
-            self.delete_device(id)
+        self.bulk_delete(f"{self.host}/api/dcim/devices/", devices_ids)
+        self.log(f"{len(devices_ids)} devices deleted")
+        return len(devices_ids)
 
     def delete_device(self, device_id):
-        self.send_request("DELETE", f"{NETBOX_HOST}/api/dcim/devices/{device_id}", body=None)
+        self.send_request("DELETE", f"{self.host}/api/dcim/devices/{device_id}", body=None)
 
-        print(f"Device with id {device_id} deleted")
+        self.log(f"Device with id {device_id} deleted")
 
     def create_interface(self, name, device_id):
-        interface = {
+        interface = self.interface_body(name, device_id)
+
+        response = self.send_request("POST", f"{self.host}/api/dcim/interfaces/", body=interface)
+
+        interface_id = response.json()["id"]
+        self.log(f"Interface {name} with id {interface_id} created")
+        return interface_id
+
+    def create_interfaces(self, interfaces, on_batch=None):
+        bodies = [self.interface_body(**interface) for interface in interfaces]
+
+        interface_ids = self.bulk_create(f"{self.host}/api/dcim/interfaces/", bodies, on_batch)
+        self.log(f"{len(interface_ids)} interfaces created")
+        return interface_ids
+
+    def find_interfaces(self, interfaces):
+        # NetBox ids of the interfaces that are already stored, None for the others
+        bodies = [self.interface_body(**interface) for interface in interfaces]
+        return self.find_created(f"{self.host}/api/dcim/interfaces/", bodies)
+
+    @staticmethod
+    def interface_body(name, device_id):
+        return {
             "name": name,
             "type": "1000base-t",
             "device": device_id,
         }
 
-        response = self.send_request("POST", f"{NETBOX_HOST}/api/dcim/interfaces/", body=interface)
+    def get_interfaces(self, **filters):
+        return self.get_all(f"{self.host}/api/dcim/interfaces/", filters=filters)
 
-        interface_id = response.json()["id"]
-        print(f"Interface {name} with id {interface_id} created")
-        return interface_id
+    def delete_interfaces(self, interface_ids):
+        self.bulk_delete(f"{self.host}/api/dcim/interfaces/", interface_ids)
+        self.log(f"{len(interface_ids)} interfaces deleted")
+        return len(interface_ids)
 
     def create_cable(self, int1_id, int2_id, length = None, price = None):
-        cable = {
+        cable = self.cable_body(int1_id, int2_id, length, price)
+        response = self.send_request("POST", f"{self.host}/api/dcim/cables/", body=cable)
+
+        cable_id = response.json()["id"]
+        self.log(f"Cable for interfaces {int1_id} and {int2_id} with id {cable_id} created")
+        return cable_id
+
+    def create_cables(self, cables, on_batch=None):
+        bodies = [self.cable_body(**cable) for cable in cables]
+
+        cable_ids = self.bulk_create(f"{self.host}/api/dcim/cables/", bodies, on_batch)
+        self.log(f"{len(cable_ids)} cables created")
+        return cable_ids
+
+    def find_cables(self, cables):
+        # NetBox ids of the cables that are already stored, None for the others
+        return self.find_created(f"{self.host}/api/dcim/cables/", [self.cable_body(**cable) for cable in cables])
+
+    @staticmethod
+    def cable_body(int1_id, int2_id, length = None, price = None):
+        return {
             "a_terminations": [
                 {
                     "object_type": "dcim.interface",
@@ -245,25 +471,202 @@ class NetboxClient:
                 "price": price,
             },
         }
-        response = self.send_request("POST", f"{NETBOX_HOST}/api/dcim/cables/", body=cable)
 
-        cable_id = response.json()["id"]
-        print(f"Cable for interfaces {int1_id} and {int2_id} with id {cable_id} created")
-        return cable_id
+    def get_cables(self, **filters):
+        return self.get_all(f"{self.host}/api/dcim/cables/", filters=filters)
+
+    def update_cables(self, cables):
+        self.bulk_update(f"{self.host}/api/dcim/cables/", cables)
+        self.log(f"{len(cables)} cables updated")
+
+    def delete_cables(self, cable_ids):
+        self.bulk_delete(f"{self.host}/api/dcim/cables/", cable_ids)
+        self.log(f"{len(cable_ids)} cables deleted")
+        return len(cable_ids)
+
+    def get_or_create(self, endpoint, slug, body, create, changes=None, key="slug"):
+        # a reference object is looked up by its slug (custom fields by name) and only created when missing;
+        # changes(existing) returns the fields to PATCH on an existing object. Ids found or created are cached
+        # with body, so the next run with the same body sends no request at all
+        object_id = self.reference_cache.get(endpoint, slug, body)
+        if object_id is not None:
+            return object_id
+
+        url = f"{self.host}/api/{endpoint}/"
+        existing = self.get_all(url, filters={key: slug})
+        if not existing:
+            def find_created():
+                created = self.get_all(url, filters={key: slug})
+                return created[0]["id"] if created else None
+
+            object_id = self.create_idempotently(create, find_created)
+        else:
+            object_id = existing[0]["id"]
+            update = changes(existing[0]) if changes is not None else {}
+            if update:
+                self.bulk_update(url, [dict(update, id=object_id)])
+
+        self.reference_cache.store(endpoint, slug, body, object_id)
+        return object_id
+
+    def bulk_create(self, url, bodies, on_batch=None):
+        # NetBox accepts a list of objects on every list endpoint and returns them in the same order;
+        # on_batch(start, ids) is called as soon as the batch starting at bodies[start] is stored
+        def create_batch(start):
+            batch = bodies[start:start + self.batch_size]
+
+            def send_batch():
+                return self.get_ids_from_get_response(self.send_request("POST", url, body=batch).json())
+
+            def find_batch():
+                # a bulk create is one transaction, either every object of the batch was stored or none
+                found_ids = self.find_created(url, batch)
+                return None if None in found_ids else found_ids
+
+            batch_ids = self.create_idempotently(send_batch, find_batch)
+            if on_batch is not None:
+                on_batch(start, batch_ids)
+            return batch_ids
+
+        ids = []
+        for batch_ids in self.map_concurrently(create_batch, range(0, len(bodies), self.batch_size)):
+            ids += batch_ids
+        return ids
+
+    def create_idempotently(self, create, find_created):
+        # create() POSTs and returns the new id(s). When the request may have been applied although it failed,
+        # find_created() looks up what it stored (None when nothing) before create() is called again, so a lost
+        # response never creates an object twice
+        for attempt in range(self.max_retries + 1):
+            try:
+                return create()
+            except NetboxError as error:
+                if attempt == self.max_retries or not error.may_be_applied():
+                    raise
+            time.sleep(self.backoff_factor * 2 ** attempt)
+            created = find_created()
+            if created is not None:
+                return created
+
+    def find_created(self, url, bodies):
+        # the ids NetBox stores for bodies, None for the ones it does not have: racks and devices are matched by
+        # name within their site, interfaces by name within their device and cables by their A interface, which
+        # only one cable can end on
+        if not bodies:
+            return []
+        if "a_terminations" in bodies[0]:
+            interface_ids = [body["a_terminations"][0]["object_id"] for body in bodies]
+            found = {}
+            for cable in self.get_matching(url, "interface_id", interface_ids):
+                for termination in cable["a_terminations"]:
+                    found[termination["object_id"]] = cable["id"]
+            return [found.get(interface_id) for interface_id in interface_ids]
+
+        if "device" in bodies[0]:
+            scope = "device"
+            items = self.get_matching(url, "device_id", sorted({body["device"] for body in bodies}))
+        else:
+            scope = "site"
+            items = self.get_matching(url, "name", [body["name"] for body in bodies],
+                                      {"site_id": sorted({body["site"] for body in bodies})})
+        found = {}
+        for item in items:
+            # related objects are nested in responses
+            scope_id = item[scope]["id"] if isinstance(item[scope], dict) else item[scope]
+            found[(scope_id, item["name"])] = item["id"]
+        return [found.get((body[scope], body["name"])) for body in bodies]
+
+    def get_matching(self, url, field, values, filters=None):
+        # every object whose field is one of values, asked for LOOKUP_BATCH_SIZE values at a time
+        items = []
+        for start in range(0, len(values), LOOKUP_BATCH_SIZE):
+            items += self.get_all(url, filters=dict(filters or {}, **{field: values[start:start + LOOKUP_BATCH_SIZE]}))
+        return items
+
+    def bulk_update(self, url, bodies):
+        # every body carries the id of the object it changes and only the fields that change
+        batches = [bodies[start:start + self.batch_size] for start in range(0, len(bodies), self.batch_size)]
+
+        self.map_concurrently(lambda batch: self.send_request("PATCH", url, body=batch), batches)
+
+    def bulk_delete(self, url, ids):
+        bodies = [{"id": id} for id in ids]
+        batches = [bodies[start:start + self.batch_size] for start in range(0, len(bodies), self.batch_size)]
+
+        self.map_concurrently(lambda batch: self.send_request("DELETE", url, body=batch), batches)
+
+    def get_all(self, url, brief=False, filters=None):
+        # every result as one list; filters are query parameters like site_id or slug that NetBox applies
+        # before paginating
+        items = []
+        for page in self.iter_pages(url, brief, filters):
+            items += page
+        return items
+
+    def iter_pages(self, url, brief=False, filters=None):
+        # yields the results page by page, a single GET only returns the first page. With one worker the "next"
+        # links are followed; otherwise the first page gives the number of results and the remaining pages are
+        # requested by offset, at most workers at a time and yielded in order, so no more than that many pages
+        # are held while the caller works through the previous one
+        page_url = f"{url}?limit={PAGE_SIZE}"
+        if brief:
+            page_url += "&brief=true"
+        if filters:
+            # a list filters by any of its values
+            page_url += "&" + urlencode(filters, doseq=True)
+
+        page = self.send_request("GET", page_url, body=None).json()
+        yield page["results"]
+        if self.workers <= 1 or page["next"] is None:
+            while page["next"] is not None:
+                page = self.send_request("GET", page["next"], body=None).json()
+                yield page["results"]
+            return
+
+        # NetBox caps the page size at MAX_PAGE_SIZE, the first page tells how many results a page holds
+        offsets = range(len(page["results"]), page["count"], len(page["results"]))
+
+        def get_page(offset):
+            return self.send_request("GET", f"{page_url}&offset={offset}", body=None).json()["results"]
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            pending = deque()
+            for offset in offsets:
+                pending.append(executor.submit(get_page, offset))
+                if len(pending) == self.workers:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+    def map_concurrently(self, function, items):
+        # results keep the order of items, so ids can still be matched with the objects that were sent
+        if self.workers <= 1 or len(items) <= 1:
+            return [function(item) for item in items]
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            return list(executor.map(function, items))
 
     def send_request(self, method, url, body):
-        if method == "POST":
-            response = requests.post(url, headers=self.headers, json=body)
-        elif method == "GET":
-            response = requests.get(url, headers=self.headers)
-        elif method == "DELETE":
-            response = requests.delete(url, headers=self.headers)
-        else:
+        if method not in ("POST", "GET", "PATCH", "DELETE"):
             raise ValueError(f"Unsupported method: {method}")
 
+        start = time.perf_counter()
+        try:
+            response = self.session.request(method, url, json=body, timeout=self.timeout)
+        except requests.RequestException as error:
+            self.metrics.record_request(method, url, None, time.perf_counter() - start)
+            raise NetboxError(method, url, text=str(error)) from error
+
+        # urllib3 keeps the responses it retried in the history of the Retry object it used last
+        retries = response.raw.retries
+        self.metrics.record_request(
+            method, url, response.status_code, time.perf_counter() - start,
+            bytes_sent=len(response.request.body or b""),
+            bytes_received=len(response.content),
+            retries=len(retries.history) if retries is not None else 0,
+        )
         if response.status_code >= 400:
-            print(f"Error {response.status_code} while sending {method} request to {url}: {response.text}")
-            return
+            raise NetboxError(method, url, response.status_code, response.text)
         return response
 
     @staticmethod
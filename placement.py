@@ -0,0 +1,251 @@
+import argparse
+
+import numpy as np
+
+from cabling_plan import build_cabling_plan
+from create_topology import size_topology, load_config
+from distances import loadDistances
+from prices import Prices, loadPrices
+from rack_allocator import RackAllocator, FIRST_FIT, PER_POD, BALANCED
+
+RACKS_PER_ROW = 10
+# meters between neighbouring racks of a row and between neighbouring rows (rack depth plus aisle)
+RACK_WIDTH = 0.6
+ROW_PITCH = 2.4
+# cable run from a device up to the overhead tray, added on both ends of an inter-rack cable
+VERTICAL_RUN = 2
+IN_RACK_CABLE_LENGTH = 1
+
+
+class RackLayout:
+    # racks stand in rows, cables run along the rows and across the aisles, lengths are rounded up
+    # to whole meters like the cables that can be bought
+    def __init__(self, racks_per_row=RACKS_PER_ROW, rack_width=RACK_WIDTH, row_pitch=ROW_PITCH,
+                 vertical_run=VERTICAL_RUN):
+        self.racks_per_row = racks_per_row
+        self.rack_width = rack_width
+        self.row_pitch = row_pitch
+        self.vertical_run = vertical_run
+
+    def grid(self, rack_count):
+        # rack slots in serpentine order, so consecutive racks are always neighbours
+        rows = np.arange(rack_count) // self.racks_per_row
+        columns = np.arange(rack_count) % self.racks_per_row
+        columns = np.where(rows % 2 == 0, columns, self.racks_per_row - 1 - columns)
+        return np.stack([rows, columns], axis=1)
+
+    def coordinates(self, rack_count, central_racks=0):
+        # the first central_racks racks get the slots closest to the middle of the room
+        slots = self.grid(rack_count)
+        if central_racks == 0:
+            return slots
+
+        center = slots.mean(axis=0)
+        distance_to_center = np.abs(slots[:, 0] - center[0]) * self.row_pitch + \
+            np.abs(slots[:, 1] - center[1]) * self.rack_width
+        central = np.sort(np.argsort(distance_to_center, kind="stable")[:central_racks])
+        remaining = np.setdiff1d(np.arange(rack_count), central)
+        return np.concatenate([slots[central], slots[remaining]])
+
+    def cable_length(self, coordinates_a, coordinates_b):
+        coordinates_a = np.asarray(coordinates_a)
+        coordinates_b = np.asarray(coordinates_b)
+        run = np.abs(coordinates_a[..., 0] - coordinates_b[..., 0]) * self.row_pitch + \
+            np.abs(coordinates_a[..., 1] - coordinates_b[..., 1]) * self.rack_width
+        same_rack = (coordinates_a == coordinates_b).all(axis=-1)
+        return np.where(same_rack, IN_RACK_CABLE_LENGTH, np.ceil(run + 2 * self.vertical_run))
+
+
+class Placement:
+    # rack and 1-based position of every device, devices numbered core, aggregation, edge, hosts; measured
+    # placements take cable lengths from the layout, the others only choose racks and cables keep the
+    # per-layer distances of Distances like first fit
+    def __init__(self, size, device_rack, device_position, rack_coordinates, layout, measured=True):
+        self.size = size
+        self.device_rack = device_rack
+        self.device_position = device_position
+        self.rack_coordinates = rack_coordinates
+        self.layout = layout
+        self.measured = measured
+
+    @property
+    def rack_count(self):
+        return len(self.rack_coordinates)
+
+    def layer_locations(self, layer):
+        devices = layer_ranges(self.size)[layer]
+        return list(zip(self.device_rack[devices].tolist(), self.device_position[devices].tolist()))
+
+    def rack_distance(self, rack_a, rack_b):
+        return self.layout.cable_length(self.rack_coordinates[rack_a], self.rack_coordinates[rack_b])
+
+
+class RackFiller:
+    # records where a RackAllocator puts every device
+    def __init__(self, size, policy=FIRST_FIT, rack_count=0):
+        device_count = size["core_number"] + size["aggregation_number"] + size["edge_number"] + size["host_number"]
+        self.allocator = RackAllocator(size["rack_height"], policy, rack_count)
+        self.device_height = np.full(device_count, size["host_height"], dtype=np.int64)
+        self.device_height[:device_count - size["host_number"]] = size["switch_height"]
+        self.device_rack = np.full(device_count, -1, dtype=np.int64)
+        self.device_position = np.zeros(device_count, dtype=np.int64)
+
+    @property
+    def rack_count(self):
+        return self.allocator.rack_count
+
+    def place(self, devices, keep_together=False):
+        heights = self.device_height[devices].tolist()
+        if keep_together:
+            locations = self.allocator.allocate_group(heights)
+        else:
+            locations = [self.allocator.allocate(height) for height in heights]
+
+        for device, (rack, position) in zip(devices, locations):
+            self.device_rack[device] = rack
+            self.device_position[device] = position
+
+
+def layer_ranges(size):
+    counts = [size["core_number"], size["aggregation_number"], size["edge_number"], size["host_number"]]
+    starts = np.cumsum([0] + counts)
+    return {layer: np.arange(starts[i], starts[i + 1])
+            for i, layer in enumerate(["core", "aggregation", "edge", "hosts"])}
+
+
+def ordered_placement(size, layout=None, policy=FIRST_FIT, rack_count=0):
+    # devices are racked in creation order, what create_topology.build_topology does without a placement
+    layout = layout or RackLayout()
+    filler = RackFiller(size, policy, rack_count)
+    filler.place(np.arange(len(filler.device_rack)))
+    return Placement(size, filler.device_rack, filler.device_position, layout.grid(filler.rack_count), layout)
+
+
+def first_fit_placement(size, layout=None):
+    return ordered_placement(size, layout, FIRST_FIT)
+
+
+def balanced_placement(size, layout=None):
+    # spreads the devices over the minimal number of racks instead of filling them one after another
+    return ordered_placement(size, layout, BALANCED, rack_count=size["rack_number"])
+
+
+def pod_placement(size, layout=None, dedicated_core_racks=True, keep_edge_groups=True, policy=FIRST_FIT):
+    # every pod is packed together with its aggregation switches first and each edge switch followed by
+    # its own hosts; keep_edge_groups starts a new rack rather than splitting an edge switch from its hosts,
+    # dedicated_core_racks gives core switches their own racks in the middle of the room and the per-pod
+    # policy gives every pod racks of its own
+    layout = layout or RackLayout()
+    ranges = layer_ranges(size)
+    core, aggregation, edge, hosts = ranges["core"], ranges["aggregation"], ranges["edge"], ranges["hosts"]
+    filler = RackFiller(size, policy)
+
+    filler.place(core)
+    core_racks = filler.rack_count if dedicated_core_racks else 0
+    if dedicated_core_racks:
+        filler.allocator.close_racks()
+
+    pod_number = max(size["pod_number"], 1)
+    edge_per_pod = len(edge) // pod_number
+    # aggregation switches are created top level first and numbered pod by pod within every level
+    counts = size.get("level_counts", [0, 0, len(aggregation), 0])
+    aggregation_levels = np.split(aggregation, np.cumsum(counts[-2:1:-1])[:-1])
+    hosts_per_switch = len(hosts) // len(edge) if len(edge) else 0
+
+    def place_edge_group(edge_index):
+        local = edge_index - edge[0]
+        filler.place(np.r_[edge_index, hosts[local * hosts_per_switch:(local + 1) * hosts_per_switch]],
+                     keep_together=keep_edge_groups)
+
+    for pod_id in range(pod_number):
+        filler.allocator.start_pod()
+        for level in aggregation_levels:
+            per_pod = len(level) // pod_number
+            filler.place(level[pod_id * per_pod:(pod_id + 1) * per_pod])
+        for edge_index in edge[pod_id * edge_per_pod:(pod_id + 1) * edge_per_pod]:
+            place_edge_group(edge_index)
+
+    # switches and hosts that do not belong to any pod or edge switch
+    filler.allocator.start_pod()
+    for level in aggregation_levels:
+        filler.place(level[pod_number * (len(level) // pod_number):])
+    for edge_index in edge[pod_number * edge_per_pod:]:
+        place_edge_group(edge_index)
+    filler.place(hosts[len(edge) * hosts_per_switch:])
+
+    coordinates = layout.coordinates(filler.rack_count, central_racks=core_racks)
+    return Placement(size, filler.device_rack, filler.device_position, coordinates, layout)
+
+
+def policy_placement(size, policy):
+    # racks for one of the rack_allocator policies, devices of a pod stay together with per_pod; a policy only
+    # decides which rack every device goes into, so the cables are not measured on a layout and the cost stays
+    # comparable with first fit
+    if policy == BALANCED:
+        placement = balanced_placement(size)
+    elif policy == PER_POD:
+        placement = pod_placement(size, dedicated_core_racks=False, policy=PER_POD)
+    else:
+        placement = first_fit_placement(size)
+    placement.measured = False
+    return placement
+
+
+def placement_cost(config, placement, prices=Prices):
+    plan = build_cabling_plan(config, prices=prices, placement=placement)
+    cable_meters = float(plan.length.sum())
+    rack_cost = placement.rack_count * prices.getRackPriceBasedOnHeight(placement.size["rack_height"])
+    return {
+        "racks": placement.rack_count,
+        "cable_meters": cable_meters,
+        "cable_cost": round(cable_meters * prices.rj45_cat_7, 2),
+        "rack_cost": round(rack_cost, 2),
+        "total": round(cable_meters * prices.rj45_cat_7 + rack_cost, 2),
+    }
+
+
+def optimize_placement(config, layout=None, prices=Prices):
+    # evaluates every strategy on the same rack layout and keeps the cheapest one
+    size = size_topology(config)
+    layout = layout or RackLayout()
+
+    candidates = {"first_fit": first_fit_placement(size, layout), "balanced": balanced_placement(size, layout)}
+    for policy in (FIRST_FIT, PER_POD):
+        for dedicated_core_racks in (False, True):
+            for keep_edge_groups in (False, True):
+                name = ("per_pod" if policy == PER_POD else "pod") + ("_central_core" if dedicated_core_racks else "") + \
+                    ("_grouped" if keep_edge_groups else "")
+                candidates[name] = pod_placement(size, layout, dedicated_core_racks, keep_edge_groups, policy)
+
+    costs = {name: placement_cost(config, placement, prices) for name, placement in candidates.items()}
+    best = min(costs, key=lambda name: costs[name]["total"])
+
+    return candidates[best], {
+        "strategies": costs,
+        "best": best,
+        "saved_meters": costs["first_fit"]["cable_meters"] - costs[best]["cable_meters"],
+        "saved_money": round(costs["first_fit"]["total"] - costs[best]["total"], 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare first-fit and pod-aware rack placement")
+    parser.add_argument("--config", default="L2_config.json")
+    parser.add_argument("--racks-per-row", type=int, default=RACKS_PER_ROW)
+    args = parser.parse_args()
+    loadPrices()
+    loadDistances()
+
+    placement, report = optimize_placement(load_config(args.config), RackLayout(racks_per_row=args.racks_per_row))
+
+    print("=" * 20)
+    for name, result in report["strategies"].items():
+        print(f"{name}: {result['racks']} racks, {result['cable_meters']:.0f}m of cable, "
+              f"cables {result['cable_cost']} + racks {result['rack_cost']} = {result['total']}")
+    print("=" * 20)
+    print(f"Best: {report['best']}")
+    print(f"Saved compared to first fit: {report['saved_meters']:.0f}m of cable, {report['saved_money']}")
+
+
+if __name__ == "__main__":
+    main()
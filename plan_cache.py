@@ -0,0 +1,85 @@
+import hashlib
+import json
+import os
+import zipfile
+
+from topology_files import load_npz, save_npz
+
+PLAN_CACHE_DIRECTORY = ".plan_cache"
+# plans kept on disk, the least recently used one is deleted when another one is stored
+PLAN_CACHE_SIZE = 32
+# part of every key, raised whenever the columns of a plan change so older entries are never read
+PLAN_CACHE_VERSION = 2
+
+
+def numeric_attributes(cls):
+    # the prices or distances a Prices or Distances class (or a subclass loaded from a file) stands for
+    return {name: getattr(cls, name) for name in dir(cls)
+            if not name.startswith("_") and isinstance(getattr(cls, name), (int, float))}
+
+
+def input_hash(**inputs):
+    # inputs are anything JSON can hold, dictionaries are hashed independent of their key order
+    text = json.dumps(dict(inputs, version=PLAN_CACHE_VERSION), sort_keys=True)
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+class PlanCache:
+    # Computed plans as .npz files named by the hash of their inputs. A hit touches the file, so the file with
+    # the oldest modification time is always the least recently used plan. directory=None disables the cache.
+    def __init__(self, directory=PLAN_CACHE_DIRECTORY, max_entries=PLAN_CACHE_SIZE):
+        if max_entries < 1:
+            raise ValueError(f"A plan cache needs room for at least one plan, not {max_entries}")
+        self.directory = directory
+        self.max_entries = max_entries
+
+    def path(self, key):
+        return os.path.join(self.directory, f"{key}.npz")
+
+    def get(self, key):
+        if self.directory is None:
+            return None
+
+        path = self.path(key)
+        try:
+            columns = load_npz(path)
+            os.utime(path)
+        except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+            # a missing or broken entry only costs the computation it would have saved
+            return None
+        # the cache may have been filled by runs that kept more plans
+        self.evict()
+        return columns
+
+    def store(self, key, columns):
+        if self.directory is None:
+            return
+
+        os.makedirs(self.directory, exist_ok=True)
+        # written next to the entry and renamed, so a killed run never leaves half a plan behind
+        temporary_path = f"{self.path(key)}.tmp"
+        with open(temporary_path, "wb") as plan_file:
+            save_npz(columns, plan_file)
+        os.replace(temporary_path, self.path(key))
+        self.evict()
+
+    def entries(self):
+        # paths of the stored plans, least recently used first
+        paths = [os.path.join(self.directory, name) for name in os.listdir(self.directory) if name.endswith(".npz")]
+        return sorted(paths, key=os.path.getmtime)
+
+    def evict(self):
+        for path in self.entries()[:-self.max_entries]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                # another run evicted it first
+                pass
+
+    def clear(self):
+        if self.directory is None or not os.path.isdir(self.directory):
+            return 0
+        paths = self.entries()
+        for path in paths:
+            os.remove(path)
+        return len(paths)
@@ -1,5 +1,7 @@
 import json
 
+PRICES_PATH = "prices.json"
+
 class Prices:
     rj45_cat_7 = 579 / 100
     rack_42u = 2000
@@ -7,14 +9,18 @@ class Prices:
     router_price = 6348.66
     switch_price = 6476.75
 
-    @staticmethod
-    def getRackPriceBasedOnHeight(rack_height):
-        return Prices.rack_42u * rack_height / 42
+    @classmethod
+    def getRackPriceBasedOnHeight(cls, rack_height):
+        return cls.rack_42u * rack_height / 42
 
-def loadPrices():
-    with open('prices.json') as json_file:
+def loadPrices(path=PRICES_PATH):
+    # replaces the defaults of the class, for every user of the module
+    with open(path) as json_file:
         data = json.load(json_file)
         for key in data:
             setattr(Prices, key, data[key])
 
-loadPrices()
+def loadPricesFile(path):
+    # alternate price list as a Prices subclass, the global Prices stay untouched
+    with open(path) as json_file:
+        return type("Prices", (Prices,), json.load(json_file))
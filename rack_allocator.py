@@ -0,0 +1,109 @@
+import heapq
+
+FIRST_FIT = "first_fit"
+PER_POD = "per_pod"
+BALANCED = "balanced"
+POLICIES = [FIRST_FIT, PER_POD, BALANCED]
+
+# rack units taken by one device of every role, config keys "switch_height" and "host_height" override them
+DEVICE_HEIGHTS = {"switch": 1, "host": 1}
+
+
+class RackAllocator:
+    # Tracks the used U of every rack and hands out (rack index, 1-based position) pairs. Racks are opened
+    # on demand whenever no open rack has room, so the caller only has to create them.
+    #   first_fit - the lowest numbered rack with enough free U
+    #   per_pod   - first fit, but every pod started with start_pod() gets racks of its own
+    #   balanced  - the rack with the most free U, so devices are spread over all racks given upfront
+    def __init__(self, rack_height, policy=FIRST_FIT, rack_count=0):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown rack policy: {policy}")
+
+        self.rack_height = rack_height
+        self.policy = policy
+        self.used = []
+        # racks before first_open belong to finished pods
+        self.first_open = 0
+        # first rack that may still fit a device of a given height; racks only fill up, so it never moves back
+        self.cursors = {}
+        # (-free U, rack) of every rack for the balanced policy
+        self.free_heap = []
+
+        for _ in range(rack_count):
+            self.open_rack()
+
+    @property
+    def rack_count(self):
+        return len(self.used)
+
+    def free(self, rack):
+        return self.rack_height - self.used[rack]
+
+    def open_rack(self):
+        self.used.append(0)
+        if self.policy == BALANCED:
+            heapq.heappush(self.free_heap, (-self.rack_height, len(self.used) - 1))
+        return len(self.used) - 1
+
+    def start_pod(self):
+        # the per-pod policy never mixes pods in one rack, other policies ignore pod boundaries
+        if self.policy == PER_POD:
+            self.close_racks()
+
+    def close_racks(self):
+        # first fit never goes back to the racks used so far
+        if self.used and self.used[-1] == 0:
+            self.first_open = len(self.used) - 1
+        else:
+            self.first_open = len(self.used)
+
+    def allocate(self, height=1):
+        if height > self.rack_height:
+            raise ValueError(f"A device of {height} U does not fit into a rack of {self.rack_height} U")
+
+        if self.policy == BALANCED:
+            rack = self.find_balanced_rack(height)
+        else:
+            rack = self.find_first_fit_rack(height)
+
+        position = self.used[rack] + 1
+        self.used[rack] += height
+        if self.policy == BALANCED:
+            heapq.heappush(self.free_heap, (-self.free(rack), rack))
+        return rack, position
+
+    def allocate_group(self, heights):
+        # devices that fit into one rack together, e.g. an edge switch and its hosts, are never split
+        total_height = sum(heights)
+        if total_height > self.rack_height or self.policy == BALANCED:
+            return [self.allocate(height) for height in heights]
+
+        rack, position = self.allocate(total_height)
+        locations = []
+        for height in heights:
+            locations.append((rack, position))
+            position += height
+        return locations
+
+    def find_first_fit_rack(self, height):
+        rack = max(self.cursors.get(height, 0), self.first_open)
+        while rack < len(self.used) and self.free(rack) < height:
+            rack += 1
+        self.cursors[height] = rack
+
+        if rack == len(self.used):
+            self.open_rack()
+        return rack
+
+    def find_balanced_rack(self, height):
+        if self.free_heap and -self.free_heap[0][0] >= height:
+            return heapq.heappop(self.free_heap)[1]
+
+        # the emptiest rack cannot take the device, so none can
+        rack = self.open_rack()
+        heapq.heappop(self.free_heap)
+        return rack
+
+
+def device_heights(config):
+    return {role: config.get(f"{role}_height", height) for role, height in DEVICE_HEIGHTS.items()}
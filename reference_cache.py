@@ -0,0 +1,69 @@
+import json
+import os
+import threading
+import time
+
+REFERENCE_CACHE_PATH = "reference_cache.json"
+# seconds a cached id is trusted before NetBox is asked again
+REFERENCE_CACHE_TTL = 3600
+
+
+class ReferenceCache:
+    # Ids of reference objects (custom fields, sites, manufacturers, device types and roles) by endpoint and
+    # slug, together with the body they were stored with, so a changed body is never answered from the cache.
+    # Entries live in memory and, when a path is given, in a JSON file shared by runs against the same host.
+    def __init__(self, host, path=None, ttl=REFERENCE_CACHE_TTL):
+        self.host = host
+        self.path = path
+        self.ttl = ttl
+        self.entries = {}
+        self.lock = threading.Lock()
+
+        if path is not None and os.path.exists(path):
+            try:
+                with open(path) as cache_file:
+                    self.entries = json.load(cache_file).get(host, {})
+            except (ValueError, OSError):
+                # a broken cache only costs the lookups it would have saved
+                self.entries = {}
+
+    @staticmethod
+    def key(endpoint, slug):
+        return f"{endpoint} {slug}"
+
+    def get(self, endpoint, slug, body):
+        entry = self.entries.get(self.key(endpoint, slug))
+        if entry is None or entry["body"] != body or time.time() - entry["stored_at"] > self.ttl:
+            return None
+        return entry["id"]
+
+    def store(self, endpoint, slug, body, object_id):
+        with self.lock:
+            self.entries[self.key(endpoint, slug)] = {"id": object_id, "body": body, "stored_at": time.time()}
+            self.save()
+
+    def invalidate(self, endpoint):
+        # objects of an endpoint were deleted, none of their ids is valid any more
+        with self.lock:
+            prefix = self.key(endpoint, "")
+            self.entries = {key: entry for key, entry in self.entries.items() if not key.startswith(prefix)}
+            self.save()
+
+    def save(self):
+        if self.path is None:
+            return
+
+        hosts = {}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path) as cache_file:
+                    hosts = json.load(cache_file)
+            except (ValueError, OSError):
+                hosts = {}
+        hosts[self.host] = self.entries
+
+        # written next to the cache and renamed, so a killed run never leaves half a file behind
+        temporary_path = f"{self.path}.tmp"
+        with open(temporary_path, "w") as cache_file:
+            json.dump(hosts, cache_file)
+        os.replace(temporary_path, self.path)
@@ -0,0 +1,188 @@
+import argparse
+import csv
+import itertools
+import json
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from cost_calculator import calculate_cost
+from prices import PRICES_PATH, loadPricesFile
+from distances import DISTANCES_PATH, loadDistancesFile
+
+COLUMNS = [
+    "tree_level", "ports_per_switch", "rack_height", "switch_height", "host_height", "prices", "distances",
+    "hosts", "switches", "racks", "cables", "cable_meters", "total_cost", "cost_per_host", "switches_per_host",
+]
+FORMATS = ["csv", "jsonl", "npz"]
+
+# price and distance files are loaded once per worker process
+loaded_prices = {}
+loaded_distances = {}
+
+
+def parse_values(text):
+    # "4", "4,8,16" or an inclusive range "4:64:2"
+    if ":" in text:
+        parts = [int(part) for part in text.split(":")]
+        start, stop = parts[0], parts[1]
+        step = parts[2] if len(parts) > 2 else 1
+        return list(range(start, stop + 1, step))
+    return [int(value) for value in text.split(",")]
+
+
+def port_values(text):
+    ports = parse_values(text)
+    odd = [value for value in ports if value % 2]
+    if odd:
+        # half of the ports of a switch go down and half up, an odd count would silently be costed one port lower
+        raise argparse.ArgumentTypeError(f"ports per switch must be even, not {', '.join(map(str, odd))}")
+    return ports
+
+
+def get_prices(path):
+    # None stands for the default file, workers never depend on what the parent process loaded
+    path = PRICES_PATH if path is None else path
+    if path not in loaded_prices:
+        loaded_prices[path] = loadPricesFile(path)
+    return loaded_prices[path]
+
+
+def get_distances(path):
+    path = DISTANCES_PATH if path is None else path
+    if path not in loaded_distances:
+        loaded_distances[path] = loadDistancesFile(path)
+    return loaded_distances[path]
+
+
+def evaluate_design(design):
+    tree_level, ports_per_switch, rack_height, switch_height, host_height, prices_path, distances_path = design
+
+    try:
+        # the pod size of 2-level trees only matters to the per-pod placement, the first-fit cost is the same
+        # for all of them
+        bom = calculate_cost(tree_level, ports_per_switch, None, rack_height, get_prices(prices_path),
+                             get_distances(distances_path), heights={"switch": switch_height, "host": host_height})
+    except (ValueError, ZeroDivisionError):
+        # the design cannot be wired with this many ports
+        return None
+
+    size = bom["size"]
+    switches = size["core_number"] + size["aggregation_number"] + size["edge_number"]
+    hosts = size["host_number"]
+
+    return {
+        "tree_level": tree_level,
+        "ports_per_switch": ports_per_switch,
+        "rack_height": rack_height,
+        "switch_height": switch_height,
+        "host_height": host_height,
+        "prices": prices_path or PRICES_PATH,
+        "distances": distances_path or DISTANCES_PATH,
+        "hosts": hosts,
+        "switches": switches,
+        "racks": bom["groups"]["racks"]["count"],
+        "cables": bom["groups"]["cables"]["count"],
+        "cable_meters": bom["cable_types"]["rj45_cat_7"]["length"],
+        "total_cost": bom["total"],
+        "cost_per_host": round(bom["total"] / hosts, 2) if hosts else None,
+        "switches_per_host": switches / hosts if hosts else None,
+    }
+
+
+def sweep_designs(tree_levels, ports, rack_heights, prices_paths=(None,), distances_paths=(None,),
+                  switch_heights=(1,), host_heights=(1,)):
+    return itertools.product(tree_levels, ports, rack_heights, switch_heights, host_heights, prices_paths,
+                             distances_paths)
+
+
+def sweep(tree_levels, ports, rack_heights, prices_paths=(None,), distances_paths=(None,), workers=None,
+          chunk_size=64, switch_heights=(1,), host_heights=(1,)):
+    designs = sweep_designs(tree_levels, ports, rack_heights, prices_paths, distances_paths, switch_heights,
+                            host_heights)
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # map keeps the order of designs and yields results while later chunks are still evaluated
+        for row in executor.map(evaluate_design, designs, chunksize=chunk_size):
+            yield row
+
+
+def add_sweep_arguments(parser):
+    parser.add_argument("--tree-levels", type=parse_values, default="2,3",
+                        help='values like "2,3" or an inclusive range "2:3"')
+    parser.add_argument("--ports", type=port_values, default="4:64:2", help="ports per switch, even")
+    parser.add_argument("--rack-heights", type=parse_values, default="42")
+    parser.add_argument("--switch-heights", type=parse_values, default="1", help="rack units of a switch")
+    parser.add_argument("--host-heights", type=parse_values, default="1", help="rack units of a host")
+    parser.add_argument("--prices", nargs="+", default=[None], help="alternate price files")
+    parser.add_argument("--distances", nargs="+", default=[None], help="alternate distance files")
+    parser.add_argument("--format", choices=FORMATS, default="csv",
+                        help="rows as csv or jsonl, or npz with one array per column (needs --output)")
+    parser.add_argument("--output", help="output file, stdout by default")
+    parser.add_argument("--workers", type=int, help="number of processes, all cores by default")
+
+
+class ColumnWriter:
+    # Collects the rows as one list per column and saves them as NumPy arrays in an .npz file on close, the
+    # columnar form for analysis tools (np.load gives every column as a typed array); a missing cost per host is
+    # NaN
+    def __init__(self, path):
+        self.path = path
+        self.columns = {column: [] for column in COLUMNS}
+
+    def write(self, row):
+        for column, values in self.columns.items():
+            values.append(row[column])
+
+    def close(self):
+        arrays = {column: np.array([np.nan if value is None else value for value in values])
+                  for column, values in self.columns.items()}
+        with open(self.path, "wb") as output:
+            np.savez(output, **arrays)
+
+
+def run_sweep(args):
+    if args.format == "npz":
+        if not args.output:
+            raise ValueError("--format npz writes a binary file and needs --output")
+        output = ColumnWriter(args.output)
+        write_row = output.write
+    else:
+        output = open(args.output, "w", newline="") if args.output else sys.stdout
+        if args.format == "csv":
+            writer = csv.DictWriter(output, fieldnames=COLUMNS)
+            writer.writeheader()
+            write_row = writer.writerow
+        else:
+            write_row = lambda row: output.write(json.dumps(row) + "\n")
+
+    sweep_start = time.perf_counter()
+    evaluated = 0
+    written = 0
+    for row in sweep(args.tree_levels, args.ports, args.rack_heights, args.prices, args.distances, args.workers,
+                     switch_heights=args.switch_heights, host_heights=args.host_heights):
+        evaluated += 1
+        if row is not None:
+            write_row(row)
+            written += 1
+
+    if args.output:
+        output.close()
+
+    print(f"{evaluated} designs evaluated, {written} valid, in {time.perf_counter() - sweep_start:.2f} s",
+          file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate the cost of many fat tree designs in parallel")
+    add_sweep_arguments(parser)
+    try:
+        run_sweep(parser.parse_args())
+    except ValueError as error:
+        parser.error(str(error))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+import argparse
+import time
+
+from create_topology import (
+    PROVISIONING_WORKERS, build_topology, load_config, print_cost_summary, bill_of_materials, assign_ids,
+    setup_reference_data,
+)
+from distances import loadDistances
+from netbox_client import NetboxClient
+from prices import loadPrices
+from reference_cache import REFERENCE_CACHE_PATH
+
+
+def reference_id(value):
+    # NetBox nests related objects, bodies only carry their ids
+    if isinstance(value, dict):
+        return value["id"]
+    return value
+
+
+def rounded(value):
+    # lengths and prices are stored as decimals with two places
+    return None if value is None else round(float(value), 2)
+
+
+def diff_objects(desired, existing, normalize):
+    # desired and existing map a natural key (e.g. the name) to a body and to a fetched NetBox object;
+    # returns the keys to create, the partial bodies to PATCH and the ids to delete
+    create, update = [], []
+    for key, body in desired.items():
+        current = existing.get(key)
+        if current is None:
+            create.append(key)
+            continue
+
+        wanted = normalize(body)
+        stored = normalize(current)
+        changes = {field: body[field] for field, value in wanted.items() if stored.get(field) != value}
+        if changes:
+            update.append(dict(changes, id=current["id"]))
+
+    delete = [existing[key]["id"] for key in existing.keys() - desired.keys()]
+    return create, update, delete
+
+
+def normalize_rack(rack):
+    return {"site": reference_id(rack["site"]), "u_height": rack["u_height"]}
+
+
+def normalize_device(device):
+    # NetBox 3.6 renamed device_role to role, the API still accepts device_role on writes
+    role = device["device_role"] if device.get("device_role") is not None else device.get("role")
+    position = device["position"]
+    return {
+        "device_type": reference_id(device["device_type"]),
+        "device_role": reference_id(role),
+        "site": reference_id(device["site"]),
+        "rack": reference_id(device["rack"]),
+        "position": None if position is None else int(float(position)),
+    }
+
+
+def normalize_interface(interface):
+    interface_type = interface["type"]
+    return {"type": interface_type["value"] if isinstance(interface_type, dict) else interface_type}
+
+
+def normalize_cable(cable):
+    return {"length": rounded(cable["length"]), "custom_fields": {"price": rounded(cable["custom_fields"]["price"])}}
+
+
+def cable_key(a_interface_id, b_interface_id):
+    return tuple(sorted([a_interface_id, b_interface_id]))
+
+
+def existing_cable_key(cable):
+    return cable_key(cable["a_terminations"][0]["object_id"], cable["b_terminations"][0]["object_id"])
+
+
+def sync_topology(client, topology):
+    # reconciles NetBox with the topology: objects are matched by name (cables by their two interfaces),
+    # only missing objects are created, changed fields patched and objects that are no longer wanted deleted
+    size = topology.size
+    references = setup_reference_data(client, {"switch": size["switch_height"], "host": size["host_height"]})
+    site_id = references["site_id"]
+    devices = topology.devices()
+
+    # the four listings do not depend on each other and are fetched in parallel
+    racks, netbox_devices, interfaces, cables = client.map_concurrently(
+        lambda get: get(site_id=site_id),
+        [client.get_racks, client.get_devices, client.get_interfaces, client.get_cables],
+    )
+    existing_racks = {rack["name"]: rack for rack in racks}
+    existing_devices = {device["name"]: device for device in netbox_devices}
+    existing_interfaces = {(interface["device"]["name"], interface["name"]): interface for interface in interfaces}
+    existing_cables = {existing_cable_key(cable): cable for cable in cables}
+
+    # objects that already exist keep their ids, so every diff below can be computed before anything is written
+    for rack in topology.racks:
+        rack.id = existing_racks[rack.name]["id"] if rack.name in existing_racks else None
+    for device in devices:
+        device.id = existing_devices[device.name]["id"] if device.name in existing_devices else None
+        for interface in device.interfaces:
+            existing = existing_interfaces.get((device.name, interface.name))
+            interface.id = existing["id"] if existing is not None else None
+
+    desired_racks = {rack.name: client.rack_body(rack.name, rack.height, site_id) for rack in topology.racks}
+    rack_diff = diff_objects(desired_racks, existing_racks, normalize_rack)
+
+    desired_interfaces = {
+        (device.name, interface.name): client.interface_body(interface.name, device.id)
+        for device in devices for interface in device.interfaces
+    }
+    interface_diff = diff_objects(desired_interfaces, existing_interfaces, normalize_interface)
+
+    desired_cables = {}
+    new_cables = []
+    for cable in topology.cables:
+        body = client.cable_body(cable.a_interface.id, cable.b_interface.id, cable.length, cable.price)
+        if cable.a_interface.id is None or cable.b_interface.id is None:
+            new_cables.append(cable)
+        else:
+            desired_cables[cable_key(cable.a_interface.id, cable.b_interface.id)] = body
+    cable_diff = diff_objects(desired_cables, existing_cables, normalize_cable)
+
+    # cables and interfaces go first so that ports and rack units are free before anything is created,
+    # racks go last because they can only be deleted once they are empty
+    stale_devices = {existing_devices[name]["id"] for name in existing_devices.keys() - {d.name for d in devices}}
+    # interfaces of deleted devices are removed by NetBox together with the device
+    stale_interfaces = set(interface_diff[2])
+    stale_interfaces = [interface["id"] for interface in existing_interfaces.values()
+                        if interface["id"] in stale_interfaces and interface["device"]["id"] not in stale_devices]
+    if cable_diff[2]:
+        client.delete_cables(cable_diff[2])
+    if stale_interfaces:
+        client.delete_interfaces(stale_interfaces)
+    if stale_devices:
+        client.delete_devices(list(stale_devices))
+
+    missing_racks = set(rack_diff[0])
+    new_racks = [rack for rack in topology.racks if rack.name in missing_racks]
+    if new_racks:
+        assign_ids(new_racks, client.create_racks([
+            {"name": rack.name, "device_number": rack.height, "site_id": site_id} for rack in new_racks
+        ]))
+    # a rack can only shrink once no device sits above its new height
+    existing_heights = {rack["id"]: rack["u_height"] for rack in existing_racks.values()}
+    shrinking_racks = [rack for rack in rack_diff[1] if rack.get("u_height", 0) < existing_heights[rack["id"]]]
+    growing_racks = [rack for rack in rack_diff[1] if rack.get("u_height", 0) >= existing_heights[rack["id"]]]
+    if growing_racks:
+        client.update_racks(growing_racks)
+
+    device_changes = sync_devices(client, references, devices, existing_devices)
+    if shrinking_racks:
+        client.update_racks(shrinking_racks)
+
+    new_interfaces = [interface for device in devices for interface in device.interfaces if interface.id is None]
+    if new_interfaces:
+        assign_ids(new_interfaces, client.create_interfaces([
+            {"name": interface.name, "device_id": interface.device.id} for interface in new_interfaces
+        ]))
+
+    missing_cables = set(cable_diff[0])
+    new_cables += [cable for cable in topology.cables
+                   if cable.id is None and cable_key(cable.a_interface.id, cable.b_interface.id) in missing_cables]
+    if new_cables:
+        assign_ids(new_cables, client.create_cables([
+            {"int1_id": cable.a_interface.id, "int2_id": cable.b_interface.id, "length": cable.length,
+             "price": cable.price}
+            for cable in new_cables
+        ]))
+    if cable_diff[1]:
+        client.update_cables(cable_diff[1])
+    for cable in topology.cables:
+        if cable.id is None:
+            cable.id = existing_cables[cable_key(cable.a_interface.id, cable.b_interface.id)]["id"]
+
+    if rack_diff[2]:
+        client.delete_racks(rack_diff[2])
+
+    return {
+        "racks": (len(new_racks), len(rack_diff[1]), len(rack_diff[2])),
+        "devices": device_changes + (len(stale_devices),),
+        "interfaces": (len(new_interfaces), len(interface_diff[1]), len(stale_interfaces)),
+        "cables": (len(new_cables), len(cable_diff[1]), len(cable_diff[2])),
+    }
+
+
+def sync_devices(client, references, devices, existing_devices):
+    desired = {
+        device.name: client.device_body(
+            device.name, references["device_types"][device.role], references["device_roles"][device.role],
+            references["site_id"], device.get_rack_id(), device.position,
+        )
+        for device in devices
+    }
+    # the body only changes the fields that differ, stale devices have already been deleted
+    existing = {name: device for name, device in existing_devices.items() if name in desired}
+    _, updates, _ = diff_objects(desired, existing, normalize_device)
+
+    # devices that move are unracked first, so two devices can swap rack units
+    moves = [{"id": update["id"], "position": None} for update in updates if "position" in update or "rack" in update]
+    if moves:
+        client.update_devices(moves)
+
+    new_devices = [device for device in devices if device.id is None]
+    if new_devices:
+        assign_ids(new_devices, client.create_devices([
+            {
+                "name": device.name,
+                "type_id": references["device_types"][device.role],
+                "role_id": references["device_roles"][device.role],
+                "site_id": references["site_id"],
+                "rack_id": device.get_rack_id(),
+                "rack_position": device.position,
+            }
+            for device in new_devices
+        ]))
+    if updates:
+        client.update_devices(updates)
+    return len(new_devices), len(updates)
+
+
+def print_sync_report(report, duration):
+    print("=" * 20)
+    print("Sync:")
+    for resource, (created, updated, deleted) in report.items():
+        print(f"{resource}: {created} created, {updated} updated, {deleted} deleted")
+    print(f"Sync took {duration:.2f} s")
+    print("=" * 20)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bring NetBox in line with a topology config without rebuilding it")
+    parser.add_argument("--config", default="L2_config.json")
+    parser.add_argument("--workers", type=int, default=PROVISIONING_WORKERS, help="parallel requests")
+    args = parser.parse_args()
+    loadPrices()
+    loadDistances()
+
+    topology = build_topology(load_config(args.config))
+
+    client = NetboxClient(workers=args.workers, reference_cache_path=REFERENCE_CACHE_PATH)
+    client.auth()
+
+    start = time.perf_counter()
+    report = sync_topology(client, topology)
+    print_sync_report(report, time.perf_counter() - start)
+    print_cost_summary(bill_of_materials(topology.cost_table_entities()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,12 @@
+import json
+
+import pytest
+
+
+@pytest.fixture
+def netbox_credentials(tmp_path, monkeypatch):
+    # NetboxClient.auth reads credentials.json and the reference cache is written to the working directory,
+    # both are kept out of the repository
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "credentials.json").write_text(json.dumps({"username": "user", "password": "password"}))
+    return tmp_path
@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+
+from cabling_plan import bill_of_materials, build_cabling_plan, compare_with_object_model, plan_from_columns
+from create_topology import build_topology, load_config, size_topology
+from placement import optimize_placement, policy_placement
+from rack_allocator import BALANCED, PER_POD
+from topology_files import columns_from_plan, columns_from_topology
+
+CONFIGS = [
+    {"tree_level": 2, "ports_per_switch": 8, "pod_size": 4, "rack_height": 42},
+    {"tree_level": 2, "ports_per_switch": 6, "pod_size": 2, "rack_height": 5, "switch_height": 2},
+    {"tree_level": 3, "ports_per_switch": 4, "rack_height": 42},
+    {"tree_level": 3, "ports_per_switch": 8, "rack_height": 10, "switch_height": 2, "host_height": 3},
+    {"tree_level": 4, "ports_per_switch": 6, "rack_height": 8, "oversubscription": [2, 1, 1]},
+]
+
+
+@pytest.mark.parametrize("config", CONFIGS, ids=str)
+def test_cable_bodies_match_object_model(config):
+    assert compare_with_object_model(config) == []
+
+
+@pytest.mark.parametrize("policy", [PER_POD, BALANCED])
+def test_cable_bodies_match_object_model_with_policy(policy):
+    config = load_config("L2_config.json")
+    assert compare_with_object_model(config, policy_placement(size_topology(config), policy)) == []
+
+
+def test_cable_bodies_match_object_model_with_optimized_placement():
+    config = load_config("L3_config.json")
+    assert compare_with_object_model(config, optimize_placement(config)[0]) == []
+
+
+@pytest.mark.parametrize("config", CONFIGS, ids=str)
+def test_plan_columns_match_object_model(config):
+    expected = columns_from_topology(build_topology(config))
+    calculated = columns_from_plan(build_cabling_plan(config))
+    for name in ["device_name", "device_layer", "device_rack", "port_count", "cable_a_device", "cable_a_port",
+                 "cable_b_device", "cable_b_port", "cable_length", "cable_price"]:
+        assert np.array_equal(expected[name], calculated[name]), name
+
+
+def test_plan_from_columns():
+    plan = build_cabling_plan(load_config("L3_config.json"))
+    restored = plan_from_columns(columns_from_plan(plan))
+    assert np.array_equal(restored.a_device, plan.a_device)
+    assert np.array_equal(restored.b_port, plan.b_port)
+    assert bill_of_materials(restored) == bill_of_materials(plan)
@@ -0,0 +1,51 @@
+import itertools
+
+import pytest
+
+from cost_calculator import calculate_cost, compare_with_object_model, first_fit_segments
+from create_topology import load_config, size_topology
+from distances import loadDistancesFile
+from prices import loadPricesFile
+
+
+def grid_configs():
+    # every tree depth with small and large racks, multi-U devices and oversubscribed edge switches
+    for tree_level, ports, rack_height, (switch_height, host_height), oversubscription in itertools.product(
+            [2, 3, 4], [4, 6, 8], [5, 10, 42], [(1, 1), (2, 1), (3, 2)], [None, 2, 3]):
+        config = {"tree_level": tree_level, "ports_per_switch": ports, "rack_height": rack_height,
+                  "switch_height": switch_height, "host_height": host_height}
+        if oversubscription is not None:
+            config["oversubscription"] = oversubscription
+        for pod_size in ([2, ports // 2] if tree_level == 2 else [None]):
+            yield dict(config, pod_size=pod_size) if pod_size is not None else config
+
+
+@pytest.mark.parametrize("config", list(grid_configs()), ids=str)
+def test_closed_form_matches_object_model(config):
+    assert compare_with_object_model(config) == []
+
+
+@pytest.mark.parametrize("config_path, total, racks, cable_length", [
+    ("L2_config.json", 818636.4, 2, 20060),
+    ("L3_config.json", 442196.92, 1, 48),
+])
+def test_closed_form_totals(config_path, total, racks, cable_length):
+    config = load_config(config_path)
+    result = calculate_cost(config["tree_level"], config["ports_per_switch"], config.get("pod_size"),
+                            config["rack_height"], loadPricesFile("prices.json"), loadDistancesFile("distances.json"))
+    assert result["total"] == total
+    assert result["groups"]["racks"]["count"] == racks
+    assert result["cable_types"]["rj45_cat_7"]["length"] == cable_length
+
+
+def test_multi_u_devices_fill_free_units_with_hosts():
+    # six 2U switches fill a 10U rack and a fifth of the next one, two 3U hosts take the rest of it
+    size = size_topology({"tree_level": 2, "ports_per_switch": 4, "pod_size": 2, "rack_height": 10,
+                          "switch_height": 2, "host_height": 3})
+    assert first_fit_segments(size) == [(0, 0, 5), (1, 5, 1), (1, 6, 2), (2, 8, 3), (3, 11, 3)]
+    assert calculate_cost(2, 4, 2, 10, heights={"switch": 2, "host": 3})["groups"]["racks"]["count"] == 4
+
+
+def test_device_taller_than_rack():
+    with pytest.raises(ValueError):
+        calculate_cost(2, 4, 2, 2, heights={"switch": 3, "host": 1})
@@ -0,0 +1,31 @@
+import pytest
+
+from create_topology import main, size_topology
+
+
+def test_pod_size_groups_edge_switches_of_two_level_trees():
+    config = {"tree_level": 2, "ports_per_switch": 8, "rack_height": 42}
+    assert size_topology(dict(config, pod_size=4))["pod_number"] == 2
+    assert size_topology(config)["pod_number"] == 1
+
+
+def test_pod_size_is_rejected_for_deeper_trees():
+    config = {"tree_level": 3, "ports_per_switch": 4, "rack_height": 42}
+    assert size_topology(config)["pod_number"] == 4
+    with pytest.raises(ValueError, match="pod_size"):
+        size_topology(dict(config, pod_size=4))
+
+
+def test_main_takes_the_options_of_cli(monkeypatch):
+    # the command line is built from the argument groups of cli.py, --host and --prices reach the run
+    calls = {}
+    monkeypatch.setattr("create_topology.loadPrices", lambda path: calls.setdefault("prices", path))
+    monkeypatch.setattr("create_topology.loadDistances", lambda path: calls.setdefault("distances", path))
+    monkeypatch.setattr("create_topology.create_topology", lambda config_path, **options: calls.update(options))
+    monkeypatch.setattr("sys.argv", ["create_topology.py", "--dry-run", "--host", "http://netbox:8000",
+                                     "--workers", "1", "--prices", "other_prices.json"])
+    main()
+    assert calls["host"] == "http://netbox:8000"
+    assert calls["workers"] == 1
+    assert calls["prices"] == "other_prices.json"
+    assert calls["distances"] == "distances.json"
@@ -0,0 +1,91 @@
+import numpy as np
+import pytest
+
+from analysis import NetworkGraph, bisection, from_cabling_plan, host_paths, tree_paths
+from cabling_plan import build_cabling_plan
+from failures import FailureState, evaluate_failures, random_failures
+
+CONFIGS = [
+    {"tree_level": 2, "ports_per_switch": 8, "pod_size": 4, "rack_height": 10},
+    {"tree_level": 3, "ports_per_switch": 6, "rack_height": 12, "oversubscription": 2},
+    {"tree_level": 4, "ports_per_switch": 6, "rack_height": 8, "oversubscription": [2, 1, 1]},
+]
+
+
+def tree_graph(config):
+    return from_cabling_plan(build_cabling_plan(config))
+
+
+@pytest.mark.parametrize("config", CONFIGS, ids=str)
+def test_intact_state_matches_closed_form(config):
+    graph = tree_graph(config)
+    intact = FailureState(graph).intact_result
+    paths = tree_paths(graph.size)
+    assert intact["lost_pairs"] == 0
+    assert intact["mean_paths"] == pytest.approx(paths["mean_paths"])
+    assert intact["mean_hops"] == pytest.approx(paths["mean_hops"])
+    assert intact["min_paths"] == paths["min_paths"]
+    assert intact["bisection_links"] == bisection(graph)["links"]
+
+
+@pytest.mark.parametrize("config", CONFIGS, ids=str)
+def test_incremental_failures_match_rebuilt_state(config):
+    # the rank-one updates must give what a state built from the surviving links gives
+    graph = tree_graph(config)
+    state = FailureState(graph)
+    rng = np.random.default_rng(1)
+    for _ in range(20):
+        failures = random_failures(graph, rng, links=int(rng.integers(0, 6)), switches=int(rng.integers(0, 3)),
+                                   racks=int(rng.integers(0, 2)))
+        for link in failures["links"]:
+            state.fail_link(link)
+        for device in failures["devices"]:
+            state.fail_device(device)
+        for rack in failures["racks"]:
+            state.fail_rack(rack)
+        result = state.evaluate()
+        alive, hosts_alive = state.link_alive.copy(), state.host_alive.copy()
+        state.restore()
+
+        rebuilt = FailureState(NetworkGraph(graph.size, graph.a_device[alive], graph.b_device[alive],
+                                            graph.device_rack))
+        rebuilt.host_alive &= hosts_alive
+        expected = rebuilt.evaluate()
+        for key in ["lost_pairs", "mean_paths", "min_paths", "mean_hops", "max_hops", "bisection_links"]:
+            assert result[key] == pytest.approx(expected[key]), key
+
+
+def test_failed_core_switch_keeps_every_pair_connected():
+    # device 0 is the first core switch
+    graph = tree_graph(CONFIGS[1])
+    result = evaluate_failures(FailureState(graph), devices=[0])
+    assert result["lost_pairs"] == 0
+    assert result["path_diversity"] < 1
+
+    # the paths left are what the breadth-first searches count on the remaining links
+    alive = (graph.a_device != 0) & (graph.b_device != 0)
+    paths = host_paths(NetworkGraph(graph.size, graph.a_device[alive], graph.b_device[alive]))
+    assert result["mean_paths"] == pytest.approx(paths["mean_paths"])
+
+
+def test_restore_gives_back_intact_tree():
+    graph = tree_graph(CONFIGS[0])
+    state = FailureState(graph)
+    evaluate_failures(state, links=[0, 5, 20], racks=[0])
+    result = evaluate_failures(state)
+    assert result["lost_pairs"] == 0
+    assert result["path_diversity"] == 1
+    assert result["capacity"] == 1
+
+
+def test_failed_edge_uplinks_disconnect_its_hosts():
+    # every uplink of edge switch 0 of the 2-level tree, its hosts only reach each other
+    graph = tree_graph(CONFIGS[0])
+    state = FailureState(graph)
+    edge = graph.level_devices(1)[0]
+    switches_above = graph.device_level[np.where(graph.a_device == edge, graph.b_device, graph.a_device)] == 2
+    uplinks = np.flatnonzero(((graph.a_device == edge) | (graph.b_device == edge)) & switches_above)
+    result = evaluate_failures(state, links=uplinks)
+    hosts = graph.size["host_number"]
+    below = graph.size["down_links"][1]
+    assert result["lost_pairs"] == 2 * below * (hosts - below)
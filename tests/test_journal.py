@@ -0,0 +1,80 @@
+import contextlib
+import io
+import os
+
+import pytest
+
+from cabling_plan import build_cabling_plan
+from create_topology import build_topology, provision_journaled
+from fake_netbox import FakeNetbox
+from journal import ProvisioningJournal
+from netbox_client import NetboxClient, NetboxError
+
+CONFIG = {"tree_level": 3, "ports_per_switch": 4, "rack_height": 42}
+ENDPOINTS = {"rack": "dcim/racks", "device": "dcim/devices", "interface": "dcim/interfaces", "cable": "dcim/cables"}
+
+
+def provision(fake, journal_path, resume, max_retries=0):
+    client = NetboxClient(host=fake.url, quiet=True, batch_size=7, max_retries=max_retries, backoff_factor=0,
+                          workers=1)
+    client.auth()
+    topology = build_topology(CONFIG)
+    with contextlib.redirect_stdout(io.StringIO()):
+        provision_journaled(client, topology, journal_path, resume, {"config": CONFIG}, plan=build_cabling_plan(CONFIG))
+    return topology
+
+
+def test_fingerprint_mismatch(tmp_path):
+    path = str(tmp_path / "journal.jsonl")
+    journal = ProvisioningJournal(path)
+    journal.start({"config": CONFIG})
+    journal.record("rack", ["rack_0"], [1])
+    journal.close()
+
+    with pytest.raises(ValueError):
+        ProvisioningJournal(path).resume({"config": dict(CONFIG, rack_height=48)})
+    resumed = ProvisioningJournal(path)
+    assert resumed.resume({"config": CONFIG}) == 1
+    assert resumed.get("rack", "rack_0") == 1
+    resumed.close()
+
+
+def test_cut_off_last_line_is_skipped(tmp_path):
+    path = str(tmp_path / "journal.jsonl")
+    journal = ProvisioningJournal(path)
+    journal.start({})
+    journal.record("device", ["a", "b"], [1, 2])
+    journal.close()
+    with open(path, "a") as journal_file:
+        journal_file.write('{"kind": "device", "na')
+
+    resumed = ProvisioningJournal(path)
+    assert resumed.resume({}) == 2
+    resumed.close()
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_resume_after_lost_responses_creates_every_object_once(netbox_credentials, seed):
+    # a run whose last response was lost stops, the resumed run must find what NetBox stored without it
+    journal_path = os.path.join(netbox_credentials, "journal.jsonl")
+    with FakeNetbox(lost_response_rate=0.1, seed=seed) as fake:
+        try:
+            topology = provision(fake, journal_path, resume=False)
+        except NetboxError:
+            fake.lost_response_rate = 0
+            topology = provision(fake, journal_path, resume=True, max_retries=3)
+
+        expected = {"rack": topology.racks, "device": topology.devices(), "cable": topology.cables,
+                    "interface": [interface for device in topology.devices() for interface in device.interfaces]}
+        for kind, objects in expected.items():
+            stored = fake.objects[ENDPOINTS[kind]]
+            assert len(stored) == len(objects), kind
+            assert sorted([item.id for item in objects]) == sorted(stored), kind
+
+
+def test_lost_creates_are_not_sent_twice(netbox_credentials):
+    # with retries the client looks lost creates up instead of failing the run
+    with FakeNetbox(lost_response_rate=0.3, seed=1) as fake:
+        topology = provision(fake, os.path.join(netbox_credentials, "journal.jsonl"), resume=False, max_retries=5)
+        assert len(fake.objects["dcim/devices"]) == len(topology.devices())
+        assert len(fake.objects["dcim/cables"]) == len(topology.cables)
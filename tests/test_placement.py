@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+from cabling_plan import build_cabling_plan
+from create_topology import build_topology, level_distance, size_topology
+from placement import optimize_placement, policy_placement
+from rack_allocator import BALANCED, FIRST_FIT, PER_POD
+
+CONFIGS = [
+    {"tree_level": 2, "ports_per_switch": 8, "pod_size": 4, "rack_height": 10},
+    {"tree_level": 3, "ports_per_switch": 4, "rack_height": 8, "switch_height": 2},
+]
+
+
+def cable_meters(topology):
+    return sum([cable.length for cable in topology.cables])
+
+
+@pytest.mark.parametrize("config", CONFIGS, ids=str)
+def test_first_fit_policy_has_the_cable_meters_of_first_fit(config):
+    # the same rack assignment through the policy path must not change how cables are measured
+    placement = policy_placement(size_topology(config), FIRST_FIT)
+    first_fit = build_topology(config)
+    policy = build_topology(config, placement)
+    assert [device.rack.name for device in policy.devices()] == [device.rack.name for device in first_fit.devices()]
+    assert cable_meters(policy) == cable_meters(first_fit)
+    assert build_cabling_plan(config, placement=placement).length.sum() == build_cabling_plan(config).length.sum()
+
+
+@pytest.mark.parametrize("policy", [PER_POD, BALANCED])
+@pytest.mark.parametrize("config", CONFIGS, ids=str)
+def test_policies_keep_the_layer_distances(config, policy):
+    # 1 m inside a rack, the distance of the layer between racks
+    topology = build_topology(config, policy_placement(size_topology(config), policy))
+    tree_level = config["tree_level"]
+    distances = {level_distance(tree_level, level) for level in range(1, tree_level + 1)}
+    assert {cable.length for cable in topology.cables} <= distances | {1}
+
+
+def test_optimized_placement_is_measured_on_the_layout():
+    config = CONFIGS[0]
+    placement, report = optimize_placement(config)
+    plan = build_cabling_plan(config, placement=placement)
+    assert placement.measured
+    assert np.isclose(plan.length.sum(), report["strategies"][report["best"]]["cable_meters"])
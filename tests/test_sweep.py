@@ -0,0 +1,31 @@
+import argparse
+
+import numpy as np
+import pytest
+
+from sweep import COLUMNS, add_sweep_arguments, run_sweep, sweep
+
+
+def test_every_design_is_evaluated_once():
+    rows = [row for row in sweep([2, 3], [4, 6], [10, 42], workers=1) if row is not None]
+    designs = [(row["tree_level"], row["ports_per_switch"], row["rack_height"]) for row in rows]
+    assert len(designs) == len(set(designs)) == 8
+
+
+def test_npz_output_has_one_array_per_column(tmp_path):
+    parser = argparse.ArgumentParser()
+    add_sweep_arguments(parser)
+    path = str(tmp_path / "sweep.npz")
+    run_sweep(parser.parse_args(["--tree-levels", "2,3", "--ports", "4,8", "--format", "npz", "--output", path,
+                                 "--workers", "1"]))
+    columns = np.load(path)
+    assert sorted(columns.files) == sorted(COLUMNS)
+    assert columns["tree_level"].tolist() == [2, 2, 3, 3]
+    assert columns["total_cost"].dtype == np.float64
+
+
+def test_odd_port_counts_are_rejected():
+    parser = argparse.ArgumentParser()
+    add_sweep_arguments(parser)
+    with pytest.raises(SystemExit):
+        parser.parse_args(["--ports", "4,5"])
@@ -0,0 +1,113 @@
+import io
+
+import numpy as np
+import pytest
+
+from analysis import analyze, from_topology
+from cabling_plan import bill_of_materials as plan_bill_of_materials, build_cabling_plan
+from compact import bill_of_materials as compact_bill_of_materials, build_compact_topology
+from cost_calculator import calculate_cost
+from cost_report import TextReportWriter
+from create_topology import bill_of_materials as entry_bill_of_materials, build_topology
+from rack_allocator import device_heights
+from topology_files import (
+    bill_of_materials, columns_from_plan, columns_from_topology, export_topology, graph_from_columns, load_topology,
+    main, read_edge_list, topology_from_columns,
+)
+
+CONFIG = {"tree_level": 3, "ports_per_switch": 4, "rack_height": 10, "switch_height": 2}
+
+
+@pytest.fixture(scope="module")
+def columns():
+    return columns_from_topology(build_topology(CONFIG))
+
+
+def assert_same_columns(expected, loaded):
+    assert loaded["size"] == expected["size"]
+    for name, values in expected.items():
+        if name != "size":
+            assert np.array_equal(np.asarray(values), np.asarray(loaded[name])), name
+
+
+@pytest.mark.parametrize("file_name", ["topology.npz", "arrays", "topology.graphml"])
+def test_round_trip(tmp_path, columns, file_name):
+    path = str(tmp_path / file_name)
+    export_topology(columns, path)
+    assert_same_columns(columns, load_topology(path))
+
+
+def test_netbox_csv_round_trip(tmp_path, columns):
+    # the import goes through the object model, the devices come back in the same order and at the same cost
+    path = str(tmp_path / "csv")
+    export_topology(columns, path, "netbox_csv")
+    loaded = load_topology(path)
+    assert loaded["device_name"].tolist() == columns["device_name"].tolist()
+    assert bill_of_materials(loaded) == bill_of_materials(columns)
+
+
+def test_edge_list_round_trip(tmp_path, columns):
+    path = str(tmp_path / "topology.edgelist")
+    export_topology(columns, path)
+    links = read_edge_list(path)
+    names = links["device_name"]
+    assert names[links["cable_a_device"]].tolist() == columns["device_name"][columns["cable_a_device"]].tolist()
+    assert names[links["cable_b_device"]].tolist() == columns["device_name"][columns["cable_b_device"]].tolist()
+    assert np.array_equal(links["cable_length"], columns["cable_length"])
+    with pytest.raises(ValueError):
+        load_topology(path)
+
+
+def test_main_rejects_loading_an_edge_list(tmp_path, monkeypatch, columns):
+    path = str(tmp_path / "topology.edgelist")
+    export_topology(columns, path)
+    monkeypatch.setattr("sys.argv", ["topology_files.py", "--load", path])
+    with pytest.raises(SystemExit) as error:
+        main()
+    assert error.value.code == 2
+
+
+def test_main_prints_load_errors(tmp_path, monkeypatch, capsys):
+    # the price and distance files would replace the values of the other tests
+    monkeypatch.setattr("topology_files.loadPrices", lambda: None)
+    monkeypatch.setattr("topology_files.loadDistances", lambda: None)
+    monkeypatch.setattr("sys.argv", ["topology_files.py", "--load", str(tmp_path / "missing.npz")])
+    with pytest.raises(SystemExit) as error:
+        main()
+    assert error.value.code == 1
+    assert "missing.npz" in capsys.readouterr().out
+
+
+def test_loaded_columns_rebuild_the_topology(tmp_path, columns):
+    path = str(tmp_path / "topology.npz")
+    export_topology(columns, path)
+    loaded = load_topology(path)
+    topology = build_topology(CONFIG)
+    assert [device.name for device in topology_from_columns(loaded).devices()] == \
+        [device.name for device in topology.devices()]
+    assert analyze(graph_from_columns(loaded)) == analyze(from_topology(topology))
+
+
+def test_plan_columns_have_the_cost_of_the_object_model(columns):
+    assert bill_of_materials(columns_from_plan(build_cabling_plan(CONFIG))) == bill_of_materials(columns)
+
+
+def summary_text(bom):
+    stream = io.StringIO()
+    TextReportWriter(stream).write_summary(bom)
+    return stream.getvalue()
+
+
+@pytest.mark.parametrize("config", [CONFIG, {"tree_level": 2, "ports_per_switch": 4, "rack_height": 42}], ids=str)
+def test_every_representation_prints_the_same_summary(config):
+    # 19399 == 19399.0, so the printed text is compared and not just the dictionaries
+    topology = build_topology(config)
+    heights = device_heights(config)
+    closed_form = calculate_cost(config["tree_level"], config["ports_per_switch"], None, config["rack_height"],
+                                 heights=heights)
+    expected = summary_text(entry_bill_of_materials(topology.cost_table_entities()))
+    assert summary_text(bill_of_materials(columns_from_topology(topology))) == expected
+    assert summary_text(plan_bill_of_materials(build_cabling_plan(config))) == expected
+    assert summary_text(compact_bill_of_materials(build_compact_topology(config))) == expected
+    assert summary_text(closed_form) == expected
+    assert ".0 " not in expected and ".0m" not in expected
@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+
+from analysis import from_cabling_plan
+from cabling_plan import build_cabling_plan
+from traffic import FlowNetwork, all_to_all_traffic, permutation_traffic, simulate, uniform_traffic
+
+CONFIGS = [
+    {"tree_level": 2, "ports_per_switch": 8, "pod_size": 4, "rack_height": 42},
+    {"tree_level": 3, "ports_per_switch": 4, "rack_height": 42},
+    {"tree_level": 4, "ports_per_switch": 6, "rack_height": 42, "oversubscription": [2, 1, 1]},
+]
+
+
+def tree_graph(config):
+    return from_cabling_plan(build_cabling_plan(config))
+
+
+def level_loads(network):
+    return [(network.up_load[network.link_level == level].sum(), network.down_load[network.link_level == level].sum())
+            for level in range(network.graph.tree_level)]
+
+
+def test_permutation_traffic_has_no_fixed_points():
+    for seed in range(20):
+        source, destination, _ = next(iter(permutation_traffic(9, 1, np.random.default_rng(seed))))
+        assert sorted(destination) == list(range(9))
+        assert not np.any(source == destination)
+
+
+@pytest.mark.parametrize("config", CONFIGS, ids=str)
+def test_hashed_and_split_routing_carry_the_same_layer_loads(config):
+    graph = tree_graph(config)
+    traffic = uniform_traffic(graph.size["host_number"], 4, np.random.default_rng(0))
+    hashed, split = FlowNetwork(graph), FlowNetwork(graph)
+    hashed.route_hashed(traffic, seed=3)
+    split.route_split(traffic)
+    assert np.allclose(level_loads(hashed), level_loads(split))
+
+
+@pytest.mark.parametrize("config", CONFIGS, ids=str)
+def test_hashed_paths_meet_at_one_switch(config):
+    # both sides start at the edge switch of their host and their last uplinks lead to the same switch
+    graph = tree_graph(config)
+    network = FlowNetwork(graph)
+    hosts = graph.size["host_number"]
+    source, destination = np.divmod(np.arange(hosts * hosts), hosts)
+    source, destination = source[source != destination], destination[source != destination]
+
+    top = np.full((len(source), 2), -1)
+    for level, (flows, up_links, down_links) in enumerate(network.hashed_paths(source, destination, seed=7), 1):
+        if level == 1:
+            assert np.array_equal(network.link_lower[up_links], network.host_edge[source[flows]])
+            assert np.array_equal(network.link_lower[down_links], network.host_edge[destination[flows]])
+        top[flows] = np.c_[network.link_upper[up_links], network.link_upper[down_links]]
+    same_edge = network.host_edge[source] == network.host_edge[destination]
+    assert np.all(top[same_edge] == -1)
+    assert np.array_equal(top[~same_edge, 0], top[~same_edge, 1])
+
+
+@pytest.mark.parametrize("config", CONFIGS[:2], ids=str)
+def test_split_all_to_all_loads_every_link_of_a_layer_evenly(config):
+    graph = tree_graph(config)
+    network, summary = simulate(graph, all_to_all_traffic(graph.size["host_number"], 5, chunk_size=3), "split")
+    for level in range(graph.tree_level):
+        loads = network.up_load[network.link_level == level]
+        assert np.allclose(loads, loads[0])
+    # a full bisection tree carries 5 Gbit/s per host on 10 Gbit/s links without throttling any flow
+    assert summary["delivered_gbps"] == pytest.approx(summary["offered_gbps"])
+    assert summary["max_congestion"] <= 1
+
+
+def test_oversubscribed_tree_throttles_hashed_traffic():
+    graph = tree_graph(CONFIGS[2])
+    _, summary = simulate(graph, all_to_all_traffic(graph.size["host_number"], 10), "hash")
+    assert summary["max_congestion"] > 1
+    assert summary["delivered_gbps"] < summary["offered_gbps"]
@@ -0,0 +1,582 @@
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+import xml.etree.ElementTree as ElementTree
+from xml.sax.saxutils import escape, quoteattr
+
+import numpy as np
+
+from cabling_plan import build_cabling_plan
+from compact import CORE, AGGREGATION, EDGE, HOST, LAYER_NAMES, DEVICE_PREFIXES, CABLE_TYPE
+from cost_report import WRITE_BUFFER_SIZE, plain_number, summarize
+from create_topology import (
+    Cable, Device, Interface, Rack, Topology, build_topology, load_config, print_cost_summary,
+)
+from distances import loadDistances
+from prices import Prices, loadPrices
+
+FORMATS = ["npz", "arrays", "graphml", "edgelist", "netbox_csv"]
+# A topology on disk is a set of columns, one row per rack, device, port or cable. Devices are numbered like
+# Topology.devices() lists them (core, aggregation top level first, edge, hosts) and ports are local to their
+# device, so the columns can be used as they are by analysis.NetworkGraph. NetBox ids are -1 for objects that
+# were not provisioned, device_rack and device_position are -1 for unracked devices.
+COLUMNS = {
+    "rack_name": "U", "rack_height": np.int32, "rack_price": np.float64, "rack_id": np.int64,
+    "device_name": "U", "device_layer": np.int8, "device_rack": np.int32, "device_position": np.int32,
+    "device_height": np.int32, "device_price": np.float64, "device_id": np.int64, "port_count": np.int32,
+    "interface_id": np.int64,
+    "cable_a_device": np.int32, "cable_a_port": np.int32, "cable_b_device": np.int32, "cable_b_port": np.int32,
+    "cable_length": np.float64, "cable_price": np.float64, "cable_price_per_meter": np.float64,
+    "cable_type": "U", "cable_id": np.int64,
+}
+# only written when they carry information: interface names that differ from "<device>int<port>" and the
+# row and column of every rack of a placement
+OPTIONAL_COLUMNS = {"interface_name": "U", "rack_coordinates": np.float64}
+# the reference data create_topology.setup_reference_data creates, device types are given by their model
+NETBOX_DEVICE_TYPES = {
+    "switch": {"role": "switch_role", "manufacturer": "cisco", "device_type": "Cisco ASR 9000 Series"},
+    "host": {"role": "host_role", "manufacturer": "Dell", "device_type": "PowerEdge R450 XS"},
+}
+NETBOX_CSV_FILES = ["racks.csv", "devices.csv", "interfaces.csv", "cables.csv"]
+
+
+def missing_id(value):
+    return -1 if value is None else value
+
+
+def columns_from_topology(topology):
+    # the columns of an object model, e.g. the result of build_topology or of inventory.import_inventory
+    layers = [topology.core_switches, topology.aggregation_switches, topology.edge_switches, topology.hosts]
+    devices = [device for layer in layers for device in layer]
+    rack_index = {rack: index for index, rack in enumerate(topology.racks)}
+    device_index = {device: index for index, device in enumerate(devices)}
+    port_index = {interface: port for device in devices for port, interface in enumerate(device.interfaces)}
+    interfaces = [interface for device in devices for interface in device.interfaces]
+    cables = topology.cables
+
+    columns = {
+        "size": topology.size,
+        "rack_name": [rack.name for rack in topology.racks],
+        "rack_height": [rack.height for rack in topology.racks],
+        "rack_price": [rack.price for rack in topology.racks],
+        "rack_id": [missing_id(rack.id) for rack in topology.racks],
+        "device_name": [device.name for device in devices],
+        "device_layer": np.repeat([CORE, AGGREGATION, EDGE, HOST], [len(layer) for layer in layers]),
+        "device_rack": [rack_index.get(device.rack, -1) for device in devices],
+        "device_position": [missing_id(device.position) for device in devices],
+        "device_height": [device.height for device in devices],
+        "device_price": [device.price for device in devices],
+        "device_id": [missing_id(device.id) for device in devices],
+        "port_count": [len(device.interfaces) for device in devices],
+        "interface_id": [missing_id(interface.id) for interface in interfaces],
+        "cable_a_device": [device_index[cable.a_interface.device] for cable in cables],
+        "cable_a_port": [port_index[cable.a_interface] for cable in cables],
+        "cable_b_device": [device_index[cable.b_interface.device] for cable in cables],
+        "cable_b_port": [port_index[cable.b_interface] for cable in cables],
+        "cable_length": [cable.length for cable in cables],
+        "cable_price": [cable.price for cable in cables],
+        "cable_price_per_meter": [cable.pricePerMeter for cable in cables],
+        "cable_type": [cable.cableType for cable in cables],
+        "cable_id": [missing_id(cable.id) for cable in cables],
+    }
+
+    interface_names = [interface.name for interface in interfaces]
+    if interface_names != default_interface_names(columns["device_name"], columns["port_count"]).tolist():
+        columns["interface_name"] = interface_names
+    if any(rack.coordinates is not None for rack in topology.racks):
+        columns["rack_coordinates"] = [rack.coordinates or (np.nan, np.nan) for rack in topology.racks]
+    return typed_columns(columns)
+
+
+def columns_from_plan(plan, prices=Prices):
+    # the columns of a cabling_plan.CablingPlan, built with NumPy only so no object is created for any tree size
+    size = plan.size
+    layer_sizes = [size["core_number"], size["aggregation_number"], size["edge_number"], size["host_number"]]
+    device_layer = np.repeat([CORE, AGGREGATION, EDGE, HOST], layer_sizes)
+    device_count = len(device_layer)
+    numbers = np.concatenate([np.arange(1, count + 1) for count in layer_sizes]).astype(str)
+    layer_prices = np.array([prices.switch_price] * 3 + [prices.dell_poweredge_r450_xs])
+    layer_heights = np.array([size["switch_height"]] * 3 + [size["host_height"]])
+
+    return typed_columns({
+        "size": size,
+        "rack_name": np.char.add("rack_", np.arange(plan.rack_count).astype(str)),
+        "rack_height": np.full(plan.rack_count, size["rack_height"]),
+        "rack_price": np.full(plan.rack_count, prices.getRackPriceBasedOnHeight(size["rack_height"])),
+        "rack_id": np.full(plan.rack_count, -1),
+        "device_name": np.char.add(np.array(DEVICE_PREFIXES)[device_layer], numbers),
+        "device_layer": device_layer,
+        "device_rack": plan.device_rack,
+        "device_position": plan.device_position,
+        "device_height": layer_heights[device_layer],
+        "device_price": layer_prices[device_layer],
+        "device_id": np.full(device_count, -1),
+        "port_count": plan.port_count,
+        "interface_id": np.full(int(plan.port_count.sum()), -1),
+        "cable_a_device": plan.a_device,
+        "cable_a_port": plan.a_port,
+        "cable_b_device": plan.b_device,
+        "cable_b_port": plan.b_port,
+        "cable_length": plan.length,
+        "cable_price": plan.price,
+        "cable_price_per_meter": np.full(plan.cable_count, prices.rj45_cat_7),
+        "cable_type": np.full(plan.cable_count, CABLE_TYPE),
+        "cable_id": np.full(plan.cable_count, -1),
+    })
+
+
+def typed_columns(columns):
+    typed = {"size": columns["size"]}
+    for name, dtype in {**COLUMNS, **OPTIONAL_COLUMNS}.items():
+        if name in columns:
+            typed[name] = np.asarray(columns[name], dtype=dtype)
+    return typed
+
+
+def default_interface_names(device_names, port_count):
+    # "<device>int<port>" with 1-based ports, the names create_topology gives interfaces
+    port_count = np.asarray(port_count)
+    ports = np.arange(port_count.sum()) - np.repeat(np.cumsum(port_count) - port_count, port_count) + 1
+    return np.char.add(np.char.add(np.repeat(np.asarray(device_names, dtype=str), port_count), "int"),
+                       ports.astype(str))
+
+
+def interface_names(columns):
+    if "interface_name" in columns:
+        return columns["interface_name"]
+    return default_interface_names(columns["device_name"], columns["port_count"])
+
+
+def optional_id(value):
+    return None if value < 0 else int(value)
+
+
+def topology_from_columns(columns):
+    # the object model for the cost report and everything else that works on a create_topology.Topology
+    size = columns["size"]
+    coordinates = columns.get("rack_coordinates")
+    racks = [
+        Rack(optional_id(rack_id), height, price, name,
+             None if coordinates is None or np.isnan(coordinates[index]).any() else tuple(coordinates[index].tolist()))
+        for index, (name, height, price, rack_id) in enumerate(zip(
+            columns["rack_name"].tolist(), columns["rack_height"].tolist(), columns["rack_price"].tolist(),
+            columns["rack_id"].tolist()))
+    ]
+
+    names = interface_names(columns).tolist()
+    interface_ids = columns["interface_id"].tolist()
+    port_starts = np.r_[0, np.cumsum(columns["port_count"])].tolist()
+    devices = []
+    layers = [[] for _ in LAYER_NAMES]
+    for index, (name, layer, rack, position, height, price, device_id) in enumerate(zip(
+            columns["device_name"].tolist(), columns["device_layer"].tolist(), columns["device_rack"].tolist(),
+            columns["device_position"].tolist(), columns["device_height"].tolist(), columns["device_price"].tolist(),
+            columns["device_id"].tolist())):
+        ports = range(port_starts[index], port_starts[index + 1])
+        interfaces = [Interface(optional_id(interface_ids[port]), name=names[port]) for port in ports]
+        device = Device(optional_id(device_id), interfaces, racks[rack] if rack >= 0 else None, plain_number(price),
+                        name, None if position < 0 else position, "host" if layer == HOST else "switch", height)
+        if device.rack is not None:
+            device.rack.add_device(device)
+        devices.append(device)
+        layers[layer].append(device)
+
+    cables = []
+    for a_device, a_port, b_device, b_port, length, price, price_per_meter, cable_type, cable_id in zip(
+            columns["cable_a_device"].tolist(), columns["cable_a_port"].tolist(), columns["cable_b_device"].tolist(),
+            columns["cable_b_port"].tolist(), columns["cable_length"].tolist(), columns["cable_price"].tolist(),
+            columns["cable_price_per_meter"].tolist(), columns["cable_type"].tolist(), columns["cable_id"].tolist()):
+        a_interface = devices[a_device].interfaces[a_port]
+        b_interface = devices[b_device].interfaces[b_port]
+        a_interface.is_open = False
+        b_interface.is_open = False
+        cables.append(Cable(optional_id(cable_id), cable_type, plain_number(length), price_per_meter, price,
+                            a_interface=a_interface, b_interface=b_interface))
+
+    return Topology(size, racks, layers[CORE], layers[AGGREGATION], layers[EDGE], layers[HOST], cables)
+
+
+def graph_from_columns(columns):
+    # analysis.NetworkGraph straight from the (possibly memory-mapped) columns, without any objects
+    from analysis import NetworkGraph
+
+    if columns["size"].get("down_links") is None:
+        raise ValueError("The topology is not a k-ary n-tree, its paths cannot be analysed")
+    return NetworkGraph(columns["size"], columns["cable_a_device"], columns["cable_b_device"], columns["device_rack"])
+
+
+def bill_of_materials(columns):
+    # same structure as create_topology.bill_of_materials, summed over the columns
+    def group(prices):
+        entry = {"price": prices.sum(), "count": len(prices)}
+        if len(prices):
+            entry["pricePerUnit"] = prices[-1]
+        return entry
+
+    groups = {"racks": group(columns["rack_price"])}
+    for layer, name in enumerate(LAYER_NAMES):
+        groups[name] = group(columns["device_price"][columns["device_layer"] == layer])
+    groups["cables"] = group(columns["cable_price"])
+
+    cable_types = {}
+    for cable_type in dict.fromkeys(columns["cable_type"].tolist()):
+        cables = columns["cable_type"] == cable_type
+        cable_types[cable_type] = {"length": columns["cable_length"][cables].sum(),
+                                   "pricePerMeter": columns["cable_price_per_meter"][cables][-1]}
+
+    if columns["size"]["tree_level"] == 2:
+        groups.pop("aggregation_switches")
+
+    return summarize(groups, cable_types)
+
+
+def save_npz(columns, path):
+    # one uncompressed archive, read back into memory in one go
+    arrays = {name: value for name, value in columns.items() if name != "size"}
+    np.savez(path, size=np.array(json.dumps(columns["size"])), **arrays)
+
+
+def load_npz(path):
+    with np.load(path) as archive:
+        columns = {name: archive[name] for name in archive.files}
+    columns["size"] = json.loads(str(columns["size"]))
+    return columns
+
+
+def save_arrays(columns, directory):
+    # one .npy file per column and size.json, load_arrays maps them into memory without reading them
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, "size.json"), "w") as size_file:
+        json.dump(columns["size"], size_file)
+    for name, value in columns.items():
+        if name != "size":
+            np.save(os.path.join(directory, f"{name}.npy"), value)
+
+
+def load_arrays(directory, mmap=True):
+    with open(os.path.join(directory, "size.json")) as size_file:
+        columns = {"size": json.load(size_file)}
+    for name in {**COLUMNS, **OPTIONAL_COLUMNS}:
+        path = os.path.join(directory, f"{name}.npy")
+        if os.path.exists(path):
+            columns[name] = np.load(path, mmap_mode="r" if mmap else None)
+    return columns
+
+
+GRAPHML_NODE_KEYS = {
+    "layer": "int", "rack": "int", "rack_name": "string", "rack_height": "int", "position": "int",
+    "height": "int", "price": "double", "ports": "int", "netbox_id": "long",
+}
+GRAPHML_EDGE_KEYS = {
+    "a_port": "int", "b_port": "int", "length": "double", "price": "double", "price_per_meter": "double",
+    "type": "string", "netbox_id": "long",
+}
+
+
+def write_graphml(columns, path):
+    # devices are nodes named like the devices, cables are edges; the size is stored on the graph. Racks are
+    # only known through the devices in them, and rack prices follow from their height when the file is loaded
+    node_keys = [("node", name, key_type) for name, key_type in GRAPHML_NODE_KEYS.items()]
+    edge_keys = [("edge", name, key_type) for name, key_type in GRAPHML_EDGE_KEYS.items()]
+    rack_names = columns["rack_name"].tolist()
+    rack_heights = columns["rack_height"].tolist()
+    names = columns["device_name"].tolist()
+
+    with open(path, "w", buffering=WRITE_BUFFER_SIZE) as stream:
+        stream.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                     '<graphml xmlns="http://graphml.graphdrawing.org/xmlns">\n'
+                     '<key id="size" for="graph" attr.name="size" attr.type="string"/>\n')
+        for domain, name, key_type in node_keys + edge_keys:
+            stream.write(f'<key id="{domain}_{name}" for="{domain}" attr.name="{name}" attr.type="{key_type}"/>\n')
+        stream.write(f'<graph edgedefault="undirected">\n<data key="size">{escape(json.dumps(columns["size"]))}'
+                     f'</data>\n')
+
+        for name, layer, rack, position, height, price, ports, device_id in zip(
+                names, columns["device_layer"].tolist(), columns["device_rack"].tolist(),
+                columns["device_position"].tolist(), columns["device_height"].tolist(),
+                columns["device_price"].tolist(), columns["port_count"].tolist(), columns["device_id"].tolist()):
+            stream.write(f'<node id={quoteattr(name)}>' + graphml_data("node", {
+                "layer": layer, "rack": rack, "rack_name": rack_names[rack] if rack >= 0 else "",
+                "rack_height": rack_heights[rack] if rack >= 0 else 0, "position": position, "height": height,
+                "price": price, "ports": ports, "netbox_id": device_id,
+            }) + "</node>\n")
+
+        for a_device, a_port, b_device, b_port, length, price, price_per_meter, cable_type, cable_id in zip(
+                columns["cable_a_device"].tolist(), columns["cable_a_port"].tolist(),
+                columns["cable_b_device"].tolist(), columns["cable_b_port"].tolist(),
+                columns["cable_length"].tolist(), columns["cable_price"].tolist(),
+                columns["cable_price_per_meter"].tolist(), columns["cable_type"].tolist(),
+                columns["cable_id"].tolist()):
+            stream.write(f'<edge source={quoteattr(names[a_device])} target={quoteattr(names[b_device])}>' +
+                         graphml_data("edge", {
+                             "a_port": a_port, "b_port": b_port, "length": length, "price": price,
+                             "price_per_meter": price_per_meter, "type": cable_type, "netbox_id": cable_id,
+                         }) + "</edge>\n")
+        stream.write("</graph>\n</graphml>\n")
+
+
+def graphml_data(domain, values):
+    return "".join(f'<data key="{domain}_{name}">{escape(str(value))}</data>' for name, value in values.items())
+
+
+def read_graphml(path):
+    # the columns of a file written by write_graphml, elements are parsed one at a time and then dropped
+    namespace = "{http://graphml.graphdrawing.org/xmlns}"
+    size = None
+    nodes, edges, racks = [], [], {}
+    for _, element in ElementTree.iterparse(path):
+        tag = element.tag[len(namespace):]
+        if tag == "data" and element.get("key") == "size":
+            size = json.loads(element.text)
+        elif tag in ("node", "edge"):
+            data = {child.get("key")[len(tag) + 1:]: child.text or "" for child in element}
+            if tag == "node":
+                nodes.append((element.get("id"), data))
+                if int(data["rack"]) >= 0:
+                    racks[int(data["rack"])] = (data["rack_name"], int(data["rack_height"]))
+            else:
+                edges.append((element.get("source"), element.get("target"), data))
+            element.clear()
+
+    if size is None:
+        raise ValueError(f"{path} has no topology size, it was not written by write_graphml")
+    if sorted(racks) != list(range(len(racks))):
+        raise ValueError(f"{path} lists devices in {len(racks)} racks that are not numbered from 0")
+
+    device_index = {name: index for index, (name, _) in enumerate(nodes)}
+    port_count = [int(data["ports"]) for _, data in nodes]
+    rack_heights = [racks[rack][1] for rack in range(len(racks))]
+    return typed_columns({
+        "size": size,
+        "rack_name": [racks[rack][0] for rack in range(len(racks))],
+        "rack_height": rack_heights,
+        "rack_price": [Prices.getRackPriceBasedOnHeight(height) for height in rack_heights],
+        "rack_id": np.full(len(racks), -1),
+        "device_name": [name for name, _ in nodes],
+        "device_layer": [int(data["layer"]) for _, data in nodes],
+        "device_rack": [int(data["rack"]) for _, data in nodes],
+        "device_position": [int(data["position"]) for _, data in nodes],
+        "device_height": [int(data["height"]) for _, data in nodes],
+        "device_price": [float(data["price"]) for _, data in nodes],
+        "device_id": [int(data["netbox_id"]) for _, data in nodes],
+        "port_count": port_count,
+        "interface_id": np.full(sum(port_count), -1),
+        "cable_a_device": [device_index[source] for source, _, _ in edges],
+        "cable_a_port": [int(data["a_port"]) for _, _, data in edges],
+        "cable_b_device": [device_index[target] for _, target, _ in edges],
+        "cable_b_port": [int(data["b_port"]) for _, _, data in edges],
+        "cable_length": [float(data["length"]) for _, _, data in edges],
+        "cable_price": [float(data["price"]) for _, _, data in edges],
+        "cable_price_per_meter": [float(data["price_per_meter"]) for _, _, data in edges],
+        "cable_type": [data["type"] for _, _, data in edges],
+        "cable_id": [int(data["netbox_id"]) for _, _, data in edges],
+    })
+
+
+def write_edge_list(columns, path):
+    # "<a device> <b device> <length> <price>" per cable, e.g. for networkx.read_edgelist with
+    # data=(("length", float), ("price", float)); device names must not contain whitespace
+    names = columns["device_name"]
+    with open(path, "w", buffering=WRITE_BUFFER_SIZE) as stream:
+        stream.write("# a_device b_device length price\n")
+        for a_name, b_name, length, price in zip(names[columns["cable_a_device"]].tolist(),
+                                                 names[columns["cable_b_device"]].tolist(),
+                                                 columns["cable_length"].tolist(), columns["cable_price"].tolist()):
+            stream.write(f"{a_name} {b_name} {length} {price}\n")
+
+
+def read_edge_list(path):
+    # an edge list only holds the links: the device names and, for every cable, the numbers of both devices
+    # (in the order they first appear), its length and its price
+    device_index = {}
+    a_device, b_device, length, price = [], [], [], []
+    with open(path) as stream:
+        for line in stream:
+            if line.startswith("#") or not line.strip():
+                continue
+            a_name, b_name, cable_length, cable_price = line.split()
+            a_device.append(device_index.setdefault(a_name, len(device_index)))
+            b_device.append(device_index.setdefault(b_name, len(device_index)))
+            length.append(float(cable_length))
+            price.append(float(cable_price))
+    return {
+        "device_name": np.array(list(device_index), dtype=str),
+        "cable_a_device": np.array(a_device, dtype=np.int32),
+        "cable_b_device": np.array(b_device, dtype=np.int32),
+        "cable_length": np.array(length),
+        "cable_price": np.array(price),
+    }
+
+
+def write_netbox_csv(columns, directory, site="site"):
+    # racks.csv, devices.csv, interfaces.csv and cables.csv for the bulk import of NetBox, to be uploaded in this
+    # order into a NetBox that has the site, manufacturers, device types and roles of setup_reference_data;
+    # device prices live on the device types and are not part of the files
+    os.makedirs(directory, exist_ok=True)
+    names = columns["device_name"].tolist()
+    rack_names = columns["rack_name"].tolist()
+    device_types = [NETBOX_DEVICE_TYPES["host" if layer == HOST else "switch"]
+                    for layer in columns["device_layer"].tolist()]
+    interfaces = interface_names(columns).tolist()
+    port_starts = np.r_[0, np.cumsum(columns["port_count"])].tolist()
+
+    def write_rows(file_name, header, rows):
+        with open(os.path.join(directory, file_name), "w", buffering=WRITE_BUFFER_SIZE, newline="") as stream:
+            writer = csv.writer(stream)
+            writer.writerow(header)
+            writer.writerows(rows)
+
+    write_rows("racks.csv", ["site", "name", "u_height"],
+               ([site, name, height] for name, height in zip(rack_names, columns["rack_height"].tolist())))
+    write_rows("devices.csv", ["name", "role", "manufacturer", "device_type", "site", "rack", "position", "face"], (
+        [name, device_type["role"], device_type["manufacturer"], device_type["device_type"], site,
+         rack_names[rack] if rack >= 0 else "", position if position >= 0 else "", "front" if position >= 0 else ""]
+        for name, device_type, rack, position in zip(names, device_types, columns["device_rack"].tolist(),
+                                                     columns["device_position"].tolist())
+    ))
+    write_rows("interfaces.csv", ["device", "name", "type"], (
+        [names[device], interfaces[port], "1000base-t"]
+        for device in range(len(names)) for port in range(port_starts[device], port_starts[device + 1])
+    ))
+    write_rows("cables.csv", [
+        "side_a_device", "side_a_type", "side_a_name", "side_b_device", "side_b_type", "side_b_name", "status",
+        "length", "length_unit", "cf_price",
+    ], (
+        [names[a_device], "dcim.interface", interfaces[port_starts[a_device] + a_port], names[b_device],
+         "dcim.interface", interfaces[port_starts[b_device] + b_port], "connected", length, "m", round(price, 2)]
+        for a_device, a_port, b_device, b_port, length, price in zip(
+            columns["cable_a_device"].tolist(), columns["cable_a_port"].tolist(),
+            columns["cable_b_device"].tolist(), columns["cable_b_port"].tolist(),
+            columns["cable_length"].tolist(), columns["cable_price"].tolist())
+    ))
+
+
+def read_netbox_csv(directory):
+    # the files of write_netbox_csv (or of a NetBox export with the same columns) as the API objects
+    # inventory.InventoryImport is built from; the row numbers stand in for NetBox ids
+    from inventory import InventoryImport
+
+    def read_rows(file_name):
+        with open(os.path.join(directory, file_name), newline="") as stream:
+            yield from csv.DictReader(stream)
+
+    inventory = InventoryImport()
+    rack_ids = {}
+    for index, row in enumerate(read_rows("racks.csv")):
+        rack_ids[row["name"]] = index
+        inventory.add_racks([{"id": index, "name": row["name"], "u_height": row["u_height"]}])
+
+    device_ids = {}
+    for index, row in enumerate(read_rows("devices.csv")):
+        device_ids[row["name"]] = index
+        inventory.add_devices([{
+            "id": index, "name": row["name"], "role": {"name": row["role"]}, "device_type": row["device_type"],
+            "rack": rack_ids[row["rack"]] if row["rack"] else None, "position": row["position"] or None,
+        }])
+
+    interface_ids = {}
+    for index, row in enumerate(read_rows("interfaces.csv")):
+        interface_ids[row["device"], row["name"]] = index
+        inventory.add_interfaces([{"id": index, "name": row["name"], "device": device_ids[row["device"]]}])
+
+    for index, row in enumerate(read_rows("cables.csv")):
+        inventory.add_cables([{
+            "id": index,
+            "a_terminations": [{"object_type": row["side_a_type"],
+                                "object_id": interface_ids.get((row["side_a_device"], row["side_a_name"]))}],
+            "b_terminations": [{"object_type": row["side_b_type"],
+                                "object_id": interface_ids.get((row["side_b_device"], row["side_b_name"]))}],
+            "length": row["length"] or None, "length_unit": row["length_unit"],
+            "custom_fields": {"price": row.get("cf_price") or None},
+        }])
+    return inventory.topology()
+
+
+def format_of(path):
+    if path.endswith(".npz"):
+        return "npz"
+    if path.endswith(".graphml"):
+        return "graphml"
+    if path.endswith((".edgelist", ".txt")):
+        return "edgelist"
+    if os.path.isdir(path) and os.path.exists(os.path.join(path, NETBOX_CSV_FILES[0])):
+        return "netbox_csv"
+    return "arrays"
+
+
+def export_topology(columns, path, file_format=None):
+    file_format = file_format or format_of(path)
+    writers = {"npz": save_npz, "arrays": save_arrays, "graphml": write_graphml, "edgelist": write_edge_list,
+               "netbox_csv": write_netbox_csv}
+    if file_format not in writers:
+        raise ValueError(f"Unsupported format: {file_format}")
+    writers[file_format](columns, path)
+
+
+def load_topology(path, file_format=None):
+    # the columns of a file, a NetBox CSV directory is imported through the object model;
+    # an edge list holds only the links and cannot be loaded as a topology
+    file_format = file_format or format_of(path)
+    if file_format == "npz":
+        return load_npz(path)
+    if file_format == "arrays":
+        return load_arrays(path)
+    if file_format == "graphml":
+        return read_graphml(path)
+    if file_format == "netbox_csv":
+        return columns_from_topology(read_netbox_csv(path))
+    if file_format == "edgelist":
+        raise ValueError("An edge list only holds the links, read it with read_edge_list")
+    raise ValueError(f"Unsupported format: {file_format}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export a topology to a file or load one and print its cost")
+    parser.add_argument("--config", default="L2_config.json")
+    parser.add_argument("--output", default=None, help="file (.npz, .graphml, .edgelist) or directory to write")
+    parser.add_argument("--load", default=None, help="file or directory to load instead of building the config")
+    parser.add_argument("--format", choices=FORMATS, default=None,
+                        help="format of --output or --load, follows the extension by default")
+    parser.add_argument("--plan", action="store_true",
+                        help="export the NumPy cabling plan instead of the object model, for very large trees")
+    args = parser.parse_args()
+    if args.load is None and args.output is None:
+        parser.error("--output or --load is required")
+    if args.load is not None and (args.format or format_of(args.load)) == "edgelist":
+        parser.error("--load cannot read an edge list, it only holds the links; export .npz, .graphml, "
+                     "a directory of arrays or netbox_csv to load a topology")
+    loadPrices()
+    loadDistances()
+
+    try:
+        export_or_load(args)
+    except (ValueError, OSError) as error:
+        # e.g. a missing file or an unsupported config, printed like cli.py does
+        print(error)
+        sys.exit(1)
+
+
+def export_or_load(args):
+    start = time.perf_counter()
+    if args.load is not None:
+        columns = load_topology(args.load, args.format)
+        print(f"Loaded {len(columns['device_name'])} devices and {len(columns['cable_length'])} cables in "
+              f"{time.perf_counter() - start:.3f} s")
+        print_cost_summary(bill_of_materials(columns))
+        return
+
+    if args.plan:
+        columns = columns_from_plan(build_cabling_plan(load_config(args.config)))
+    else:
+        columns = columns_from_topology(build_topology(load_config(args.config)))
+    export_topology(columns, args.output, args.format)
+    print(f"Exported {len(columns['device_name'])} devices and {len(columns['cable_length'])} cables to "
+          f"{args.output} in {time.perf_counter() - start:.3f} s")
+    print_cost_summary(bill_of_materials(columns))
+
+
+if __name__ == "__main__":
+    main()
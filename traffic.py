@@ -0,0 +1,349 @@
+import argparse
+import csv
+import math
+import time
+
+import numpy as np
+
+from analysis import LINK_SPEED_GBPS, from_cabling_plan, link_ends, device_name
+from cabling_plan import build_cabling_plan
+from create_topology import load_config
+from fat_tree import parent_index, link_layer_name
+from metrics import percentile, PERCENTILES
+
+PATTERNS = ["uniform", "permutation", "all_to_all", "file"]
+ROUTINGS = ["hash", "split"]
+# source hosts per chunk of all-to-all traffic, bounds the flows held at once
+ALL_TO_ALL_CHUNK = 256
+LINK_COLUMNS = ["link", "layer", "lower", "upper", "up_gbps", "down_gbps", "utilization"]
+
+
+class TrafficMatrix:
+    # Flows between hosts as chunks of (source, destination, demand) NumPy arrays. Hosts are numbered in
+    # create_hosts order from 0 (host_1 is 0) and demands are in Gbit/s. Every iteration asks chunks() for
+    # new chunks, so all-to-all traffic of a large tree never exists as a whole.
+    def __init__(self, chunks, description):
+        self.chunks = chunks
+        self.description = description
+
+    def __iter__(self):
+        return iter(self.chunks())
+
+
+def uniform_traffic(host_count, rate, rng):
+    # every host sends to one other host drawn at random, several hosts may pick the same destination
+    source = np.arange(host_count)
+    destination = (source + rng.integers(1, host_count, host_count)) % host_count
+    demand = np.full(host_count, float(rate))
+    return TrafficMatrix(lambda: [(source, destination, demand)], "uniform")
+
+
+def permutation_traffic(host_count, rate, rng):
+    # every host sends to exactly one host and receives from exactly one, never from itself
+    destination = rng.permutation(host_count)
+    fixed = np.flatnonzero(destination == np.arange(host_count))
+    if len(fixed) > 1:
+        destination[fixed] = np.roll(destination[fixed], 1)
+    elif len(fixed) == 1:
+        other = (fixed[0] + 1 + rng.integers(host_count - 1)) % host_count
+        destination[[fixed[0], other]] = destination[[other, fixed[0]]]
+
+    source = np.arange(host_count)
+    demand = np.full(host_count, float(rate))
+    return TrafficMatrix(lambda: [(source, destination, demand)], "permutation")
+
+
+def all_to_all_traffic(host_count, rate, chunk_size=ALL_TO_ALL_CHUNK):
+    # every host spreads its rate evenly over all other hosts
+    def chunks():
+        demand = rate / (host_count - 1)
+        for start in range(0, host_count, chunk_size):
+            senders = np.arange(start, min(start + chunk_size, host_count))
+            source = np.repeat(senders, host_count - 1)
+            offset = np.tile(np.arange(1, host_count), len(senders))
+            yield source, (source + offset) % host_count, np.full(len(source), demand)
+
+    return TrafficMatrix(chunks, "all_to_all")
+
+
+def load_traffic(path, host_count):
+    # .npz with source, destination and demand arrays, or CSV with those columns and host numbers or names
+    if path.endswith(".npz"):
+        with np.load(path) as arrays:
+            flows = (arrays["source"].astype(np.int64), arrays["destination"].astype(np.int64),
+                     arrays["demand"].astype(np.float64))
+    else:
+        with open(path, newline="") as traffic_file:
+            rows = list(csv.DictReader(traffic_file))
+        flows = (np.array([host_number(row["source"]) for row in rows], dtype=np.int64),
+                 np.array([host_number(row["destination"]) for row in rows], dtype=np.int64),
+                 np.array([float(row["demand"]) for row in rows]))
+
+    if len(flows[0]) and (min(flows[0].min(), flows[1].min()) < 0 or max(flows[0].max(), flows[1].max()) >= host_count):
+        raise ValueError(f"Traffic of {path} refers to hosts the topology does not have")
+    return TrafficMatrix(lambda: [flows], path)
+
+
+def host_number(value):
+    # "host_3" or 2
+    return int(value[len("host_"):]) - 1 if value.startswith("host_") else int(value)
+
+
+def flow_hash(source, destination, level, seed=0):
+    # splitmix64 of the flow and the level, what a switch hashes to pick one of its equal-cost uplinks
+    with np.errstate(over="ignore"):
+        value = (source.astype(np.uint64) * np.uint64(0x9E3779B97F4A7C15)
+                 ^ destination.astype(np.uint64) * np.uint64(0xC2B2AE3D27D4EB4F)
+                 ^ np.uint64(seed * 0x100 + level))
+        value = (value ^ (value >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        value = (value ^ (value >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        return value ^ (value >> np.uint64(31))
+
+
+class FlowNetwork:
+    # The links of a tree from the point of view of flows: the link of every host, the uplink a switch takes
+    # for every parent choice and the link loads in both directions (up is towards the core).
+    def __init__(self, graph, link_speed=LINK_SPEED_GBPS):
+        self.graph = graph
+        self.link_speed = link_speed
+        self.down, self.up = graph.size["down_links"], graph.size["up_links"]
+        counts = graph.size["level_counts"]
+
+        self.link_level, self.link_lower, self.link_upper = link_ends(graph)
+        host_links = np.flatnonzero(self.link_level == 0)
+        self.host_link = np.empty(counts[0], dtype=np.int64)
+        self.host_link[self.link_lower[host_links]] = host_links
+        self.host_edge = np.empty(counts[0], dtype=np.int64)
+        self.host_edge[self.link_lower[host_links]] = self.link_upper[host_links]
+
+        # the parent a link leads to is the last digit of the parent's number, see fat_tree.parent_index
+        self.uplinks = [None]
+        for level in range(1, graph.tree_level):
+            links = np.flatnonzero(self.link_level == level)
+            uplinks = np.empty((counts[level], self.up[level]), dtype=np.int64)
+            uplinks[self.link_lower[links], self.link_upper[links] % self.up[level]] = links
+            self.uplinks.append(uplinks)
+
+        self.up_load = np.zeros(graph.link_count)
+        self.down_load = np.zeros(graph.link_count)
+
+    def turn_level(self, source_edge, destination_edge):
+        # the lowest level with a common ancestor of both edge switches
+        turn = np.ones(len(source_edge), dtype=np.int64)
+        for level in range(1, self.graph.tree_level):
+            edges_per_subtree = self.subtree_groups(level)[1]
+            turn += source_edge // edges_per_subtree != destination_edge // edges_per_subtree
+        return turn
+
+    def hashed_paths(self, source, destination, seed=0):
+        # the links of every flow above its hosts, level by level: (flows, links up, links down). Both sides
+        # take the same parent choices, which is how an up/down path of a k-ary n-tree meets at the top
+        up_node, down_node = self.host_edge[source], self.host_edge[destination]
+        turn = self.turn_level(up_node, down_node)
+        flows = np.arange(len(source))
+        for level in range(1, self.graph.tree_level):
+            continuing = turn[flows] > level
+            flows, up_node, down_node = flows[continuing], up_node[continuing], down_node[continuing]
+            if not len(flows):
+                break
+
+            choice = (flow_hash(source[flows], destination[flows], level, seed) % np.uint64(self.up[level]))
+            choice = choice.astype(np.int64)
+            yield flows, self.uplinks[level][up_node, choice], self.uplinks[level][down_node, choice]
+            up_node = parent_index(self.down, self.up, level, up_node, choice)
+            down_node = parent_index(self.down, self.up, level, down_node, choice)
+
+    def add_host_loads(self, source, destination, demand):
+        self.up_load += np.bincount(self.host_link[source], weights=demand, minlength=len(self.up_load))
+        self.down_load += np.bincount(self.host_link[destination], weights=demand, minlength=len(self.down_load))
+
+    def route_hashed(self, traffic, seed=0):
+        for source, destination, demand in traffic:
+            self.add_host_loads(source, destination, demand)
+            for flows, up_links, down_links in self.hashed_paths(source, destination, seed):
+                self.up_load += np.bincount(up_links, weights=demand[flows], minlength=len(self.up_load))
+                self.down_load += np.bincount(down_links, weights=demand[flows], minlength=len(self.down_load))
+
+    def subtree_groups(self, level):
+        # the switches of a level that share their subtree, and how many edge switches it holds
+        return math.prod(self.up[1:level]), math.prod(self.down[2:level + 1])
+
+    def route_split(self, traffic):
+        # ideal ECMP: every switch splits a flow evenly over its uplinks, so all uplinks of the switches of a
+        # subtree carry the same share of what leaves or enters it and only the subtree totals are summed
+        tree_level = self.graph.tree_level
+        counts = self.graph.size["level_counts"]
+        leaving = [None] + [np.zeros(counts[1] // self.subtree_groups(level)[1]) for level in range(1, tree_level)]
+        entering = [None] + [np.zeros(len(totals)) for totals in leaving[1:]]
+
+        for source, destination, demand in traffic:
+            self.add_host_loads(source, destination, demand)
+            source_edge, destination_edge = self.host_edge[source], self.host_edge[destination]
+            turn = self.turn_level(source_edge, destination_edge)
+            for level in range(1, tree_level):
+                continuing = turn > level
+                edges_per_subtree = self.subtree_groups(level)[1]
+                leaving[level] += np.bincount(source_edge[continuing] // edges_per_subtree,
+                                              weights=demand[continuing], minlength=len(leaving[level]))
+                entering[level] += np.bincount(destination_edge[continuing] // edges_per_subtree,
+                                               weights=demand[continuing], minlength=len(entering[level]))
+
+        for level in range(1, tree_level):
+            switches_per_subtree = self.subtree_groups(level)[0]
+            links = np.flatnonzero(self.link_level == level)
+            subtree = self.link_lower[links] // switches_per_subtree
+            share = switches_per_subtree * self.up[level]
+            self.up_load[links] += leaving[level][subtree] / share
+            self.down_load[links] += entering[level][subtree] / share
+
+    def utilization(self):
+        # the busier direction of every link
+        return np.maximum(self.up_load, self.down_load) / self.link_speed
+
+    def bottlenecks(self, traffic, routing, seed=0):
+        # the highest directional utilization on the path of every flow, chunk by chunk
+        up_utilization = self.up_load / self.link_speed
+        down_utilization = self.down_load / self.link_speed
+
+        for source, destination, demand in traffic:
+            bottleneck = np.maximum(up_utilization[self.host_link[source]],
+                                    down_utilization[self.host_link[destination]])
+            if routing == "hash":
+                for flows, up_links, down_links in self.hashed_paths(source, destination, seed):
+                    bottleneck[flows] = np.maximum(bottleneck[flows], np.maximum(up_utilization[up_links],
+                                                                                 down_utilization[down_links]))
+            else:
+                source_edge, destination_edge = self.host_edge[source], self.host_edge[destination]
+                turn = self.turn_level(source_edge, destination_edge)
+                for level in range(1, self.graph.tree_level):
+                    flows = np.flatnonzero(turn > level)
+                    # every uplink of a switch carries the same split load, the first one stands for all
+                    up_links = self.uplinks[level][self.subtree_switch(level, source_edge[flows]), 0]
+                    down_links = self.uplinks[level][self.subtree_switch(level, destination_edge[flows]), 0]
+                    bottleneck[flows] = np.maximum(bottleneck[flows], np.maximum(up_utilization[up_links],
+                                                                                 down_utilization[down_links]))
+            yield source, destination, demand, bottleneck
+
+    def subtree_switch(self, level, edge):
+        # the first switch of a level in the subtree of an edge switch
+        switches_per_subtree, edges_per_subtree = self.subtree_groups(level)
+        return edge // edges_per_subtree * switches_per_subtree
+
+
+def simulate(graph, traffic, routing="hash", link_speed=LINK_SPEED_GBPS, seed=0):
+    # flow-level: links are loaded with the full demand of their flows, then every flow gets its demand
+    # scaled down by the most overloaded link on its path
+    network = FlowNetwork(graph, link_speed)
+    if routing == "hash":
+        network.route_hashed(traffic, seed)
+    else:
+        network.route_split(traffic)
+
+    host_count = graph.size["host_number"]
+    offered = np.zeros(host_count)
+    delivered = np.zeros(host_count)
+    flow_count = 0
+    for source, destination, demand, bottleneck in network.bottlenecks(traffic, routing, seed):
+        offered += np.bincount(source, weights=demand, minlength=host_count)
+        delivered += np.bincount(source, weights=demand / np.maximum(bottleneck, 1), minlength=host_count)
+        flow_count += len(source)
+
+    return network, summarize(network, traffic.description, routing, flow_count, offered, delivered)
+
+
+def summarize(network, description, routing, flow_count, offered, delivered):
+    graph = network.graph
+    utilization = network.utilization()
+    layers = {}
+    for level in range(graph.tree_level):
+        links = utilization[network.link_level == level]
+        layers[link_layer_name(graph.tree_level, level + 1)] = {
+            "links": len(links),
+            "mean_utilization": float(links.mean()) if len(links) else 0,
+            "max_utilization": float(links.max()) if len(links) else 0,
+        }
+
+    sending = np.sort(delivered[offered > 0])
+    return {
+        "traffic": description,
+        "routing": routing,
+        "flows": flow_count,
+        "offered_gbps": float(offered.sum()),
+        "delivered_gbps": float(delivered.sum()),
+        "max_congestion": float(utilization.max()) if len(utilization) else 0,
+        "layers": layers,
+        "host_throughput_gbps": {
+            "mean": float(sending.mean()) if len(sending) else 0,
+            "min": float(sending[0]) if len(sending) else 0,
+            **{f"p{percent}": float(percentile(sending.tolist(), percent) or 0) for percent in PERCENTILES},
+        },
+    }
+
+
+def write_link_loads(network, path):
+    graph = network.graph
+    utilization = network.utilization()
+    with open(path, "w", newline="") as output:
+        writer = csv.writer(output)
+        writer.writerow(LINK_COLUMNS)
+        for link in range(graph.link_count):
+            a_device, b_device = graph.a_device[link], graph.b_device[link]
+            lower, upper = sorted([a_device, b_device], key=lambda device: graph.device_level[device])
+            writer.writerow([link, link_layer_name(graph.tree_level, network.link_level[link] + 1),
+                             device_name(graph, lower), device_name(graph, upper), network.up_load[link],
+                             network.down_load[link], utilization[link]])
+
+
+def print_summary(summary):
+    print(f"{summary['traffic']} traffic, {summary['routing']} routing, {summary['flows']} flows")
+    print("=" * 20)
+    for name, layer in summary["layers"].items():
+        print(f"{name}: {layer['links']} links, utilization mean {layer['mean_utilization']:.3f}, "
+              f"max {layer['max_utilization']:.3f}")
+    print("=" * 20)
+    throughput = summary["host_throughput_gbps"]
+    print(f"Max congestion: {summary['max_congestion']:.3f}")
+    print(f"Delivered: {summary['delivered_gbps']:.1f} of {summary['offered_gbps']:.1f} Gbit/s offered")
+    print(f"Throughput per host: mean {throughput['mean']:.3f}, min {throughput['min']:.3f}, "
+          + ", ".join([f"p{percent} {throughput[f'p{percent}']:.3f}" for percent in PERCENTILES]) + " Gbit/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Route a traffic matrix over a fat tree and report link loads")
+    parser.add_argument("--config", default="L2_config.json")
+    parser.add_argument("--pattern", choices=PATTERNS, default="permutation")
+    parser.add_argument("--traffic-file", help="flows of the file pattern, .csv or .npz")
+    parser.add_argument("--rate", type=float, default=LINK_SPEED_GBPS, help="Gbit/s sent by every host")
+    parser.add_argument("--routing", choices=ROUTINGS, default="hash",
+                        help="hash: every flow takes one hashed path, split: flows are split evenly over all paths")
+    parser.add_argument("--link-speed", type=float, default=LINK_SPEED_GBPS, help="Gbit/s of every link")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="CSV file with the load of every link")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    graph = from_cabling_plan(build_cabling_plan(load_config(args.config)))
+    host_count = graph.size["host_number"]
+    rng = np.random.default_rng(args.seed)
+
+    if args.pattern == "file":
+        if args.traffic_file is None:
+            parser.error("the file pattern needs --traffic-file")
+        traffic = load_traffic(args.traffic_file, host_count)
+    elif args.pattern == "uniform":
+        traffic = uniform_traffic(host_count, args.rate, rng)
+    elif args.pattern == "permutation":
+        traffic = permutation_traffic(host_count, args.rate, rng)
+    else:
+        traffic = all_to_all_traffic(host_count, args.rate)
+
+    network, summary = simulate(graph, traffic, args.routing, args.link_speed, args.seed)
+    if args.output:
+        write_link_loads(network, args.output)
+
+    print_summary(summary)
+    print(f"simulated in {time.perf_counter() - start:.3f} s")
+
+
+if __name__ == "__main__":
+    main()